@@ -112,6 +112,18 @@ class Config():
             self._data['OpenTerm'] = {'Term': ''}
             self._data['_version'] = 12
 
+        if self._data['_version'] == 12:
+            self._data['SearchReplace'] = {'WorkerCount': 0}
+            self._data['_version'] = 13
+
+        if self._data['_version'] == 13:
+            self._data['SearchReplace']['UseIndex'] = False
+            self._data['_version'] = 14
+
+        if self._data['_version'] == 14:
+            self._data['SearchReplace']['UseVcsIgnore'] = False
+            self._data['_version'] = 15
+
 
     def _setPlatformDefaults(self):
         """Set default values, which depend on platform
@@ -65,6 +65,7 @@ class Core(QObject):
         self._config = None
         self._uiSettingsManager = None
         self._fileFilter = None
+        self._fileListCache = None
         self._loadedPlugins = []
 
     def _prepareToCatchSigInt(self):
@@ -118,6 +119,10 @@ class Core(QObject):
         self._fileFilter = enki.core.filefilter.FileFilter()
         profiler.stepDone('Create FileFilter')
 
+        import enki.core.filelistcache
+        self._fileListCache = enki.core.filelistcache.FileListCache()
+        profiler.stepDone('Create FileListCache')
+
         import enki.core.locator
         self._locator = enki.core.locator.Locator(self._mainWindow)
         profiler.stepDone('Create Locator')
@@ -133,6 +138,18 @@ class Core(QObject):
 
             profiler.stepDone('  Load %s' % name)
 
+    def initHeadless(self, config, workspace, fileFilter):
+        """Initialize only the core objects, which are used by search and replace threads. The GUI is not created.
+
+        Used by benchmarks. fileFilter shall have regExp() method and regExpChanged signal
+        """
+        self._config = config
+        self._workspace = workspace
+        self._fileFilter = fileFilter
+
+        import enki.core.filelistcache
+        self._fileListCache = enki.core.filelistcache.FileListCache()
+
     def term(self):
         """Terminate plugins and core modules
 
@@ -145,6 +162,9 @@ class Core(QObject):
         if self._locator is not None:
             self._locator.del_()
             self._locator = None
+        if self._fileListCache is not None:
+            self._fileListCache.del_()
+            self._fileListCache = None
         if self._fileFilter is not None:
             self._fileFilter = None
         if self._uiSettingsManager is not None:
@@ -269,6 +289,13 @@ class Core(QObject):
         """
         return self._fileFilter
 
+    def fileListCache(self):
+        """Cached recursive lists of files
+
+        See ::mod:`enki.core.filelistcache`
+        """
+        return self._fileListCache
+
     def locator(self):
         """::class:`enki.core.locator.Locator` instance
 
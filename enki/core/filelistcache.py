@@ -0,0 +1,159 @@
+"""
+filelistcache --- Cached recursive lists of files
+=================================================
+
+Search in directory, Locator and other functionality need recursive list of files in a directory.
+Walking big directory trees takes a lot of time, but the same directories are walked over and over.
+
+This module caches lists of files, built with :mod:`enki.core.filewalker`.
+Lists are keyed by root directory, file name mask, :mod:`enki.core.filefilter` reg exp
+and usage of :mod:`enki.core.vcsignore` rules.
+Walked directories and read ignore files are watched with QFileSystemWatcher. When a file is created, removed
+or renamed, or an ignore file is modified, all lists, which include the path, are dropped.
+Watching starts after the list is built, therefore modification times of the paths are recorded while walking
+and checked, when the watching has started. If a path has been changed in between, the list is dropped.
+
+Instance is accessible as: ::
+
+    from enki.core.core import core
+    core.fileListCache()
+
+Lists may be built and stored from any thread
+"""
+
+import os.path
+import threading
+import collections
+
+from PyQt4.QtCore import pyqtSignal, QFileSystemWatcher, QObject
+
+from enki.core.core import core
+from enki.core import filewalker
+
+
+class FileListCache(QObject):
+    """Module implementation
+    """
+
+    MAX_CACHED_LISTS = 16
+    MAX_WATCHED_PATHS = 8192  # inotify limit is often not much bigger
+
+    _watchRequested = pyqtSignal(tuple, object)  # key, {path: mtime}. Moves QFileSystemWatcher calls to the GUI thread
+
+    def __init__(self):
+        QObject.__init__(self)
+        self._lock = threading.Lock()
+        self._lists = collections.OrderedDict()  # {key: list of files}. The last is the most recently used
+        self._paths = {}  # {key: set of watched directories and files}
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._onPathChanged)
+        self._watcher.fileChanged.connect(self._onPathChanged)
+        self._watchRequested.connect(self._watch)
+        core.fileFilter().regExpChanged.connect(self.clear)
+
+    def del_(self):
+        """Explicitly called destructor
+        """
+        core.fileFilter().regExpChanged.disconnect(self.clear)
+        self.clear()
+
+    @staticmethod
+    def _key(root, mask, vcsIgnore):
+        """Make key for the lists dictionary.
+        mask is a list of fnmatch patterns or None
+        """
+        try:
+            root = os.path.abspath(root)
+        except OSError:  # current dir deleted
+            pass
+        return (root, tuple(mask or ()), core.fileFilter().regExp().pattern, bool(vcsIgnore))
+
+    def files(self, root, mask=None, vcsIgnore=False):
+        """Get cached list of files in the root directory or None, if not cached.
+        mask is a list of fnmatch patterns and vcsIgnore is a flag, used to build the list
+        """
+        key = self._key(root, mask, vcsIgnore)
+        with self._lock:
+            files = self._lists.pop(key, None)
+            if files is not None:
+                self._lists[key] = files  # move to the end, as recently used
+            return files
+
+    def store(self, root, mask, files, watchedPaths, vcsIgnore=False):
+        """Remember list of files.
+        watchedPaths is a dict {path: modification time} of all walked directories and read ignore files,
+        filled by filewalker.iterFiles(). They will be watched.
+        May be called from any thread
+        """
+        if len(watchedPaths) > self.MAX_WATCHED_PATHS:
+            return
+
+        key = self._key(root, mask, vcsIgnore)
+        with self._lock:
+            self._lists[key] = list(files)
+        self._watchRequested.emit(key, dict(watchedPaths))
+
+    def clear(self):
+        """Drop all cached lists
+        """
+        with self._lock:
+            self._lists.clear()
+            self._paths.clear()
+        watched = self._watchedPaths()
+        if watched:
+            self._watcher.removePaths(watched)
+
+    def _watchedPaths(self):
+        """All paths, watched by QFileSystemWatcher
+        """
+        return self._watcher.directories() + self._watcher.files()
+
+    def _watch(self, key, paths):
+        """Start watching directories and files of a list. Called in the GUI thread.
+        paths is {path: modification time when walked}. If a path has been modified before the watching started,
+        the change is not notified, therefore the list is dropped
+        """
+        with self._lock:
+            if not key in self._lists:  # dropped before watching started
+                return
+
+            self._paths[key] = set(paths)
+            while len(self._lists) > self.MAX_CACHED_LISTS:
+                oldKey, oldFiles = self._lists.popitem(last=False)
+                self._paths.pop(oldKey, None)
+
+        self._updateWatchedPaths()
+
+        notWatched = set(paths) - set(self._watchedPaths())
+        changed = [path for path, mtime in paths.iteritems() if filewalker.mtime(path) != mtime]
+        if notWatched or changed:  # failed to watch some paths, or missed changes. The list might be outdated
+            with self._lock:
+                self._lists.pop(key, None)
+                self._paths.pop(key, None)
+
+    def _updateWatchedPaths(self):
+        """Watch paths of all cached lists, and only them
+        """
+        with self._lock:
+            required = set()
+            for paths in self._paths.itervalues():
+                required.update(paths)
+
+        watched = set(self._watchedPaths())
+        toRemove = list(watched - required)
+        toAdd = list(required - watched)
+        if toRemove:
+            self._watcher.removePaths(toRemove)
+        if toAdd:
+            self._watcher.addPaths(toAdd)
+
+    def _onPathChanged(self, path):
+        """QFileSystemWatcher notification. Drop all lists, which include the directory or the ignore file
+        """
+        with self._lock:
+            for key, paths in self._paths.items():
+                if path in paths:
+                    self._lists.pop(key, None)
+                    del self._paths[key]
+
+        self._updateWatchedPaths()
@@ -0,0 +1,89 @@
+"""
+filewalker --- Recursive walking of directories
+===============================================
+
+Search in directory and Locator build lists of files with this module and store them
+to :mod:`enki.core.filelistcache`. Modification times of the walked directories are recorded,
+so the cache can watch them.
+
+Module doesn't depend on Qt
+"""
+
+import os
+import os.path
+
+from enki.core import vcsignore
+
+
+def iterFiles(path, maskRegExp, filterRegExp, watchedPaths=None, isStopped=None, vcsIgnore=False):
+    """Generator. Recursively walks the directory and yields absolute paths of files.
+
+    * maskRegExp is reg exp object for check if file matches mask. None, if all files match
+    * filterRegExp is reg exp object for check if file shall be ignored
+    * watchedPaths is a dict. If not None, walked directories and read ignore files are put to it
+      as {path: modification time}
+    * isStopped is a function. If it returns True, walking is stopped
+    * vcsIgnore is a bool. If True, files and directories, ignored by .gitignore and .hgignore, are skipped
+
+    Hidden files and directories are skipped. Directories and files are walked in sorted order.
+    May raise UnicodeDecodeError, if locale is not set correctly
+    """
+    try:
+        absPath = os.path.abspath(path)
+    except OSError:  # current dir deleted
+        return
+
+    if vcsIgnore:
+        ignore = vcsignore.VcsIgnore(absPath)
+    else:
+        ignore = None
+
+    try:
+        for fileName in _walk(absPath, maskRegExp, filterRegExp, watchedPaths, isStopped, ignore):
+            yield fileName
+    finally:
+        if ignore is not None and watchedPaths is not None:
+            for ignoreFile in ignore.ignoreFiles():
+                watchedPaths[ignoreFile] = mtime(ignoreFile)
+
+
+def mtime(path):
+    """Modification time of the path or None, if it doesn't exist
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _walk(absPath, maskRegExp, filterRegExp, watchedPaths, isStopped, ignore):
+    """iterFiles() implementation
+    """
+    for root, dirs, files in os.walk(absPath, followlinks=True):
+        if root.startswith('.') or (os.path.sep + '.') in root:
+            break
+
+        dirs[:] = sorted([dirName for dirName in dirs \
+                                if not dirName.startswith('.') and \
+                                   (ignore is None or not ignore.isIgnored(os.path.join(root, dirName), True))])
+        if watchedPaths is not None:
+            watchedPaths[root] = mtime(root)  # just after the directory has been listed
+
+        for fileName in sorted(files):
+            if fileName.startswith('.'):
+                continue
+            if maskRegExp and not maskRegExp.match(fileName):
+                continue
+
+            if filterRegExp.match(fileName):
+                continue
+
+            fullPath = os.path.join(root, fileName)
+            if ignore is not None and ignore.isIgnored(fullPath, False):
+                continue
+            if not os.path.isfile(fullPath):
+                continue
+            yield root + os.path.sep + fileName
+
+        if isStopped is not None and isStopped():
+            break
@@ -9,14 +9,14 @@ Contains definition of AbstractCommand and AbstractCompleter interfaces
 
 
 
-from PyQt4.QtCore import pyqtSignal, QAbstractItemModel, QModelIndex, QSize, Qt, QTimer
+from PyQt4.QtCore import pyqtSignal, QAbstractItemModel, QModelIndex, QObject, QSize, Qt, QTimer
 from PyQt4.QtGui import QApplication, QDialog, QFontMetrics, QMessageBox, QPalette, QSizePolicy, \
                         QStyle, QStyleOptionFrameV2, \
                         QTextCursor, QLineEdit, QTextOption, QTreeView, QVBoxLayout
 
+import logging
 import os
 import threading
-import Queue
 
 from enki.core.core import core
 from enki.lib.htmldelegate import HTMLDelegate
@@ -63,6 +63,9 @@ class AbstractCommand:
         """ ::class:`enki.core.locator.AbstractCompleter` instance for partially typed command.
 
         Return None, if your command doesn't have completer, or if completion is not available now
+
+        Called in a background thread. Long running completers shall stop, when
+        :func:`enki.core.locator.isCompletionCancelled` returns True
         """
         return None
 
@@ -133,6 +136,29 @@ class AbstractCompleter:
         return None
 
 
+_currentRequest = threading.local()  # cancelled event and refresh flag of the request, processed by the thread
+
+
+def isCompletionCancelled():
+    """Check if the completer, which is being constructed in the current thread, is not needed anymore,
+    because the user has edited the command.
+
+    Completers, which might work long time, shall check it in the loops and stop.
+    Result of the cancelled completer is discarded. Always False, if called not by the Locator thread
+    """
+    cancelled = getattr(_currentRequest, 'cancelled', None)
+    return cancelled is not None and cancelled.is_set()
+
+
+def isCompletionRefreshRequested():
+    """Check if the completer, which is being constructed in the current thread, has been requested with Tab.
+
+    Completers, which reuse expensive data, i.e. lists of files, which can't be watched, shall drop the data
+    and build it again. Always False, if called not by the Locator thread
+    """
+    return getattr(_currentRequest, 'refresh', False)
+
+
 class _HelpCompleter(AbstractCompleter):
     """AbstractCompleter implementation, which shows help about all or one command
     """
@@ -252,6 +278,10 @@ class _CompletableLineEdit(QLineEdit):
     """
     updateCompletion = pyqtSignal()
 
+    """Tab pressed. Update completion, refresh data, which completers reuse
+    """
+    refreshCompletion = pyqtSignal()
+
     """Enter pressed. Execute command, if complete
     """
     enterPressed = pyqtSignal()
@@ -268,13 +298,15 @@ class _CompletableLineEdit(QLineEdit):
         self._inlineCompletionIsSet = False  # for differentiate inline completion and selection
 
     def event(self, event):
-        """QObject.event implementation. Catches Tab events
+        """QObject.event implementation. Catches Tab events.
+        Tab applies inline completion. If there is no inline completion, completion is refreshed, i.e.
+        not finished glob expansion is continued, and the list of files of a big project is rebuilt
         """
         if event.type() == event.KeyPress and \
            event.key() == Qt.Key_Tab:
             if self.selectedText():
                 self.setCursorPosition(self.selectionStart() + len(self.selectedText()))
-                self.updateCompletion.emit()
+            self.refreshCompletion.emit()
             return True
         else:
             return QLineEdit.event(self, event)
@@ -374,54 +406,118 @@ class _CompletableLineEdit(QLineEdit):
         return text
 
 
+class _CompletionRequest:
+    """Command, for which completer shall be constructed
+    """
+    def __init__(self, command, text, cursorPos, refresh):
+        self.command = command
+        self.text = text
+        self.cursorPos = cursorPos
+        self.refresh = refresh
+        self.cancelled = threading.Event()
+
+
+class _CompleterNotifier(QObject):
+    """Passes constructed completers to the GUI thread.
+    Lives in the GUI thread. The signal is emitted by the thread, queued slots are called by the GUI event loop
+    """
+    completerConstructed = pyqtSignal(object, object)  # request, completer
+
+
 class _CompleterConstructorThread(threading.Thread):
-    """Thread constructs Completer
+    """Thread constructs Completers
     Sometimes it requires a lot of time, i.e. when expanding "/usr/lib/*"
     hlamer: I tried to use QThread + pyqtSignal, but got tired with crashes and deadlocks
+
+    One thread is reused by the Locator. Only the latest request is processed. If the user edits the command
+    while the completer is being constructed, the request is cancelled and the completer is discarded.
+    Completers check isCompletionCancelled() in the long loops and stop working.
+
+    The constructed completer is delivered with a queued signal of a QObject, which lives in the GUI thread,
+    therefore it is applied as soon as it is ready, and the idle Locator doesn't poll the thread
     """
 
     def __init__(self, locator):
         """Works in the GUI thread
         """
         threading.Thread.__init__(self)
+        self.daemon = True
 
         self._locator = locator
-        self._queue = Queue.Queue()
-        self._checkQueueTimer = QTimer()
-        self._checkQueueTimer.setInterval(50)
-        self._checkQueueTimer.timeout.connect(self._checkQueue)
+        self._condition = threading.Condition()
+        self._pendingRequest = None  # not taken by the thread yet
+        self._latestRequest = None  # result of this request shall be applied
+        self._exit = False
+        self._notifier = _CompleterNotifier()
+        self._notifier.completerConstructed.connect(self._onCompleterConstructed, Qt.QueuedConnection)
+
+    def _onCompleterConstructed(self, request, completer):
+        """Thread constructed a completer. Apply it, if the request is still actual
+        Works in the GUI thread
+        """
+        if request is self._latestRequest:
+            self._latestRequest = None
+            self._locator._applyCompleter(request.command, completer, request.text)
 
-    def _checkQueue(self):
-        """Check if thread constructed a completer and put it to the queue
+    def constructCompleter(self, command, text, cursorPos, refresh=False):
+        """Start constructing completer. Previous request is cancelled.
+        refresh is True, if the user has pressed Tab, see isCompletionRefreshRequested()
         Works in the GUI thread
         """
-        if not self._queue.empty():
-            command, completer = self._queue.get()
-            self._locator._applyCompleter(command, completer)
+        self.cancel()
 
-    def start(self, command, text, cursorPos):
-        """Start constructing completer
+        request = _CompletionRequest(command, text, cursorPos, refresh)
+        self._latestRequest = request
+        with self._condition:
+            self._pendingRequest = request
+            self._condition.notify()
+
+    def cancel(self):
+        """Cancel the current request. Completer will not be applied
         Works in the GUI thread
         """
-        self._terminated = False
-        self._command = command
-        self._text = text
-        self._cursorPos = cursorPos
-        self._checkQueueTimer.start()
-        threading.Thread.start(self)
+        if self._latestRequest is not None:
+            self._latestRequest.cancelled.set()
+            self._latestRequest = None
 
     def terminate(self):
-        """Set termination flag
+        """Cancel the current request and stop the thread
         Works in the GUI thread
         """
-        self._checkQueueTimer.stop()
+        self.cancel()
+        with self._condition:
+            self._exit = True
+            self._condition.notify()
 
     def run(self):
         """Thread function
         Works in NEW thread
         """
-        completer = self._command.completer(self._text, self._cursorPos)
-        self._queue.put([self._command, completer])
+        while True:
+            with self._condition:
+                while self._pendingRequest is None and not self._exit:
+                    self._condition.wait()
+                if self._exit:
+                    return
+                request = self._pendingRequest
+                self._pendingRequest = None
+
+            if request.cancelled.is_set():
+                continue
+
+            _currentRequest.cancelled = request.cancelled
+            _currentRequest.refresh = request.refresh
+            try:
+                completer = request.command.completer(request.text, request.cursorPos)
+            except Exception:  # the thread must survive bugs in the commands
+                logging.exception('Failed to construct completer for "%s"' % request.text)
+                completer = None
+            finally:
+                _currentRequest.cancelled = None
+                _currentRequest.refresh = False
+
+            if not request.cancelled.is_set():
+                self._notifier.completerConstructed.emit(request, completer)
 
 
 class Locator(QDialog):
@@ -434,6 +530,7 @@ class Locator(QDialog):
         self._history = ['']
         self._historyIndex = 0
         self._incompleteCommand = None
+        self._completedCommand = None  # (command text, command), which constructed the applied completer
 
         self.setLayout(QVBoxLayout())
         self.layout().setContentsMargins(0, 0, 0, 0)
@@ -451,6 +548,7 @@ class Locator(QDialog):
         self._edit = _CompletableLineEdit(self)
         self.layout().addWidget(self._edit)
         self._edit.updateCompletion.connect(self._updateCompletion)
+        self._edit.refreshCompletion.connect(self._refreshCompletion)
         self._edit.enterPressed.connect(self._onEnterPressed)
         self._edit.historyPrevious.connect(self._onHistoryPrevious)
         self._edit.historyNext.connect(self._onHistoryNext)
@@ -471,8 +569,8 @@ class Locator(QDialog):
         self._loadingTimer.setInterval(200)
         self._loadingTimer.timeout.connect(self._applyLoadingCompleter)
 
-        self._completerConstructorThread = None
-
+        self._completerConstructorThread = _CompleterConstructorThread(self)
+        self._completerConstructorThread.start()
 
     def del_(self):
         """Explicitly called destructor
@@ -480,8 +578,7 @@ class Locator(QDialog):
         core.actionManager().removeAction(self._action)
         core.actionManager().menu("mNavigation").removeAction(self._separator)
 
-        if self._completerConstructorThread is not None:
-            self._completerConstructorThread.terminate()
+        self._completerConstructorThread.terminate()
 
     def _checkPyParsing(self):
         """Check if pyparsing is available.
@@ -522,7 +619,7 @@ class Locator(QDialog):
                     self._onEnterPressed()
                     self._updateCompletion()
 
-    def _updateCompletion(self):
+    def _updateCompletion(self, refresh=False):
         """User edited text or moved cursor. Update inline and TreeView completion
         """
         text = self._edit.commandText()
@@ -530,27 +627,36 @@ class Locator(QDialog):
 
         command = self._parseCommand(text)
         if command is not None:
-            if self._completerConstructorThread is not None:
-                self._completerConstructorThread.terminate()
-            self._completerConstructorThread = _CompleterConstructorThread(self)
-
             self._loadingTimer.start()
-            self._completerConstructorThread.start(command,
-                                                   text,
-                                                   self._edit.cursorPosition())
+            self._completerConstructorThread.constructCompleter(command,
+                                                                text,
+                                                                self._edit.cursorPosition(),
+                                                                refresh)
         else:
+            self._completerConstructorThread.cancel()
             self._applyCompleter(None, _HelpCompleter(self._availableCommands()))
 
+    def _refreshCompletion(self):
+        """User pressed Tab. Update completion and let the completer refresh its data
+        """
+        self._updateCompletion(refresh=True)
+
     def _applyLoadingCompleter(self):
         """Set 'Loading...' message
         """
         self._applyCompleter(None, _StatusCompleter('<i>Loading...</i>'))
 
-    def _applyCompleter(self, command, completer):
-        """Apply completer. Called by _updateCompletion or by thread function when Completer is constructed
+    def _applyCompleter(self, command, completer, text=None):
+        """Apply completer. Called by _updateCompletion or by thread function when Completer is constructed.
+        text is the command text, for which the thread has constructed the completer
         """
         self._loadingTimer.stop()
 
+        if text is not None:
+            self._completedCommand = (text, command)
+        else:
+            self._completedCommand = None
+
         if completer is None:
             completer = _HelpCompleter([command])
 
@@ -566,7 +672,11 @@ class Locator(QDialog):
         """User pressed Enter or clicked item. Execute command, if possible
         """
         text = self._edit.commandText()
-        command = self._parseCommand(text)
+        if self._completedCommand is not None and \
+           self._completedCommand[0] == text:
+            command = self._completedCommand[1]  # reuse data, which the command has built for the completer
+        else:
+            command = self._parseCommand(text)
         if command is not None and command.isReadyToExecute():
             command.execute()
             self._history[-1] = text
@@ -0,0 +1,302 @@
+"""
+vcsignore --- Matching files against .gitignore and .hgignore rules
+===================================================================
+
+Version control systems know which files are generated: build results, dependencies, virtualenvs.
+This module reads ignore files and allows to skip such files and whole directories, when walking
+a directory tree.
+
+Supported:
+
+* ``.gitignore`` files in any directory of a Git repository and ``.git/info/exclude``
+* ``.hgignore`` in the root of a Mercurial repository. ``glob``, ``rootglob`` and ``regexp`` syntaxes
+
+Ignore files are parsed once. Rules of every file are compiled to a few regular expressions.
+
+Module doesn't depend on Qt
+"""
+
+import os
+import os.path
+import re
+
+_GITIGNORE = '.gitignore'
+_HGIGNORE = '.hgignore'
+_REPOSITORY_DIRS = ('.git', '.hg')
+
+
+def _globToRegExp(pattern):
+    """Translate glob pattern to reg exp text.
+    * doesn't match /, ** matches any path
+    """
+    res = []
+    i = 0
+    length = len(pattern)
+    while i < length:
+        char = pattern[i]
+        if pattern.startswith('**/', i):
+            res.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == length:
+            res.append('/.*')
+            i += 3
+        elif pattern.startswith('**', i):
+            res.append('.*')
+            i += 2
+        elif char == '*':
+            res.append('[^/]*')
+            i += 1
+        elif char == '?':
+            res.append('[^/]')
+            i += 1
+        elif char == '[':
+            end = pattern.find(']', i + 2)  # ] right after [ is a part of the class
+            if end == -1:
+                res.append(re.escape(char))
+                i += 1
+            else:
+                charClass = pattern[i + 1:end].replace('\\', '\\\\')
+                if charClass.startswith('!'):
+                    charClass = '^' + charClass[1:]
+                res.append('[%s]' % charClass)
+                i = end + 1
+        elif char == '\\' and i + 1 < length:
+            res.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            res.append(re.escape(char))
+            i += 1
+
+    return ''.join(res)
+
+
+def _readLines(filePath):
+    """Read lines of an ignore file. Returns None, if the file doesn't exist or is not readable
+    """
+    try:
+        with open(filePath, 'rb') as ignoreFile:
+            data = ignoreFile.read()
+    except (IOError, OSError):
+        return None
+
+    return unicode(data, 'utf8', errors='ignore').splitlines()
+
+
+class _GitIgnoreFile:
+    """Compiled rules of one .gitignore file.
+    Rules are applied to paths relative to baseDir
+    """
+    def __init__(self, baseDir, lines):
+        self.prefixLength = len(os.path.join(baseDir, ''))
+        self._groups = self._compile([self._parseLine(line) for line in lines])
+
+    @staticmethod
+    def _parseLine(line):
+        """Parse a line to tuple (negated, dirOnly, reg exp text) or None
+        """
+        if not line or line.startswith('#'):
+            return None
+
+        while line.endswith(' ') and not line.endswith('\\ '):
+            line = line[:-1]
+
+        negated = line.startswith('!')
+        if negated or line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+
+        dirOnly = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            return None
+
+        if '/' in line:  # anchored to the directory of the .gitignore
+            regExp = _globToRegExp(line.lstrip('/'))
+        else:
+            regExp = '(?:.*/)?' + _globToRegExp(line)
+
+        return negated, dirOnly, regExp
+
+    @staticmethod
+    def _compile(rules):
+        """Join neighbour rules of the same kind to one reg exp.
+        Returns list of tuples (negated, dirOnly, compiled reg exp). The last rule is the first in the list
+        """
+        groups = []
+        for rule in reversed(rules):
+            if rule is None:
+                continue
+            negated, dirOnly, regExp = rule
+            if groups and groups[-1][:2] == (negated, dirOnly):
+                groups[-1][2].append(regExp)
+            else:
+                groups.append((negated, dirOnly, [regExp]))
+
+        compiledGroups = []
+        for negated, dirOnly, regExps in groups:
+            pattern = r'(?:%s)\Z' % '|'.join(regExps)
+            try:
+                compiledGroups.append((negated, dirOnly, re.compile(pattern, re.DOTALL)))
+            except re.error:  # invalid pattern. Git ignores it too
+                pass
+
+        return compiledGroups
+
+    def match(self, relPath, isDir):
+        """Check path, relative to baseDir.
+        Returns True if ignored, False if explicitly not ignored, None if no rules match
+        """
+        for negated, dirOnly, regExp in self._groups:
+            if dirOnly and not isDir:
+                continue
+            if regExp.match(relPath):
+                return not negated
+        return None
+
+
+class _HgIgnoreFile:
+    """Compiled rules of .hgignore file. Rules are applied to paths relative to the repository root
+    """
+    _SYNTAXES = {'re': 'regexp', 'regexp': 'regexp', 'glob': 'glob', 'rootglob': 'rootglob'}
+
+    def __init__(self, baseDir, lines):
+        self.prefixLength = len(os.path.join(baseDir, ''))
+        self._regExps = []
+
+        syntax = 'regexp'
+        for line in lines:
+            line = self._stripComment(line).strip()
+            if not line:
+                continue
+
+            if line.startswith('syntax:'):
+                syntax = self._SYNTAXES.get(line[len('syntax:'):].strip(), syntax)
+                continue
+
+            lineSyntax = syntax
+            prefix, sep, rest = line.partition(':')
+            if sep and prefix in self._SYNTAXES:
+                lineSyntax = self._SYNTAXES[prefix]
+                line = rest
+            elif sep and prefix in ('include', 'subinclude', 'path', 'relpath', 'relglob', 'relre'):
+                continue  # not supported
+
+            if lineSyntax == 'regexp':
+                pattern = line
+            elif lineSyntax == 'glob':
+                pattern = '(?:^|/)' + _globToRegExp(line) + r'(?:/|\Z)'
+            else:
+                pattern = '^' + _globToRegExp(line) + r'(?:/|\Z)'
+
+            try:
+                self._regExps.append(re.compile(pattern))
+            except re.error:
+                pass
+
+    @staticmethod
+    def _stripComment(line):
+        """Remove comment. \\# is not a comment
+        """
+        index = line.find('#')
+        while index != -1:
+            if index == 0 or line[index - 1] != '\\':
+                line = line[:index]
+                break
+            index = line.find('#', index + 1)
+        return line.replace('\\#', '#')
+
+    def match(self, relPath, isDir):
+        """Check path, relative to baseDir.
+        Returns True if ignored, None if no rules match
+        """
+        if isDir:  # pattern 'dir/' ignores all files in the directory, therefore the directory may be skipped
+            relPath += '/'
+        for regExp in self._regExps:
+            if regExp.search(relPath):
+                return True
+        return None
+
+
+class VcsIgnore:
+    """Checks if files under the root directory are ignored by version control.
+    Rules of the repository, which contains root, and of all nested repositories are used.
+    If root is not inside a repository, .gitignore files under root are used
+    """
+    def __init__(self, root):
+        self._root = os.path.abspath(root)
+        self._top = self._repositoryRoot(self._root) or self._root
+        self._rules = {}  # {directory: list of ignore files, applicable to entries of the directory}
+        self._ignoreFiles = []
+
+    @staticmethod
+    def _isRepositoryRoot(path):
+        """Check if the directory contains .git or .hg
+        """
+        for name in _REPOSITORY_DIRS:
+            if os.path.exists(os.path.join(path, name)):
+                return True
+        return False
+
+    def _repositoryRoot(self, path):
+        """Find repository root, which contains path. None if not found
+        """
+        while True:
+            if self._isRepositoryRoot(path):
+                return path
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    def _readIgnoreFile(self, cls, filePath, baseDir):
+        """Read and compile an ignore file. Returns None, if it doesn't exist
+        """
+        lines = _readLines(filePath)
+        if lines is None:
+            return None
+        self._ignoreFiles.append(filePath)
+        return cls(baseDir, lines)
+
+    def _rulesForDirectory(self, dirPath):
+        """Get list of ignore files, which apply to entries of the directory.
+        The last item has the highest priority
+        """
+        rules = self._rules.get(dirPath)
+        if rules is not None:
+            return rules
+
+        if dirPath == self._top or \
+           (not dirPath.startswith(self._top)) or \
+           self._isRepositoryRoot(dirPath):  # nested repository. Parent rules don't apply
+            rules = []
+            candidates = ((_GitIgnoreFile, os.path.join(dirPath, '.git', 'info', 'exclude')),
+                          (_HgIgnoreFile, os.path.join(dirPath, _HGIGNORE)),
+                          (_GitIgnoreFile, os.path.join(dirPath, _GITIGNORE)))
+        else:
+            rules = list(self._rulesForDirectory(os.path.dirname(dirPath)))
+            candidates = ((_GitIgnoreFile, os.path.join(dirPath, _GITIGNORE)),)
+
+        for cls, filePath in candidates:
+            ignoreFile = self._readIgnoreFile(cls, filePath, dirPath)
+            if ignoreFile is not None:
+                rules.append(ignoreFile)
+
+        self._rules[dirPath] = rules
+        return rules
+
+    def isIgnored(self, path, isDir):
+        """Check if a file or a directory is ignored.
+        path is an absolute path
+        """
+        for ignoreFile in reversed(self._rulesForDirectory(os.path.dirname(path))):
+            relPath = path[ignoreFile.prefixLength:]
+            if os.path.sep != '/':
+                relPath = relPath.replace(os.path.sep, '/')
+            res = ignoreFile.match(relPath, isDir)
+            if res is not None:
+                return res
+        return False
+
+    def ignoreFiles(self):
+        """List of ignore files, which have been read. Their modification changes the rules
+        """
+        return list(self._ignoreFiles)
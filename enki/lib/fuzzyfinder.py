@@ -0,0 +1,243 @@
+"""
+fuzzyfinder --- Fuzzy search of file paths
+==========================================
+
+Finds paths, which contain typed characters in the same order. i.e. ``wscmd`` finds
+``enki/plugins/workspace_commands.py``. Found paths are ranked, matches in the file name, at the start of words
+and consecutive matches are preferred.
+
+Paths and file names are filtered with reg exps, which are executed by C code, and only the shortest candidates
+are ranked with Python code. Paths are sorted by length, therefore filtering stops, when enough candidates
+are found. For every character the index keeps a bit set of paths and file names, which contain it.
+Only entries, which contain all characters of the query, are checked with the reg exp.
+
+Candidates of the recent queries are remembered together with the position, where filtering has been stopped.
+When the user types the next character, paths, which matched the previous query, are filtered,
+and then filtering is resumed from that position.
+
+Used by the Locator. Module doesn't depend on Qt
+"""
+
+import collections
+import heapq
+import re
+import threading
+
+_WORD_SEPARATORS = '/\\_-. '
+_NOT_ZERO_DIGITS = re.compile('[^0]{1,64}')
+_DIGIT_BITS = dict([('%x' % digit, [bit for bit in range(4) if digit & (8 >> bit)]) for digit in range(16)])
+
+
+def _baseName(path):
+    """Get file name from the path. Both / and \\ are separators
+    """
+    return path[max(path.rfind('/'), path.rfind('\\')) + 1:]
+
+
+def _subsequencePattern(query, excluded):
+    """Make reg exp pattern, which matches text, which contains characters of the query in the same order.
+    excluded is a string of characters, which must not be present in the matched text.
+    The pattern never backtracks, every character is matched with its first occurrence
+    """
+    parts = []
+    for char in query:
+        notChar = re.escape(char) if char not in excluded else ''
+        parts.append('[^%s%s]*%s' % (notChar, re.escape(excluded), re.escape(char)))
+    return ''.join(parts)
+
+
+def _matchPositions(query, lowerPath, start):
+    """Find positions of the query characters in the path, starting from start.
+    Positions at the start of words are preferred, if it is possible to match the rest of the query after them.
+    Returns list of positions or None
+    """
+    # the latest positions, at which query characters may be matched
+    latest = [0] * len(query)
+    end = len(lowerPath)
+    for index in range(len(query) - 1, -1, -1):
+        end = lowerPath.rfind(query[index], start, end)
+        if end == -1:
+            return None
+        latest[index] = end
+
+    positions = []
+    pos = start
+    for index, char in enumerate(query):
+        first = lowerPath.find(char, pos, latest[index] + 1)
+        chosen = first
+        candidate = first
+        while candidate != -1 and candidate != pos:  # the next position is good enough
+            if lowerPath[candidate - 1] in _WORD_SEPARATORS:
+                chosen = candidate
+                break
+            candidate = lowerPath.find(char, candidate + 1, latest[index] + 1)
+        positions.append(chosen)
+        pos = chosen + 1
+
+    return positions
+
+
+def score(query, path):
+    """Rank the path. query shall be in lower case.
+    Returns tuple (score, positions of matched characters) or None, if the path doesn't match.
+    Bigger score is better
+    """
+    lowerPath = path.lower()
+    baseNameStart = len(lowerPath) - len(_baseName(lowerPath))
+    positions = _matchPositions(query, lowerPath, baseNameStart)
+    inBaseName = positions is not None
+    if not inBaseName:
+        positions = _matchPositions(query, lowerPath, 0)
+        if positions is None:
+            return None
+
+    value = 0.
+    if inBaseName:
+        value += 30
+    previous = None
+    for pos in positions:
+        if pos == 0 or \
+           lowerPath[pos - 1] in _WORD_SEPARATORS or \
+           (path[pos].isupper() and path[pos - 1].islower()):  # camelCase
+            value += 10
+        if previous is not None:
+            if pos == previous + 1:
+                value += 5
+            else:
+                value -= min(pos - previous - 1, 10) * 0.5
+        previous = pos
+
+    value -= len(path) * 0.05  # prefer shorter paths
+    return value, positions
+
+
+class FuzzyIndex:
+    """List of paths, which are searched with find().
+    Methods may be called from any thread
+    """
+    MAX_RANKED = 256  # max count of candidates, which are ranked with score()
+    MAX_CANDIDATES = 256  # if more paths match a query, filtering is stopped and resumed for the longer queries
+    MAX_CACHED_QUERIES = 16
+
+    _PATHS = 'paths'
+    _NAMES = 'names'
+
+    def __init__(self, paths):
+        self._paths = sorted(paths, key=len)
+        lowerPaths = [path.lower() for path in self._paths]
+        # Reg exps are executed on the lower case text. Entries are sorted by the path length
+        self._entries = {self._PATHS: lowerPaths,
+                         self._NAMES: map(_baseName, lowerPaths)}
+        self._charBits = dict([(kind, self._makeCharBits(entries)) for kind, entries in self._entries.items()])
+        # {(entries kind, query): (indexes of matching entries, index to resume filtering from or None)}
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._paths)
+
+    @staticmethod
+    def _makeCharBits(entries):
+        """Make {character: bit set of entries, which contain it}.
+        Bit set is a long. The highest bit is always set, the next bits correspond to the entries in the
+        same order, and the lowest bits pad the count of entry bits to a multiple of 4,
+        so every hex digit of the bit set covers 4 entries
+        """
+        padding = '0' * (-len(entries) % 4)
+        charBits = {}
+        for char in set(''.join(entries)):
+            flags = ''.join(['1' if char in entry else '0' for entry in entries])
+            charBits[char] = long('1' + flags + padding, 2)
+        return charBits
+
+    def _candidateBlocks(self, kind, query, start):
+        """Generator. Yields lists of indexes of the entries of the kind starting from start,
+        which contain all characters of the query. Every list covers up to 256 entries
+        """
+        bits = None
+        for char in set(query):
+            charBits = self._charBits[kind].get(char)
+            if charBits is None:
+                return
+            bits = charBits if bits is None else bits & charBits
+
+        hexBits = '%x' % bits
+        for match in _NOT_ZERO_DIGITS.finditer(hexBits, 1 + start // 4):
+            first = (match.start() - 1) * 4
+            block = [first + offset * 4 + bit \
+                        for offset, char in enumerate(match.group(0)) \
+                            for bit in _DIGIT_BITS[char]]
+            if first < start:
+                block = [index for index in block if index >= start]
+            if block:
+                yield block
+
+    def _filter(self, kind, query, isStopped):
+        """Get up to MAX_CANDIDATES indexes of the shortest entries of the kind, which contain the query characters
+        in the same order. Results are cached with the index, from which filtering can be resumed.
+        Entries for the longer queries are searched in the cached list of the previous query,
+        and then after the resume index
+        """
+        previous = []
+        resume = 0
+        with self._lock:
+            for length in range(len(query), 0, -1):
+                cached = self._cache.get((kind, query[:length]))
+                if cached is not None:
+                    found, resume = cached
+                    if length == len(query):
+                        return found
+                    previous = found
+                    break
+
+        entries = self._entries[kind]
+        match = re.compile(_subsequencePattern(query, '')).match
+        found = [index for index in previous if match(entries[index])]
+        if resume is not None:
+            blocks = self._candidateBlocks(kind, query, resume)
+            resume = None
+            for block in blocks:
+                if len(found) == self.MAX_CANDIDATES:
+                    resume = block[0]
+                    break
+                if isStopped is not None and isStopped():
+                    return []
+                matched = [index for index in block if match(entries[index])]
+                room = self.MAX_CANDIDATES - len(found)
+                if len(matched) > room:
+                    found.extend(matched[:room])
+                    resume = matched[room]
+                    break
+                found.extend(matched)
+
+        with self._lock:
+            self._cache[(kind, query)] = (found, resume)
+            while len(self._cache) > self.MAX_CACHED_QUERIES:
+                self._cache.popitem(last=False)
+
+        return found
+
+    def find(self, query, count, isStopped=None):
+        """Find up to count the best matching paths.
+        isStopped is a function. If it returns True, searching is stopped, and the result is not complete.
+        Returns list of tuples (path, positions of matched characters)
+        """
+        query = ''.join(query.lower().split())
+        if not query:
+            return []
+
+        # Rank the shortest paths, which file name contains the query, than the shortest other paths
+        candidates = self._filter(self._NAMES, query, isStopped)[:self.MAX_RANKED]
+        if len(candidates) < self.MAX_RANKED:
+            inName = set(candidates)
+            shortest = self._filter(self._PATHS, query, isStopped)[:self.MAX_RANKED]
+            candidates.extend([index for index in shortest if index not in inName])
+
+        ranked = []
+        for index in candidates:
+            path = self._paths[index]
+            res = score(query, path)
+            if res is not None:
+                ranked.append((res[0], path, res[1]))
+
+        return [(path, positions) for value, path, positions in heapq.nlargest(count, ranked)]
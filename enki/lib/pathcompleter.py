@@ -7,13 +7,30 @@ pathcompleter --- Path completer for Locator
 from PyQt4.QtCore import Qt
 from PyQt4.QtGui import QApplication, QFileSystemModel, QPalette, QStyle
 
+import bisect
+import collections
+import errno
+import fnmatch
 import os
 import os.path
 import glob
+import stat
+import threading
+import time
+
+try:
+    from os import scandir  # python 3.5
+except ImportError:
+    try:
+        from scandir import scandir  # backport package
+    except ImportError:
+        scandir = None
 
 from enki.lib.htmldelegate import htmlEscape
-from enki.core.locator import AbstractCompleter
+from enki.lib import fuzzyfinder
+from enki.core.locator import AbstractCompleter, isCompletionCancelled, isCompletionRefreshRequested
 from enki.core.core import core
+from enki.core import filewalker
 
 def makeSuitableCompleter(text, pos):
     """Returns PathCompleter if text is normal path or GlobCompleter for glob
@@ -50,12 +67,18 @@ class AbstractPathCompleter(AbstractCompleter):
         self._model = None # can't construct in the construtor, must be constructed in GUI thread
 
     @staticmethod
-    def _filterHidden(paths):
+    def _isHidden(path):
+        """Check if the file is hidden or ignored
+        """
+        return os.path.basename(path).startswith('.') or \
+               core.fileFilter().regExp().match(path)
+
+    @classmethod
+    def _filterHidden(cls, paths):
         """Remove hidden and ignored files from the list
         """
         return [path for path in paths \
-                    if not os.path.basename(path).startswith('.') and \
-                        not core.fileFilter().regExp().match(path)]
+                    if not cls._isHidden(path)]
 
     def _classifyRowIndex(self, row):
         """Get list item type and index by it's row
@@ -146,18 +169,88 @@ class AbstractPathCompleter(AbstractCompleter):
     def getFullText(self, row):
         """User clicked a row. Get inline completion for this row
         """
-        row -= 1  # skip current directory
-        path = None
-        if row in range(len(self._dirs)):
-            return self._dirs[row] + '/'
-        else:
-            row -= len(self._dirs)  # skip dirs
-            if row in range(len(self._files)):
-                return self._files[row]
+        rowType, index = self._classifyRowIndex(row)
+        if rowType == self._DIRECTORY:
+            return self._dirs[index] + '/'
+        elif rowType == self._FILE:
+            return self._files[index]
 
         return None
 
 
+class _Listing:
+    """Sorted names of directory entries. Types of entries are taken from scandir(), if available.
+    Otherwise an entry is stat'ed, when its type is requested for the first time
+    """
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.time = time.time()
+        self._isDir = {}
+
+        if scandir is not None:
+            self.names = []
+            for entry in scandir(path):
+                self.names.append(entry.name)
+                try:
+                    self._isDir[entry.name] = entry.is_dir()
+                except OSError:  # broken entry. Will be stat'ed again
+                    pass
+        else:
+            self.names = os.listdir(path)
+
+        self.names.sort()
+
+    def isDir(self, name):
+        """Check if the entry is a directory. Symlinks are followed
+        """
+        try:
+            return self._isDir[name]
+        except KeyError:
+            isDir = os.path.isdir(os.path.join(self.path, name))
+            self._isDir[name] = isDir
+            return isDir
+
+
+class _DirectoryListings:
+    """Cache of directory listings. Shared by all PathCompleter instances.
+    When the user types a file name, every keystroke lists the same directory. A listing is reused,
+    while modification time of the directory is not changed, but not longer than MAX_AGE seconds,
+    because time resolution of some file systems is 1 second
+    """
+    MAX_AGE = 5.
+    MAX_CACHED = 16
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listings = collections.OrderedDict()  # {path: _Listing}, the last used is the last
+
+    def listing(self, path):
+        """Get _Listing of the directory. Raises OSError, if the path is not a directory or can't be listed.
+        May be called from any thread
+        """
+        st = os.stat(path)
+        if not stat.S_ISDIR(st.st_mode):
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+
+        with self._lock:
+            listing = self._listings.pop(path, None)
+        if listing is None or \
+           listing.mtime != st.st_mtime or \
+           time.time() - listing.time > self.MAX_AGE:
+            listing = _Listing(path, st.st_mtime)  # not locked, listing might take long time
+
+        with self._lock:
+            self._listings[path] = listing
+            while len(self._listings) > self.MAX_CACHED:
+                self._listings.popitem(last=False)
+
+        return listing
+
+
+_directoryListings = _DirectoryListings()
+
+
 class PathCompleter(AbstractPathCompleter):
     """Path completer for Locator. Supports globs
 
@@ -185,22 +278,21 @@ class PathCompleter(AbstractPathCompleter):
         if self._path != '/':
             self._path += '/'
 
-        if not os.path.isdir(self._path):
-            self._status = 'No directory %s' % self._path
-            return
-
         try:
-            filesAndDirs = os.listdir(self._path)
+            listing = _directoryListings.listing(self._path)
         except OSError, ex:
-            self._error = unicode(str(ex), 'utf8')
+            if ex.errno in (errno.ENOENT, errno.ENOTDIR):
+                self._status = 'No directory %s' % self._path
+            else:
+                self._error = unicode(str(ex), 'utf8')
             return
 
-        if not filesAndDirs:
+        if not listing.names:
             self._status = 'Empty directory'
             return
 
         # filter matching
-        variants = [path for path in filesAndDirs\
+        variants = [path for path in listing.names \
                         if path.startswith(enterredFile)]
 
         notHiddenVariants = self._filterHidden(variants)
@@ -211,11 +303,11 @@ class PathCompleter(AbstractPathCompleter):
         if notHiddenVariants:
             variants = notHiddenVariants
 
-        variants.sort()
-
         for variant in variants:
+            if isCompletionCancelled():
+                return
             absPath = os.path.join(self._path, variant)
-            if os.path.isdir(absPath):
+            if listing.isDir(variant):
                 self._dirs.append(absPath)
             else:
                 self._files.append(absPath)
@@ -273,24 +365,158 @@ class PathCompleter(AbstractPathCompleter):
                 return ''
 
 
+def _globInDirectory(dirname, pattern):
+    """Get (name, isDir) tuples of the directory entries, which match the pattern. Hidden entries match only
+    patterns, which start with '.', as in the glob module. Cached listings are used
+    """
+    try:
+        listing = _directoryListings.listing(os.path.abspath(dirname or os.curdir))
+    except OSError:
+        return []
+
+    names = listing.names
+    if not pattern.startswith('.'):
+        names = [name for name in names if not name.startswith('.')]
+    return [(name, listing.isDir(name)) for name in fnmatch.filter(names, pattern)]
+
+
+def _iglob(pattern):
+    """Generator. Lazy version of glob.iglob(). Yields (path, isDir) tuples.
+    Yields None after every listed directory, therefore the caller may pause or stop long expansion,
+    even if nothing matches
+    """
+    dirname, basename = os.path.split(pattern)
+    if not glob.has_magic(pattern):
+        if basename:
+            if os.path.lexists(pattern):
+                yield pattern, os.path.isdir(pattern)
+        elif os.path.isdir(dirname):  # patterns ending with a slash match only directories
+            yield pattern, True
+        return
+
+    if dirname and dirname != pattern and glob.has_magic(dirname):
+        dirs = (item if item is None else item[0]
+                for item in _iglob(dirname))
+    else:
+        dirs = [dirname]
+
+    for dirname in dirs:
+        if dirname is None:
+            yield None
+        elif glob.has_magic(basename):
+            entries = _globInDirectory(dirname, basename)
+            yield None
+            for name, isDir in entries:
+                yield os.path.join(dirname, name), isDir
+        elif basename:
+            path = os.path.join(dirname, basename)
+            if os.path.lexists(path):
+                yield path, os.path.isdir(path)
+        elif os.path.isdir(dirname):
+            yield os.path.join(dirname, basename), True
+
+
+class _GlobExpansion:
+    """Paths, which match a glob, found so far. Expansion may be paused and continued later.
+    paths is a sorted list of (path, isDir) tuples. Hidden and ignored files are skipped
+    """
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.paths = []
+        self.started = False
+        self.finished = False
+        self.time = time.time()
+        self._iterator = _iglob(pattern)
+        self._lock = threading.Lock()
+
+    def expand(self, count, timeBudget, maxListedDirs):
+        """Find up to count more paths. Stops, when timeBudget seconds have passed, when maxListedDirs directories
+        have been listed, or when the completion has been cancelled
+        """
+        with self._lock:
+            self.started = True
+            self.time = time.time()
+            deadline = self.time + timeBudget
+            limit = len(self.paths) + count
+            listedDirs = 0
+            while len(self.paths) < limit:
+                try:
+                    item = next(self._iterator)
+                except StopIteration:
+                    self.finished = True
+                    break
+
+                if item is None:  # a directory has been listed
+                    listedDirs += 1
+                    if listedDirs >= maxListedDirs or \
+                       time.time() > deadline or \
+                       isCompletionCancelled():
+                        break
+                elif not AbstractPathCompleter._isHidden(item[0]):
+                    bisect.insort(self.paths, item)
+
+
+class _GlobExpansions:
+    """The last glob expansion. Shared by all GlobCompleter instances.
+    Only not finished expansion is reused, when the same glob is completed again, so the user can continue it
+    with Tab. Finished expansion is never reused, because the directories might have been changed.
+    Not finished expansion is restarted, if it hasn't been used during MAX_AGE seconds
+    """
+    MAX_AGE = 30.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = None
+
+    def expansion(self, pattern):
+        """Get _GlobExpansion of the pattern. May be called from any thread
+        """
+        with self._lock:
+            if self._last is None or \
+               self._last.pattern != pattern or \
+               self._last.finished or \
+               time.time() - self._last.time > self.MAX_AGE:
+                self._last = _GlobExpansion(pattern)
+            return self._last
+
+
+_globExpansions = _GlobExpansions()
+
+
 class GlobCompleter(AbstractPathCompleter):
     """Path completer for Locator. Supports globs, does not support inline completion
 
+    Glob is expanded lazily. At most MAX_SHOWN paths are found at once, and expansion is stopped, when
+    the time or the count of listed directories is over the budget. When the user presses Tab, the not finished
+    expansion of the same glob is continued and more paths are shown
+
     Used by Open command
     """
+    MAX_SHOWN = 256
+    TIME_BUDGET = 0.5
+    MAX_LISTED_DIRS = 1000
+
     def __init__(self, text):
         AbstractPathCompleter.__init__(self, text)
-        variants = glob.iglob(os.path.expanduser(text) + '*')
-        variants = self._filterHidden(variants)
-        variants.sort()
-
-        for path in sorted(variants):
-            if os.path.isdir(path):
+        expansion = _globExpansions.expansion(os.path.expanduser(text) + '*')
+        if not expansion.started or \
+           isCompletionRefreshRequested():
+            expansion.expand(self.MAX_SHOWN, self.TIME_BUDGET, self.MAX_LISTED_DIRS)
+
+        for path, isDir in expansion.paths:
+            if isCompletionCancelled():
+                return
+            if isDir:
                 self._dirs.append(path)
             else:
                 self._files.append(path)
 
-        if not self._dirs and not self._files:
+        if not expansion.finished:
+            if expansion.paths:
+                self._status = '%d+ files. Press Tab to show more' % len(expansion.paths)
+            else:
+                self._status = 'Not finished. Press Tab to continue'
+        elif not self._dirs and not self._files:
             self._status = 'No matching files'
 
     def _formatPath(self, path, isDir):
@@ -302,3 +528,200 @@ class GlobCompleter(AbstractPathCompleter):
         """Get text, which shall be displayed on the header
         """
         return self._originalText
+
+
+class _IndexBuilder(threading.Thread):
+    """Thread, which builds fuzzyfinder.FuzzyIndex of files in a directory.
+    If the list of files is not given, the thread walks the directory and stores the list to the file list cache.
+    The thread is not stopped, when the completion is cancelled, so the completers, which are constructed
+    while the user is typing, wait for the same thread instead of starting the walk again
+    """
+
+    def __init__(self, root, filterRegExp, sourceFiles):
+        threading.Thread.__init__(self, name='Project index')
+        self.daemon = True
+        self.root = root
+        self.filterPattern = filterRegExp.pattern
+        self.sourceFiles = sourceFiles  # None, if the directory is walked
+        self.files = None  # set when finished
+        self.index = None  # set when finished
+        self.unwatched = False  # the list is not kept by the file list cache, because the tree is too big
+        self.finished = threading.Event()
+        self._filterRegExp = filterRegExp
+        self.start()
+
+    def run(self):
+        try:
+            files = self.sourceFiles
+            if files is None:
+                files = self._walk()
+                cachedFiles = core.fileListCache().files(self.root, None, True)
+                self.unwatched = cachedFiles is None
+                files = cachedFiles or files
+            self.files = files
+
+            prefixLength = len(os.path.join(self.root, ''))
+            self.index = fuzzyfinder.FuzzyIndex([path[prefixLength:] for path in files])
+        finally:
+            self.finished.set()
+
+    def _walk(self):
+        """Get list of files in the directory and store it to the file list cache.
+        Files, ignored by .gitignore and .hgignore are skipped
+        """
+        files = []
+        watchedPaths = {}
+        try:
+            for path in filewalker.iterFiles(self.root,
+                                             None,
+                                             self._filterRegExp,
+                                             watchedPaths,
+                                             None,
+                                             True):
+                files.append(path)
+        except UnicodeDecodeError:  # from os.walk()
+            pass
+
+        core.fileListCache().store(self.root, None, files, watchedPaths, True)
+        return files
+
+    def isActual(self, root, filterPattern, files):
+        """Check if the index is built, or is being built, for the root directory.
+        files is the list from the file list cache or None
+        """
+        if root != self.root:
+            return False
+        if files is not None:
+            return files is self.sourceFiles or files is self.files
+        # the list is not in the cache
+        if self.sourceFiles is not None or filterPattern != self.filterPattern:
+            return False
+        if not self.finished.is_set():  # the walk is still running
+            return True
+        return self.unwatched  # otherwise, the tree has been changed and the cache has dropped the list
+
+
+class _ProjectFiles:
+    """Fuzzy index of files in a directory. Shared by all FuzzyPathCompleter instances.
+    List of files is taken from the file list cache, or built by _IndexBuilder and stored to the cache.
+    The cache watches the directories and drops the list, when the tree is changed.
+    Lists of big trees are not kept by the cache, because they can't be watched. Index of such tree is
+    kept until the user refreshes the completion with Tab, or the file filter is changed
+    """
+    WAIT_INTERVAL = 0.02  # how often the completer, which waits for the index, checks if it has been cancelled
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._builder = None  # the last _IndexBuilder
+
+    def index(self, root):
+        """Get fuzzyfinder.FuzzyIndex of files in the root directory. Paths are relative to the root.
+        Takes long time, if the directory has not been walked yet. Called by the Locator thread.
+        Returns None, if the completion has been cancelled while waiting for the index.
+        The index is being built further and is used by the next completers
+        """
+        with self._lock:
+            filterRegExp = core.fileFilter().regExp()
+            files = core.fileListCache().files(root, None, True)
+            builder = self._builder
+            if builder is None or \
+               not builder.isActual(root, filterRegExp.pattern, files) or \
+               (files is None and builder.finished.is_set() and isCompletionRefreshRequested()):
+                builder = self._builder = _IndexBuilder(root, filterRegExp, files)
+
+        while not builder.finished.wait(self.WAIT_INTERVAL):
+            if isCompletionCancelled():
+                return None
+
+        return builder.index
+
+    def readyIndex(self, root):
+        """Get index of files in the root directory, if it has been built and is actual, otherwise None.
+        Doesn't walk the tree and doesn't wait for the thread, which is building the index. Used by the GUI thread
+        """
+        with self._lock:
+            builder = self._builder
+            if builder is None or \
+               not builder.finished.is_set() or \
+               not builder.isActual(root,
+                                    core.fileFilter().regExp().pattern,
+                                    core.fileListCache().files(root, None, True)):
+                return None
+            return builder.index
+
+
+_projectFiles = _ProjectFiles()
+
+
+class FuzzyPathCompleter(AbstractCompleter):
+    """Completer for Locator. Finds files in the current directory and its subdirectories.
+    Characters of the typed text shall be present in the path in the same order, but other characters
+    may be skipped
+
+    Used by Find file command
+    """
+    MAX_SHOWN = 64
+
+    def __init__(self, text, walk=True):
+        """If walk is False, only already built index of files is used, and the tree is never walked.
+        The GUI thread shall construct the completer with walk=False
+        """
+        self._matches = []  # list of tuples (relative path, positions of matched characters)
+        self._status = None
+
+        try:
+            self._root = os.path.abspath(os.path.curdir)
+        except OSError:  # current directory have been deleted
+            self._root = None
+            self._status = 'Current directory has been deleted'
+            return
+
+        if walk:
+            index = _projectFiles.index(self._root)
+        else:
+            index = _projectFiles.readyIndex(self._root)
+        if index is None:  # cancelled or not built yet
+            self._status = 'Loading...'
+            return
+
+        if not text.strip():
+            self._status = '%d files. Type characters of a file name' % len(index)
+            return
+
+        self._matches = index.find(text, self.MAX_SHOWN, isCompletionCancelled)
+        if not self._matches:
+            self._status = 'No matching files'
+
+    def rowCount(self):
+        """Row count in the list of completions. The first row is the current directory or status
+        """
+        return 1 + len(self._matches)
+
+    def text(self, row, column):
+        """Item text in the list of completions.
+        Matched characters are bold
+        """
+        if row == 0:
+            header = htmlEscape(self._root or '')
+            if self._status is not None:
+                header += ' <i>%s</i>' % htmlEscape(self._status)
+            return header
+
+        path, positions = self._matches[row - 1]
+        positions = set(positions)
+        return ''.join(['<b>%s</b>' % htmlEscape(char) if index in positions else htmlEscape(char) \
+                            for index, char in enumerate(path)])
+
+    def getFullText(self, row):
+        """User clicked a row. Get absolute path of the file
+        """
+        if row == 0:
+            return None
+        return os.path.join(self._root, self._matches[row - 1][0])
+
+    def bestMatch(self):
+        """Get absolute path of the best matching file or None
+        """
+        if not self._matches:
+            return None
+        return self.getFullText(1)
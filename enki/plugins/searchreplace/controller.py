@@ -4,15 +4,18 @@ controller --- Main module. Business logic
 
 This module implements S&R plugin functionality. It joins together all other modules
 """
+import bisect
 import re
 import sys
 
-from PyQt4.QtCore import QObject, Qt
+from PyQt4.QtCore import QObject, QPoint, Qt
 from PyQt4.QtGui import QApplication, QAction, QIcon, QMessageBox
 
 
 from enki.core.core import core
 import substitutions
+import incrementalmatcher
+import literalsearch
 
 MODE_FLAG_SEARCH = 0x1
 MODE_FLAG_REPLACE = 0x2
@@ -27,7 +30,8 @@ MODE_REPLACE_DIRECTORY = MODE_FLAG_REPLACE | MODE_FLAG_DIRECTORY
 MODE_SEARCH_OPENED_FILES = MODE_FLAG_SEARCH | MODE_FLAG_FILES
 MODE_REPLACE_OPENED_FILES = MODE_FLAG_REPLACE | MODE_FLAG_FILES
 
-# Too many extra se
+# Only found items in the visible part of the document are highlighted. Too many extra selections are slow,
+# even if all of them are visible, i.e. on a long wrapped line
 MAX_EXTRA_SELECTIONS_COUNT = 256
 
 
@@ -44,10 +48,11 @@ class Controller(QObject):
         self._searchInFileStartPoint = None
         self._searchInFileLastCursorPos = None
 
-        # all matches cache
-        self._cachedRegExp = None
-        self._cachedText = None
-        self._catchedMatches = None
+        # all matches of the current document
+        self._matcher = incrementalmatcher.IncrementalMatcher()
+        # highlighted reg exp and its document. Highlighting is updated, when the document is scrolled
+        self._highlightedRegExp = None
+        self._highlightedQpart = None
 
         self._createActions()
 
@@ -164,6 +169,7 @@ class Controller(QObject):
         self._widget.replaceCheckedStartPressed.connect(self._onReplaceCheckedStartPressed)
         self._widget.replaceCheckedStopPressed.connect(self._onReplaceCheckedStopPressed)
         self._widget.visibilityChanged.connect(self._updateSearchWidgetFoundItemsHighlighting)
+        self._widget.visibilityChanged.connect(self._onWidgetVisibilityChanged)
 
         self._widget.searchRegExpChanged.connect(self._updateFileActionsState)
         self._widget.searchRegExpChanged.connect(self._onRegExpChanged)
@@ -223,17 +229,11 @@ class Controller(QObject):
     #
     # Highlight found items with yellow
     #
-    def _findAllMatches(self, text, regExp):
-        """Find all matces of regExp in text
-        This method caches found items for last text and regExp
+    def _findAllMatches(self, qpart, regExp):
+        """Find all matches of regExp in qpart. Returns list of tuples (start, end)
+        Found items are cached for the last document and regExp and updated, when the document is edited
         """
-        if self._cachedText != text or \
-           self._cachedRegExp != regExp:
-            self._catchedMatches = [match for match in regExp.finditer(text)]
-            self._cachedText = text
-            self._cachedRegExp = regExp
-
-        return self._catchedMatches
+        return self._matcher.matches(qpart, regExp)
 
     def _updateSearchWidgetFoundItemsHighlighting(self):
         document = core.workspace().currentDocument()
@@ -243,52 +243,109 @@ class Controller(QObject):
         if not self._widget.isVisible() or \
            not self._widget.isSearchRegExpValid()[0] or \
            not self._widget.getRegExp().pattern:
-            document.qutepart.setExtraSelections([])
+            self._clearFoundItemsHighlighting(document.qutepart)
+            self._widget.setMatchesCount(None)
             return
 
-        return self._updateFoundItemsHighlighting(self._widget.getRegExp())
+        matchesCount = self._updateFoundItemsHighlighting(self._widget.getRegExp())
+        self._widget.setMatchesCount(matchesCount)
 
     def _updateFoundItemsHighlighting(self, regExp):
         """(Re)highlight found items with yellow color
         Called by _updateSearchWidgetFoundItemsHighlighting and by word search highlighting
+        Only items in the visible part of the document are highlighted. Returns count of all found items
         """
-        document = core.workspace().currentDocument()
+        qpart = core.workspace().currentDocument().qutepart
+        self._setHighlightedQpart(qpart)
+        self._highlightedRegExp = regExp
 
-        matches = self._findAllMatches(document.qutepart.text, regExp)
+        matches = self._findAllMatches(qpart, regExp)
 
-        if len(matches) <= MAX_EXTRA_SELECTIONS_COUNT:
-            selections = [ (match.start(), len(match.group(0))) \
-                                for match in matches]
-        else:
-            selections = []
+        visibleStart, visibleEnd = self._visibleRange(qpart)
+        first = bisect.bisect_left(matches, (visibleStart,))
+        if first > 0 and matches[first - 1][1] > visibleStart:  # starts above, ends in the visible part
+            first -= 1
+        last = min(bisect.bisect_left(matches, (visibleEnd,)),
+                   first + MAX_EXTRA_SELECTIONS_COUNT)
+
+        selections = [ (start, end - start) \
+                            for start, end in matches[first:last]]
+
+        qpart.setExtraSelections(selections)
+        return len(matches)
+
+    def _clearFoundItemsHighlighting(self, qpart):
+        """Remove highlighting of found items
+        """
+        qpart.setExtraSelections([])
+        self._highlightedRegExp = None
+
+    @staticmethod
+    def _visibleRange(qpart):
+        """Get tuple (start, end) of absolute positions of the visible lines
+        """
+        viewport = qpart.viewport()
+        firstBlock = qpart.cursorForPosition(QPoint(0, 0)).block()
+        lastBlock = qpart.cursorForPosition(QPoint(viewport.width(), viewport.height())).block()
+        return firstBlock.position(), lastBlock.position() + lastBlock.length()
 
-        document.qutepart.setExtraSelections(selections)
+    def _setHighlightedQpart(self, qpart):
+        """Watch scrolling of the document, which contains highlighted items
+        """
+        if qpart is self._highlightedQpart:
+            return
+
+        if self._highlightedQpart is not None:
+            scrollBar = self._highlightedQpart.verticalScrollBar()
+            try:
+                scrollBar.valueChanged.disconnect(self._onHighlightedQpartScrolled)
+                scrollBar.rangeChanged.disconnect(self._onHighlightedQpartScrolled)
+            except (TypeError, RuntimeError):  # already deleted
+                pass
+
+        self._highlightedQpart = qpart
+
+        if qpart is not None:
+            qpart.verticalScrollBar().valueChanged.connect(self._onHighlightedQpartScrolled)
+            qpart.verticalScrollBar().rangeChanged.connect(self._onHighlightedQpartScrolled)
+
+    def _onHighlightedQpartScrolled(self, *args):
+        """Document scrolled or resized. Highlight items in the visible part
+        """
+        if self._highlightedRegExp is not None and \
+           core.workspace().currentDocument() is not None and \
+           core.workspace().currentDocument().qutepart is self._highlightedQpart:
+            self._updateFoundItemsHighlighting(self._highlightedRegExp)
+
+    def _onWidgetVisibilityChanged(self, visible):
+        """Search widget has been shown or hidden. Stop updating matches of the document, when it is hidden
+        """
+        if not visible:
+            self._matcher.reset()
 
     def _onCurrentDocumentChanged(self, old, new):
         """Current document changed. Clear highlighted items
         """
         if old is not None:
-            old.qutepart.setExtraSelections([])
+            self._clearFoundItemsHighlighting(old.qutepart)
+        self._setHighlightedQpart(None)
+        self._matcher.reset()
 
-    def _searchInText(self, regExp, text, startPoint, forward):
-        """Search in text and return tuple (nearest match, all matches)
-        (None, None) if not found
+    def _searchInText(self, regExp, qpart, startPoint, forward):
+        """Search in qpart and return tuple (index of the nearest match, all matches)
+        Matches are tuples (start, end). (None, None) if not found
         """
-        matches = self._findAllMatches(text, regExp)
+        matches = self._findAllMatches(qpart, regExp)
         if matches:
             if forward:
-                for match in matches:
-                    if match.start() >= startPoint:
-                        break
-                else:  # wrap, search from start
-                    match = matches[0]
+                index = bisect.bisect_left(matches, (startPoint,))
+                if index == len(matches):  # wrap, search from start
+                    index = 0
             else:  # reverse search
-                for match in matches[::-1]:
-                    if match.start() < startPoint:
-                        break
-                else:  # wrap, search from end
-                    match = matches[-1]
-            return match, matches
+                index = bisect.bisect_left(matches, (startPoint,)) - 1
+                if index < 0:  # wrap, search from end
+                    index = len(matches) - 1
+            return index, matches
         else:
             return None, None
 
@@ -324,7 +381,6 @@ class Controller(QObject):
             return
 
         regExp = re.compile('\\b%s\\b' % re.escape(word))
-        text = document.qutepart.text
 
         # avoid matching word under cursor
         if forward:
@@ -334,11 +390,11 @@ class Controller(QObject):
 
         self._updateFoundItemsHighlighting(regExp)
 
-        match, matches = self._searchInText(regExp, document.qutepart.text, startPoint, forward)
-        if match is not None:
-            document.qutepart.absSelectedPosition = (match.start(), match.start() + len(match.group(0)))
+        index, matches = self._searchInText(regExp, document.qutepart, startPoint, forward)
+        if index is not None:
+            document.qutepart.absSelectedPosition = matches[index]
             core.mainWindow().statusBar().showMessage('Match %d of %d' % \
-                                                      (matches.index(match) + 1, len(matches)), 3000)
+                                                      (index + 1, len(matches)), 3000)
         else:
             core.workspace().currentDocument().qutepart.resetSelection()
 
@@ -414,14 +470,14 @@ class Controller(QObject):
             else:
                 self._searchInFileStartPoint = cursor.selectionStart()
 
-        match, matches = self._searchInText(regExp, qutepart.text, self._searchInFileStartPoint, forward)
-        if match:
-            selectionStart, selectionEnd = match.start(), match.start() + len(match.group(0))
+        index, matches = self._searchInText(regExp, qutepart, self._searchInFileStartPoint, forward)
+        if index is not None:
+            selectionStart, selectionEnd = matches[index]
             qutepart.absSelectedPosition = (selectionStart, selectionEnd)
             self._searchInFileLastCursorPos = selectionEnd
             self._widget.setState(self._widget.Good)  # change background acording to result
             core.mainWindow().statusBar().showMessage('Match %d of %d' % \
-                                                      (matches.index(match) + 1, len(matches)), 3000)
+                                                      (index + 1, len(matches)), 3000)
         else:
             self._widget.setState(self._widget.Bad)
             qutepart.resetSelection()
@@ -442,7 +498,8 @@ class Controller(QObject):
             match = regExp.search(qpart.text, 0)
 
         if match is not None:
-            replaceTextSubed = substitutions.makeSubstitutions(replaceText, match)
+            replaceTextSubed = substitutions.makeSubstitutions(replaceText,
+                                                               substitutions.matchGroups(match))
             qpart.replaceText(match.start(), len(match.group(0)), replaceTextSubed)
             # move cursor to the end of replaced text
             qpart.absCursorPosition = match.start() + len(replaceTextSubed)
@@ -459,10 +516,11 @@ class Controller(QObject):
         qpart = core.workspace().currentDocument().qutepart
         regExp = self._widget.getRegExp()
 
-        matches = self._findAllMatches(qpart.text, regExp)
+        matches = list(literalsearch.optimized(regExp).finditer(qpart.text))
         with qpart:
             for match in matches[::-1]:  # reverse order, because replacement may move indexes
-                replaceTextSubed = substitutions.makeSubstitutions(replaceText, match)
+                replaceTextSubed = substitutions.makeSubstitutions(replaceText,
+                                                                   substitutions.matchGroups(match))
                 qpart.replaceText(match.start(), len(match.group(0)), replaceTextSubed)
 
         core.mainWindow().statusBar().showMessage( self.tr( "%d match(es) replaced." % len(matches) ), 3000 )
@@ -0,0 +1,107 @@
+"""
+fileclasses --- Persistent cache of file kinds for search in directory
+======================================================================
+
+Search must know, if a file is binary, and which encoding a text file uses.
+Detecting it requires opening and reading the file.
+This cache remembers kinds of files (see searchworker.BINARY and searchworker.decodeText()).
+Entries are valid while inode, modification time and size of the file are not changed,
+therefore known binary files are skipped without opening them.
+
+Module doesn't depend on Qt
+"""
+
+import os
+import os.path
+import hashlib
+import cPickle
+
+
+class FileClasses:
+    """Kinds of files in one search root. Stored in cacheDir
+    """
+    _FORMAT_VERSION = 1
+
+    def __init__(self, cacheDir, root):
+        self._cacheDir = cacheDir
+        self._root = root
+        self._filePath = os.path.join(cacheDir,
+                                      hashlib.md5(root.encode('utf8')).hexdigest() + '.classes')
+        self._entries = self._load()  # { file path: (inode, mtime, size, kind) }
+        self._used = set()
+        self._modified = False
+
+    def _load(self):
+        """Load cache from the disk. Returns empty cache if failed
+        """
+        try:
+            with open(self._filePath, 'rb') as cacheFile:
+                version, root, entries = cPickle.load(cacheFile)
+        except (IOError, OSError, EOFError, ValueError, TypeError, cPickle.UnpicklingError):
+            return {}
+
+        if version != self._FORMAT_VERSION or root != self._root:
+            return {}
+
+        return entries
+
+    def save(self):
+        """Save cache to the disk, if it has been modified.
+        Returns error text or None
+        """
+        if not self._modified:
+            return None
+
+        tmpPath = self._filePath + '.tmp'
+        try:
+            if not os.path.isdir(self._cacheDir):
+                os.makedirs(self._cacheDir)
+            with open(tmpPath, 'wb') as cacheFile:
+                cPickle.dump((self._FORMAT_VERSION, self._root, self._entries),
+                             cacheFile,
+                             cPickle.HIGHEST_PROTOCOL)
+            if os.name == 'nt' and os.path.exists(self._filePath):
+                os.remove(self._filePath)
+            os.rename(tmpPath, self._filePath)
+        except (IOError, OSError) as ex:
+            return unicode(str(ex), 'utf8')
+
+        self._modified = False
+        return None
+
+    def lookup(self, fileName):
+        """Get tuple (file key, kind or None).
+        Key is None, if the file doesn't exist. Pass the key to update()
+        """
+        self._used.add(fileName)
+        try:
+            stat = os.stat(fileName)
+        except OSError:
+            return None, None
+
+        key = (stat.st_ino, stat.st_mtime, stat.st_size)
+        entry = self._entries.get(fileName)
+        if entry is not None and entry[:3] == key:
+            return key, entry[3]
+        else:
+            return key, None
+
+    def update(self, fileName, key, kind):
+        """Remember kind of the file. key is returned by lookup()
+        """
+        if key is None or kind is None:
+            return
+
+        entry = key + (kind,)
+        if self._entries.get(fileName) != entry:
+            self._entries[fileName] = entry
+            self._modified = True
+
+    def prune(self):
+        """Remove from the cache all files, which haven't been looked up.
+        Call it after all files of the root have been searched
+        """
+        for fileName in self._entries.keys():
+            if not fileName in self._used:
+                del self._entries[fileName]
+                self._modified = True
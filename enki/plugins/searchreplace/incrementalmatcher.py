@@ -0,0 +1,260 @@
+"""
+incrementalmatcher --- All matches of a reg exp in the current document
+=======================================================================
+
+Found items are highlighted on every edit of the document. Searching the whole text after every key press
+is slow for big files. IncrementalMatcher keeps positions of the matches and updates them, when the document is
+changed. Only lines, touched by the change, are searched again, positions of the matches after the change are shifted.
+Matches are stored in blocks with own offsets, so an edit rebuilds only the touched blocks and shifts offsets
+of the following blocks, not every match.
+
+It is possible only for patterns, which never match or look behind a line end. Other patterns are searched in the
+whole text again, but only when matches are requested
+"""
+
+import bisect
+import sre_constants
+import sre_parse
+import sys
+
+import literalsearch
+
+# Character categories, which contain the line end
+_MULTILINE_CATEGORIES = (sre_constants.CATEGORY_SPACE,
+                         sre_constants.CATEGORY_NOT_DIGIT,
+                         sre_constants.CATEGORY_NOT_WORD,
+                         sre_constants.CATEGORY_LINEBREAK)
+
+_NEW_LINE = ord('\n')
+
+
+def _setContainsNewLine(items):
+    """Check if [] character set of the parsed pattern may contain the line end
+    """
+    for op, arg in items:
+        if op == sre_constants.NEGATE:
+            return True
+        elif op == sre_constants.LITERAL and arg == _NEW_LINE:
+            return True
+        elif op == sre_constants.RANGE and arg[0] <= _NEW_LINE <= arg[1]:
+            return True
+        elif op == sre_constants.CATEGORY and arg in _MULTILINE_CATEGORIES:
+            return True
+    return False
+
+
+def _isLineLocal(items, flags):
+    """Check if parsed pattern never matches and never looks at the line end.
+    Such pattern may be searched in every line separately
+    """
+    for op, arg in items:
+        if op == sre_constants.LITERAL:
+            if arg == _NEW_LINE:
+                return False
+        elif op == sre_constants.NOT_LITERAL:
+            if arg != _NEW_LINE:
+                return False
+        elif op == sre_constants.ANY:
+            if flags & sre_constants.SRE_FLAG_DOTALL:
+                return False
+        elif op == sre_constants.IN:
+            if _setContainsNewLine(arg):
+                return False
+        elif op == sre_constants.AT:
+            if arg in (sre_constants.AT_BEGINNING, sre_constants.AT_END) and \
+               not flags & sre_constants.SRE_FLAG_MULTILINE:
+                return False  # ^ and $ without re.MULTILINE. Match only on the text edges
+            elif arg in (sre_constants.AT_BEGINNING_STRING, sre_constants.AT_END_STRING):
+                return False
+        elif op == sre_constants.BRANCH:
+            for branch in arg[1]:
+                if not _isLineLocal(branch, flags):
+                    return False
+        elif op == sre_constants.SUBPATTERN:
+            if not _isLineLocal(arg[1], flags):
+                return False
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            if not _isLineLocal(arg[2], flags):
+                return False
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if not _isLineLocal(arg[1], flags):
+                return False
+        elif op == sre_constants.GROUPREF_EXISTS:
+            for branch in arg[1:]:
+                if branch is not None and not _isLineLocal(branch, flags):
+                    return False
+        elif op == sre_constants.GROUPREF:
+            pass  # the group itself has been checked
+        else:  # unknown construction
+            return False
+
+    return True
+
+
+def isLineLocal(regExp):
+    """Check if matches of the compiled reg exp never cross the line end, and the reg exp never looks at it
+    """
+    try:
+        parsed = sre_parse.parse(regExp.pattern, regExp.flags)
+    except (sre_constants.error, TypeError, ValueError):
+        return False
+
+    return _isLineLocal(parsed, regExp.flags | parsed.pattern.flags)
+
+
+class _Matches:
+    """Sorted sequence of matches (start, end). Supports len(), indexing, slicing and bisect module.
+    Matches are stored in blocks of at most BLOCK_SIZE items. Positions in a block are relative to its offset
+    """
+    BLOCK_SIZE = 512
+
+    def __init__(self, matches):
+        self._blocks = []  # lists of tuples (start, end), relative to the block offset
+        self._offsets = []  # offset of every block
+        self._firstIndexes = []  # index of the first match of every block in the sequence
+        self._length = 0
+        self.replace(0, 0, matches, 0)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for block, offset in zip(self._blocks, self._offsets):
+            for start, end in block:
+                yield start + offset, end + offset
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[itemIndex] for itemIndex in xrange(*index.indices(self._length))]
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('match index out of range')
+
+        blockIndex = bisect.bisect_right(self._firstIndexes, index) - 1
+        start, end = self._blocks[blockIndex][index - self._firstIndexes[blockIndex]]
+        offset = self._offsets[blockIndex]
+        return start + offset, end + offset
+
+    def _blockIndex(self, index):
+        """Index of the block, which contains the match, or the last block, if index is the length
+        """
+        return max(0, bisect.bisect_right(self._firstIndexes, index) - 1)
+
+    def replace(self, first, after, matches, delta):
+        """Replace matches from the index first to the index after (exclusive) with the list of absolute matches.
+        Matches after the replaced are shifted by delta
+        """
+        if self._blocks:
+            firstBlock = self._blockIndex(first)
+            lastBlock = self._blockIndex(after)
+            base = self._firstIndexes[firstBlock]
+            rebuilt = []
+            for block, offset in zip(self._blocks[firstBlock:lastBlock + 1], self._offsets[firstBlock:lastBlock + 1]):
+                rebuilt.extend([(start + offset, end + offset) for start, end in block])
+            tail = [(start + delta, end + delta) for start, end in rebuilt[after - base:]]
+            rebuilt = rebuilt[:first - base] + matches + tail
+        else:
+            firstBlock = 0
+            lastBlock = -1
+            rebuilt = matches
+
+        newBlocks = [rebuilt[blockStart:blockStart + self.BLOCK_SIZE] \
+                        for blockStart in xrange(0, len(rebuilt), self.BLOCK_SIZE)]
+        self._blocks[firstBlock:lastBlock + 1] = newBlocks
+        self._offsets[firstBlock:lastBlock + 1] = [0] * len(newBlocks)
+        if delta:
+            for blockIndex in xrange(firstBlock + len(newBlocks), len(self._offsets)):
+                self._offsets[blockIndex] += delta
+
+        del self._firstIndexes[firstBlock:]
+        firstIndex = self._firstIndexes[-1] + len(self._blocks[firstBlock - 1]) if firstBlock else 0
+        for block in self._blocks[firstBlock:]:
+            self._firstIndexes.append(firstIndex)
+            firstIndex += len(block)
+        self._length = firstIndex
+
+
+class IncrementalMatcher:
+    """Positions of all matches of a reg exp in a Qutepart document.
+    Updated incrementally, when the document is edited
+    """
+    def __init__(self):
+        self._qpart = None
+        self._regExp = None
+        self._pattern = None  # optimized regExp, see literalsearch.optimized()
+        self._lineLocal = False
+        self._matches = None  # _Matches. None, if the document has been changed and not searched
+        self._length = 0
+
+    def reset(self):
+        """Forget the document and the matches
+        """
+        if self._qpart is not None:
+            try:
+                self._qpart.document().contentsChange.disconnect(self._onContentsChange)
+            except (TypeError, RuntimeError):  # not connected or already deleted
+                pass
+        self._qpart = None
+        self._regExp = None
+        self._matches = None
+
+    def matches(self, qpart, regExp):
+        """Get sorted sequence of tuples (start, end) of all matches of regExp in qpart.
+        It supports len(), indexing, slicing and bisect, and must not be modified
+        """
+        if qpart is not self._qpart:
+            self.reset()
+            self._qpart = qpart
+            qpart.document().contentsChange.connect(self._onContentsChange)
+
+        if regExp != self._regExp:
+            self._regExp = regExp
+            self._pattern = literalsearch.optimized(regExp)
+            self._lineLocal = isLineLocal(regExp)
+            self._matches = None
+
+        if self._matches is None:
+            text = qpart.text
+            self._matches = _Matches([match.span() for match in self._pattern.finditer(text)])
+            self._length = len(text)
+
+        return self._matches
+
+    def _onContentsChange(self, position, charsRemoved, charsAdded):
+        """QTextDocument.contentsChange handler. Update the matches
+        """
+        if self._matches is None:
+            return
+
+        document = self._qpart.document()
+        length = document.characterCount() - 1  # without the last paragraph separator
+        delta = charsAdded - charsRemoved
+        if (not self._lineLocal) or \
+           length != self._length + delta or \
+           position + charsAdded > length:  # Qt reported strange change. Search again
+            self._matches = None
+            return
+
+        self._length = length
+
+        firstBlock = document.findBlock(position)
+        lastBlock = document.findBlock(position + charsAdded)
+        changedStart = firstBlock.position()
+        changedEnd = lastBlock.position() + lastBlock.length() - 1  # the line end is a part of the line
+        oldChangedEnd = changedEnd - delta
+
+        matches = self._matches
+        firstChanged = bisect.bisect_left(matches, (changedStart,))
+        firstAfter = bisect.bisect_right(matches, (oldChangedEnd, sys.maxint))
+
+        changedMatches = []
+        block = firstBlock
+        while block.isValid() and block.position() <= changedEnd:
+            blockPosition = block.position()
+            for match in self._pattern.finditer(block.text()):
+                changedMatches.append((blockPosition + match.start(), blockPosition + match.end()))
+            block = block.next()
+
+        matches.replace(firstChanged, firstAfter, changedMatches, delta)
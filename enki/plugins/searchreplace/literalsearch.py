@@ -0,0 +1,154 @@
+"""
+literalsearch --- Fast search of literal text
+=============================================
+
+Most of searches are not regular expressions, but plain text, escaped by the search widget.
+Such patterns are searched with str.find() and unicode.find(), which use fast Boyer-Moore-Horspool like
+algorithm and don't create match objects for skipped text.
+
+optimized() returns an object, which has the same search interface as a compiled regular expression,
+but finds literal text faster. Module doesn't depend on Qt
+"""
+
+import re
+import sre_constants
+import sre_parse
+import string
+
+# re.IGNORECASE without re.UNICODE ignores case of ASCII letters only. str.lower() depends on the locale,
+# unicode.lower() converts all letters, therefore the text is converted with this table
+_ASCII_LOWER = string.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def literalText(regExp):
+    """Get text, if the compiled reg exp matches only this literal text, otherwise None.
+    Case of ASCII letters shall be ignored, if the reg exp has re.IGNORECASE flag.
+    Returns unicode for unicode patterns and str for str patterns
+    """
+    try:
+        parsed = sre_parse.parse(regExp.pattern, regExp.flags)
+    except (sre_constants.error, TypeError, ValueError):
+        return None
+
+    flags = regExp.flags | parsed.pattern.flags
+    if flags & (re.LOCALE | re.UNICODE):
+        return None  # case of non-ASCII letters might be ignored
+
+    codes = []
+    for op, av in parsed:
+        if op != sre_constants.LITERAL:
+            return None
+        codes.append(av)
+
+    if not codes:
+        return None
+
+    if isinstance(regExp.pattern, unicode):
+        text = u''.join([unichr(code) for code in codes])
+    else:
+        text = ''.join([chr(code) for code in codes])
+
+    return text
+
+
+class _LiteralMatch(object):
+    """Match of literal text. Has the same interface as match object, which is used by Enki
+    """
+    __slots__ = ('string', '_start', '_end')
+
+    def __init__(self, string, start, end):
+        self.string = string
+        self._start = start
+        self._end = end
+
+    def start(self, group=0):  # pylint: disable=W0613
+        return self._start
+
+    def end(self, group=0):  # pylint: disable=W0613
+        return self._end
+
+    def span(self, group=0):  # pylint: disable=W0613
+        return (self._start, self._end)
+
+    def group(self, group=0):  # pylint: disable=W0613
+        return self.string[self._start:self._end]
+
+    def groups(self, default=None):  # pylint: disable=W0613
+        return ()
+
+
+class LiteralPattern:
+    """Compiled reg exp, which matches only literal text.
+    Has the same interface as a compiled reg exp: pattern, flags, search() and finditer()
+    """
+    def __init__(self, regExp, literal):
+        self.pattern = regExp.pattern
+        self.flags = regExp.flags
+        self._regExp = regExp
+        self._ignoreCase = bool(regExp.flags & re.IGNORECASE) and literal.lower() != literal.upper()
+        self._literal = literal
+        if self._ignoreCase:
+            try:
+                self._literal = literal.encode('ascii').translate(_ASCII_LOWER)
+            except UnicodeError:  # not ASCII literal can't be found in ASCII text. Always use the reg exp
+                self._literal = None
+
+    def _haystack(self, text):
+        """Get text, in which the literal is searched, or None, if the reg exp shall be used.
+        If case is ignored, only ASCII texts are searched without the reg exp.
+        The haystack has the same length as the text
+        """
+        if not self._ignoreCase:
+            return text
+
+        if self._literal is None:
+            return None
+
+        if isinstance(text, unicode):
+            try:
+                text = text.encode('ascii')
+            except UnicodeEncodeError:
+                return None
+        elif not isinstance(text, str):  # mmap can't be converted without copying
+            return None
+
+        return text.translate(_ASCII_LOWER)
+
+    def search(self, text, pos=0):
+        """Find the first match. Returns match object or None
+        """
+        haystack = self._haystack(text)
+        if haystack is None:
+            return self._regExp.search(text, pos)
+
+        start = haystack.find(self._literal, pos)
+        if start == -1:
+            return None
+        return _LiteralMatch(text, start, start + len(self._literal))
+
+    def finditer(self, text, pos=0):
+        """Generator. Yields not overlapping matches
+        """
+        haystack = self._haystack(text)
+        if haystack is None:
+            for match in self._regExp.finditer(text, pos):
+                yield match
+            return
+
+        literal = self._literal
+        length = len(literal)
+        find = haystack.find
+        start = find(literal, pos)
+        while start != -1:
+            end = start + length
+            yield _LiteralMatch(text, start, end)
+            start = find(literal, end)
+
+
+def optimized(regExp):
+    """Get LiteralPattern, if the compiled reg exp matches only literal text, otherwise the reg exp itself
+    """
+    literal = literalText(regExp)
+    if literal is None:
+        return regExp
+    return LiteralPattern(regExp, literal)
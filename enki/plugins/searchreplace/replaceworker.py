@@ -0,0 +1,191 @@
+"""
+replaceworker --- Code, executed by replace worker processes
+============================================================
+
+Replace in directory distributes files over a pool of processes.
+New content is written to a temporary file in the same directory, which is renamed to the original name,
+so a crash never leaves a truncated file. Permissions, owner and group of the file are copied.
+Renaming would break hard links and lose extended attributes, i.e. POSIX ACLs and SELinux labels,
+therefore such files, and files which owner can't be copied, are overwritten in place.
+Extended attributes are listed with listxattr() of the C library on Linux and Mac OS X.
+On other platforms it is not known if a file has them, so all files are overwritten in place there.
+
+This module doesn't depend on Qt and Enki core, so a worker process imports it cheaply
+"""
+
+import ctypes
+import errno
+import os
+import os.path
+import stat
+import sys
+import tempfile
+
+import searchworker
+import substitutions
+
+_replaceText = None  # replacement of the current worker process. Set by initWorker()
+
+
+def iterReplacements(content, replaceText, matches):
+    """Generator. Yields tuples (start, end, replacement) in order of positions.
+    matches is a list of tuples (start, end, groups). See substitutions.matchGroups().
+    Matches, which text in the content differs from the found text, are skipped,
+    because the file has been modified after search
+    """
+    hasSubstitutions = '\\' in replaceText
+    for start, end, groups in sorted(matches, key=lambda match: match[0]):
+        if content[start:end] == groups[0]:
+            if hasSubstitutions:
+                yield start, end, substitutions.makeSubstitutions(replaceText, groups)
+            else:
+                yield start, end, replaceText
+
+
+def doReplacements(content, replaceText, matches):
+    """Do replacements in the text. See iterReplacements().
+    New text is built in one pass.
+    Returns tuple (new content, count of not replaced matches)
+    """
+    chunks = []
+    pos = 0
+    for start, end, replacement in iterReplacements(content, replaceText, matches):
+        chunks.append(content[pos:start])
+        chunks.append(replacement)
+        pos = end
+    chunks.append(content[pos:])
+
+    replacedCount = (len(chunks) - 1) // 2
+    return u''.join(chunks), len(matches) - replacedCount
+
+
+def _loadListXattr():
+    """Get function listxattr(path), which calls listxattr() of the C library and returns the size of the list
+    of attribute names. None, if the platform doesn't have it
+    """
+    if not sys.platform.startswith('linux') and sys.platform != 'darwin':
+        return None
+    try:
+        cListXattr = ctypes.CDLL(None, use_errno=True).listxattr
+    except (OSError, AttributeError):
+        return None
+    cListXattr.restype = ctypes.c_ssize_t
+    if sys.platform == 'darwin':  # has an additional options argument
+        cListXattr.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_size_t, ctypes.c_int]
+        return lambda path: cListXattr(path, None, 0, 0)
+    else:
+        cListXattr.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_size_t]
+        return lambda path: cListXattr(path, None, 0)
+
+
+_listXattr = _loadListXattr()
+
+
+def _mayHaveExtendedAttributes(fileName):
+    """Check if the file has extended attributes, i.e. ACLs or SELinux label.
+    True, if it is not known, because the platform or the file can't be checked
+    """
+    if _listXattr is None:
+        return True
+
+    if isinstance(fileName, unicode):
+        fileName = fileName.encode(sys.getfilesystemencoding() or 'utf8')
+    size = _listXattr(fileName)
+    if size == -1:  # False, if the file system doesn't support the attributes
+        return ctypes.get_errno() not in (errno.ENOTSUP, errno.EOPNOTSUPP)
+    return size > 0
+
+
+def _writeInPlace(fileName, data):
+    """Overwrite the file. Hard links, owner and attributes are kept, but a crash might leave a truncated file
+    """
+    with open(fileName, 'wb') as openedFile:
+        openedFile.write(data)
+        openedFile.flush()
+        os.fsync(openedFile.fileno())
+
+
+def _writeAndRename(fileName, fileStat, data):
+    """Write data to a temporary file, copy permissions and owner, and rename it to fileName.
+    Returns False, if the owner can't be copied. The file is not modified in this case
+    """
+    dirName, baseName = os.path.split(fileName)
+    handle, tmpPath = tempfile.mkstemp(prefix='.' + baseName + '.', suffix='.tmp', dir=dirName)
+    try:
+        with os.fdopen(handle, 'wb') as tmpFile:
+            tmpFile.write(data)
+            tmpFile.flush()
+            os.fsync(tmpFile.fileno())
+        os.chmod(tmpPath, stat.S_IMODE(fileStat.st_mode))
+        if hasattr(os, 'chown'):
+            try:
+                os.chown(tmpPath, fileStat.st_uid, fileStat.st_gid)
+            except OSError:  # not permitted to give the file away
+                os.remove(tmpPath)
+                return False
+        os.rename(tmpPath, fileName)
+    except (IOError, OSError):
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+    return True
+
+
+def writeFile(fileName, data):
+    """Replace file content with data. Permissions, owner and group of the file are preserved.
+    The file is replaced with a renamed temporary file, unless it has more than one hard link or might have
+    extended attributes, or its owner can't be copied. Such files are overwritten in place.
+    If fileName is a symbolic link, the target file is replaced.
+    Returns error text or None
+    """
+    fileName = os.path.realpath(fileName)
+    try:
+        fileStat = os.stat(fileName)
+        if fileStat.st_nlink > 1 or \
+           _mayHaveExtendedAttributes(fileName) or \
+           not _writeAndRename(fileName, fileStat, data):
+            _writeInPlace(fileName, data)
+    except (IOError, OSError) as ex:
+        return unicode(str(ex), 'utf8')
+
+    return None
+
+
+def initWorker(replaceText):
+    """Worker process initializer. Stores replacement text
+    """
+    global _replaceText  # pylint: disable=W0603
+    _replaceText = replaceText
+
+
+def replaceInFile(item):
+    """Do replacements in a file and save it.
+    item is tuple (fileName, matches). See doReplacements().
+    Returns tuple (fileName, count of replaced matches, count of not replaced matches,
+    count of written bytes, error text or None)
+    """
+    fileName, matches = item
+    try:
+        with open(fileName, 'rb') as openedFile:
+            data = openedFile.read()
+    except (IOError, OSError) as ex:
+        return fileName, 0, len(matches), 0, u'Error opening file: %s' % unicode(str(ex), 'utf8')
+
+    content, encoding = searchworker.decodeText(data)
+    content, outdatedCount = doReplacements(content, _replaceText, matches)
+    replacedCount = len(matches) - outdatedCount
+    if not replacedCount:
+        return fileName, 0, outdatedCount, 0, None
+
+    try:
+        data = searchworker.encodeText(content, encoding)
+    except UnicodeEncodeError as ex:
+        return fileName, 0, len(matches), 0, \
+               u'Failed to encode file to %s: %s' % (encoding, unicode(str(ex), 'utf8'))
+
+    error = writeFile(fileName, data)
+    if error is not None:
+        return fileName, 0, len(matches), 0, u'Error while saving replaced content: %s' % error
+
+    return fileName, replacedCount, outdatedCount, len(data), None
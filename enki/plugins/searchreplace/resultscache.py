@@ -0,0 +1,105 @@
+"""
+resultscache --- Results of recent searches in directory
+========================================================
+
+The same search is often repeated while navigating the results.
+This module remembers results of the last searches per file, together with the file key
+(inode, modification time and size, see fileclasses.FileClasses.lookup()).
+When the search is repeated, only files, which have been changed, are searched again.
+Cached and shown results share the arrays of coordinates, see searchresultsmodel.FileResults.copy().
+Count of cached matches is limited, the least recently used searches are dropped first.
+
+Cache is kept in memory while Enki is running. Module doesn't depend on Qt
+"""
+
+import collections
+import threading
+
+
+class SearchResults:
+    """Results of one search. Results of a file are valid while the file key is not changed.
+    Created by ResultsCache, which limits count of stored matches
+    """
+    def __init__(self, cache):
+        self._cache = cache
+        self._files = {}  # {file path: (file key, FileResults or None)}
+        self.resultsCount = 0  # count of stored matches
+
+    def lookup(self, fileName, fileKey):
+        """Get tuple (found, FileResults or None).
+        FileResults is None, if nothing has been found in the file.
+        A copy is returned, because the results model modifies the results. Columns are shared with the copy
+        """
+        entry = self._files.get(fileName)
+        if entry is None or \
+           fileKey is None or \
+           entry[0] != fileKey:
+            return False, None
+
+        fileRes = entry[1]
+        if fileRes is not None:
+            fileRes = fileRes.copy()
+        return True, fileRes
+
+    def store(self, fileName, fileKey, fileRes):
+        """Remember results of the file. fileRes is searchresultsmodel.FileResults or None.
+        Results are not stored, if there are too many of them. Call it before results are passed to the model
+        """
+        if fileKey is None:
+            return
+
+        oldEntry = self._files.pop(fileName, None)
+        if oldEntry is not None and oldEntry[1] is not None:
+            self.resultsCount -= len(oldEntry[1])
+
+        if fileRes is not None:
+            if not self._cache._makeRoom(self, len(fileRes)):
+                return  # the file will be searched again
+            fileRes = fileRes.copy()
+            self.resultsCount += len(fileRes)
+        self._files[fileName] = (fileKey, fileRes)
+
+
+class ResultsCache:
+    """Results of MAX_SEARCHES recent searches, which contain not more than MAX_RESULTS matches together.
+    Key of a search shall contain everything, what affects the results, except file contents:
+    the pattern, flags, mask, the directory and the file filter
+    """
+    MAX_SEARCHES = 4
+    MAX_RESULTS = 200000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._searches = collections.OrderedDict()  # {search key: SearchResults}
+
+    def searchResults(self, searchKey):
+        """Get SearchResults for the search. Empty object is created, if the search is not cached
+        """
+        with self._lock:
+            searchRes = self._searches.pop(searchKey, None)
+            if searchRes is None:
+                searchRes = SearchResults(self)
+            self._searches[searchKey] = searchRes  # the last used is the last in the dictionary
+
+            while len(self._searches) > self.MAX_SEARCHES:
+                self._searches.popitem(last=False)
+
+            return searchRes
+
+    def _makeRoom(self, searchRes, count):
+        """Drop the least recently used other searches, so count more matches of searchRes fit to MAX_RESULTS.
+        Returns False, if they don't fit even without other searches
+        """
+        if searchRes.resultsCount + count > self.MAX_RESULTS:
+            return False
+
+        with self._lock:
+            others = [(key, res) for key, res in self._searches.iteritems() if res is not searchRes]
+            total = searchRes.resultsCount + count + sum([res.resultsCount for key, res in others])
+            for key, res in others:  # the least recently used first
+                if total <= self.MAX_RESULTS:
+                    break
+                del self._searches[key]
+                total -= res.resultsCount
+
+        return True
@@ -123,7 +123,7 @@ class SearchResultsDock(DockWidget):
     """Dock with search results
     """
 
-    onResultsHandledByReplaceThread = pyqtSignal(str, list)
+    onResultsHandledByReplaceThread = pyqtSignal(dict)
 
     def __init__(self, parent):
         DockWidget.__init__( self, parent, "&Search Results", QIcon(":/enkiicons/search.png"), "Alt+S")
@@ -164,16 +164,15 @@ class SearchResultsDock(DockWidget):
     def _onResultActivated(self, index ):
         """Item doubleclicked in the model, opening file
         """
-        result = index.internalPointer()
-        if isinstance(result, searchresultsmodel.Result):
-            fileResults = index.parent().internalPointer()
-            core.workspace().goTo( result.fileName,
-                                   line=result.line,
-                                   column=result.column,
-                                   selectionLength=len(result.match.group(0)))
+        fileResults, row = self._model.fileResultsForIndex(index)
+        if row is not None:
+            core.workspace().goTo( fileResults.fileName,
+                                   line=fileResults.lines[row],
+                                   column=fileResults.columns[row],
+                                   selectionLength=fileResults.ends[row] - fileResults.starts[row])
             core.mainWindow().statusBar().showMessage('Match %d of %d' % \
-                                                      (fileResults.results.index(result) + 1,
-                                                       len(fileResults.results)), 3000)
+                                                      (row + 1,
+                                                       len(fileResults)), 3000)
             self.setFocus()
 
     def clear(self):
@@ -192,11 +191,11 @@ class SearchResultsDock(DockWidget):
         items = {}
 
         for fileRes in self._model.fileResults:
-            for row, result in enumerate(fileRes.results):
-                if result.checkState == Qt.Checked :
-                    if not result.fileName in items:
-                        items[result.fileName] = []
-                    items[ result.fileName ].append(result)
+            if fileRes.checkedCount == 0:
+                continue
+            items[fileRes.fileName] = [fileRes.result(row) \
+                                            for row, state in enumerate(fileRes.checkStates) \
+                                                if state == Qt.Checked]
         return items
 
     def setReplaceMode(self, enabled):
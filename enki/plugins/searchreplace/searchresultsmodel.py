@@ -1,6 +1,11 @@
 """
 searchresultsmodel --- Model for search results
 ===============================================
+
+Search might find millions of matches, therefore results are stored compactly.
+Every FileResults object keeps coordinates of matches in arrays.
+Texts of the matched lines are taken by the search and stored with the coordinates, so the model never reads
+files, and shown lines match the coordinates, even if the file has been modified after the search.
 """
 
 from PyQt4.QtCore import pyqtSignal, QAbstractItemModel, \
@@ -13,95 +18,176 @@ from enki.lib.htmldelegate import htmlEscape
 
 
 class Result:  # pylint: disable=R0902
-    """One found by search thread item. Consists coordinates and capture. Used by SearchResultsModel
+    """One found by search thread item. Consists coordinates and capture.
+    groups is a tuple of texts of the whole match and groups. See substitutions.matchGroups().
+    Created on demand by FileResults.result(), the model doesn't store it
     """
-    def __init__ (self, fileName, wholeLine, line, column, match):  # pylint: disable=R0913
+    def __init__ (self, fileName, line, column, start, end, groups):  # pylint: disable=R0913
         self.fileName = fileName
-        self.wholeLine = wholeLine
         self.line = line
         self.column = column
-        self.match = match
-        self.checkState = Qt.Checked
-
-    def text(self):  # pylint: disable=W0613
-        """Displayable text of search result. Shown as line in the search results dock
-        """
-        beforeMatch = self.wholeLine[:self.column].lstrip()
-        afterMatch = self.wholeLine[self.column + len(self.match.group(0)):].rstrip()
-
-        if QApplication.instance().palette().base().color().lightnessF() > 0.5:
-            backgroundColor = 'yellow'
-            foregroundColor = 'black'
-        else:
-            backgroundColor = 'maroon'
-            foregroundColor = 'white'
-
-        return '<html>' \
-                    'Line: %d, Column: %d: %s' \
-                    '<font style=\'background-color: %s; color: %s\'>%s</font>' \
-                    '%s' \
-               '</html>' % \
-                ( self.line + 1,
-                  self.column,
-                  htmlEscape(beforeMatch),
-                  backgroundColor,
-                  foregroundColor,
-                  htmlEscape(self.match.group(0)),
-                  htmlEscape(afterMatch))
-
-    def tooltip(self):
-        """Tooltip of the search result"""
-        return self.wholeLine.strip()
-
-    def hasChildren(self):
-        """Check if QAbstractItem has children"""
-        return False
+        self.start = start
+        self.end = end
+        self.groups = groups
 
 
 class FileResults:
-    """Object stores all items, found in the file
+    """Object stores all items, found in the file.
+    lines, columns, starts and ends are arrays of match coordinates. starts and ends are offsets in the file text.
+    groups is a list of tuples, created by substitutions.matchGroups().
+    lineTexts is a list of texts of the lines, which contain the matches. Matches in the same line share the text.
+    Match objects are not stored, because every match object keeps the whole file text alive.
+    skippedCount is count of matches, which are found, but not stored, because there are too many
     """
-    def __init__(self, baseDir, fileName, results):
+    def __init__(self, baseDir, fileName, lines, columns, starts, ends, groups, lineTexts,  # pylint: disable=R0913
+                 skippedCount=0):
         self.baseDir = baseDir
         self.fileName = fileName
-        self.results = results
-        self.checkState = Qt.Checked
+        self.lines = lines
+        self.columns = columns
+        self.starts = starts
+        self.ends = ends
+        self.groups = groups
+        self.lineTexts = lineTexts
+        self.skippedCount = skippedCount
+        self.checkStates = bytearray([Qt.Checked]) * len(starts)
+        self.checkedCount = len(starts)
+        self.row = 0  # row in the model. Updated by the model
+        self._columnsShared = False  # columns are used by a copy too, see copy()
 
     def __str__(self):
         """Convertor to string. Used for debugging
         """
-        return '%s (%d)' % (self.fileName, len(self.results))
+        return '%s (%d)' % (self.fileName, len(self))
+
+    def __len__(self):
+        """Count of results
+        """
+        return len(self.starts)
 
-    def updateCheckState(self):
-        """Update own checked state after checked state of child result changed or
-        child result removed
+    def result(self, row):
+        """Get Result object for the row
+        """
+        return Result(self.fileName,
+                      self.lines[row],
+                      self.columns[row],
+                      self.starts[row],
+                      self.ends[row],
+                      self.groups[row])
+
+    def copy(self):
+        """Create a copy with all results checked.
+        Columns are shared by both objects. removeResults() copies them, before it modifies them
+        """
+        fileRes = FileResults(self.baseDir,
+                              self.fileName,
+                              self.lines,
+                              self.columns,
+                              self.starts,
+                              self.ends,
+                              self.groups,
+                              self.lineTexts,
+                              self.skippedCount)
+        fileRes._columnsShared = self._columnsShared = True
+        return fileRes
+
+    def checkState(self):
+        """Checked state of the file. Depends on checked states of results
         """
-        if all([res.checkState == Qt.Checked for res in self.results]):  # if all checked
-            self.checkState = Qt.Checked
-        elif any([res.checkState == Qt.Checked for res in self.results]):  # if any checked
-            self.checkState = Qt.PartiallyChecked
+        if self.checkedCount == len(self):
+            return Qt.Checked
+        elif self.checkedCount > 0:
+            return Qt.PartiallyChecked
         else:
-            self.checkState = Qt.Unchecked
+            return Qt.Unchecked
+
+    def setResultCheckState(self, row, state):
+        """Check or uncheck one result
+        """
+        if (self.checkStates[row] == Qt.Checked) != (state == Qt.Checked):
+            self.checkedCount += 1 if state == Qt.Checked else -1
+        self.checkStates[row] = state
+
+    def setCheckState(self, state):
+        """Check or uncheck all results
+        """
+        self.checkStates = bytearray([state]) * len(self)
+        self.checkedCount = len(self) if state == Qt.Checked else 0
+
+    def _unshareColumns(self):
+        """Copy columns, which are shared with a copy, before they are modified
+        """
+        if self._columnsShared:
+            self.lines = self.lines[:]
+            self.columns = self.columns[:]
+            self.starts = self.starts[:]
+            self.ends = self.ends[:]
+            self.groups = self.groups[:]
+            self.lineTexts = self.lineTexts[:]
+            self._columnsShared = False
+
+    def removeResults(self, first, last):
+        """Remove results in rows from first to last
+        """
+        self.checkedCount -= self.checkStates[first:last + 1].count(chr(Qt.Checked))
+        self._unshareColumns()
+        for column in (self.lines, self.columns, self.starts, self.ends, self.groups, self.lineTexts,
+                       self.checkStates):
+            del column[first:last + 1]
+
+    def removeResult(self, row):
+        """Remove result from the row
+        """
+        self.removeResults(row, row)
+
+    def keepResults(self, rows):
+        """Keep only results from the rows. rows is a sorted list.
+        Every column is rebuilt with one filtered copy
+        """
+        filtered = []
+        for column in (self.lines, self.columns, self.starts, self.ends, self.groups, self.lineTexts,
+                       self.checkStates):
+            kept = column[:0]  # empty column of the same type
+            kept.extend([column[row] for row in rows])
+            filtered.append(kept)
+        self.lines, self.columns, self.starts, self.ends, self.groups, self.lineTexts, self.checkStates = filtered
+        self.checkedCount = self.checkStates.count(chr(Qt.Checked))
+        self._columnsShared = False
 
     def text(self):
         """Displayable text of the file results. Shown as line in the search results dock
         baseDir is base directory of current search operation
         """
-        return '%s (%d)' % (QDir(self.baseDir).relativeFilePath(self.fileName), len(self.results))
+        relPath = QDir(self.baseDir).relativeFilePath(self.fileName)
+        if self.skippedCount:
+            return '%s (%d, %d more not shown)' % (relPath, len(self), self.skippedCount)
+        else:
+            return '%s (%d)' % (relPath, len(self))
 
     def tooltip(self):
         """Tooltip of the item in the results dock
         """
         return self.fileName
 
-    def hasChildren(self):
-        """Check if item has children
-        """
-        return 0 != len(self.results)
+
+def _neighbourRanges(rows):
+    """Split sorted rows to ranges of neighbour rows.
+    Returns list of (first, last) tuples, starting from the end, so ranges can be removed in this order
+    """
+    ranges = []
+    rows = list(rows)
+    while rows:
+        last = first = rows.pop()
+        while rows and rows[-1] == first - 1:
+            first = rows.pop()
+        ranges.append((first, last))
+    return ranges
 
 
 class SearchResultsModel(QAbstractItemModel):
     """AbstractItemodel used for display search results in 'Search in directory' and 'Replace in directory' mode
+
+    Indexes of files don't have internal pointer. Internal pointer of a result index is its FileResults
     """
     firstResultsAvailable = pyqtSignal()
 
@@ -112,6 +198,8 @@ class SearchResultsModel(QAbstractItemModel):
         self._replaceMode = False
 
         self.fileResults = []  # list of FileResults
+        self._fileResultsByName = {}
+        self._matchesCount = 0
 
     def setReplaceMode(self, enabled):
         """When replace mode is enabled, all items are checkState
@@ -119,9 +207,17 @@ class SearchResultsModel(QAbstractItemModel):
         self._replaceMode = enabled
         if self.fileResults:
             self.dataChanged.emit(self.index(0, 0, QModelIndex()),
-                                  self.index(len(self.fileResults) - 1,
-                                             len(self.fileResults[-1].results) - 1,
-                                             QModelIndex()))
+                                  self.index(len(self.fileResults) - 1, 0, QModelIndex()))
+
+    def fileResultsForIndex(self, index):
+        """Get tuple (FileResults, row of the result or None) for the index.
+        Row is None for a file index
+        """
+        fileRes = index.internalPointer()
+        if fileRes is None:
+            return self.fileResults[index.row()], None
+        else:
+            return fileRes, index.row()
 
     def index(self, row, column, parent ):
         """See QAbstractItemModel docs
@@ -130,10 +226,9 @@ class SearchResultsModel(QAbstractItemModel):
             return QModelIndex()
 
         if parent.isValid():  # index for result
-            result = parent.internalPointer().results[row]
-            return self.createIndex( row, column, result )
+            return self.createIndex(row, column, self.fileResults[parent.row()])
         else:  # need index for fileRes
-            return self.createIndex( row, column, self.fileResults[row])
+            return self.createIndex(row, column)
 
     def parent(self, index):
         """See QAbstractItemModel docs
@@ -141,22 +236,19 @@ class SearchResultsModel(QAbstractItemModel):
         if not index.isValid() :
             return QModelIndex()
 
-        if not isinstance(index.internalPointer(), Result):  # it is an top level item
+        fileRes = index.internalPointer()
+        if fileRes is None:  # it is an top level item
             return QModelIndex()
 
-        result = index.internalPointer()
-        for row, fileRes in enumerate(self.fileResults):
-            if fileRes.fileName == result.fileName:
-                return self.createIndex(row, 0, fileRes)
-        else:
-            assert(0)
+        return self.createIndex(fileRes.row, 0)
 
     def hasChildren(self, item):
         """See QAbstractItemModel docs
         """
         # root parents
         if item.isValid():
-            return item.internalPointer().hasChildren()
+            return item.internalPointer() is None and \
+                   len(self.fileResults[item.row()]) != 0
         else:
             return len(self.fileResults) != 0
 
@@ -170,12 +262,10 @@ class SearchResultsModel(QAbstractItemModel):
         """
         if not parent.isValid():  # root elements
             return len(self.fileResults)
-        elif isinstance(parent.internalPointer(), Result):  # result
+        elif parent.internalPointer() is not None:  # result
             return 0
-        elif isinstance(parent.internalPointer(), FileResults):  # file
-            return len(parent.internalPointer().results)
-        else:
-            assert(0)
+        else:  # file
+            return len(self.fileResults[parent.row()])
 
     def flags(self, index ):
         """See QAbstractItemModel docs
@@ -193,56 +283,88 @@ class SearchResultsModel(QAbstractItemModel):
         if not index.isValid() :
             return None
 
-        # Common code for file and result
-        result = index.internalPointer()
-        if role == Qt.DisplayRole:
-            return result.text()
-        elif role == Qt.ToolTipRole:
-            return result.tooltip()
-        elif role == Qt.CheckStateRole:
-            if  self.flags( index ) & Qt.ItemIsUserCheckable:
-                return result.checkState
+        fileRes, row = self.fileResultsForIndex(index)
+        if row is None:
+            if role == Qt.DisplayRole:
+                return fileRes.text()
+            elif role == Qt.ToolTipRole:
+                return fileRes.tooltip()
+            elif role == Qt.CheckStateRole:
+                if  self.flags( index ) & Qt.ItemIsUserCheckable:
+                    return fileRes.checkState()
+        else:
+            if role == Qt.DisplayRole:
+                return self._resultText(fileRes, row)
+            elif role == Qt.ToolTipRole:
+                return fileRes.lineTexts[row].strip()
+            elif role == Qt.CheckStateRole:
+                if  self.flags( index ) & Qt.ItemIsUserCheckable:
+                    return fileRes.checkStates[row]
 
         return None
 
+    def _resultText(self, fileRes, row):
+        """Displayable text of search result. Shown as line in the search results dock
+        """
+        wholeLine = fileRes.lineTexts[row]
+        column = fileRes.columns[row]
+        matchEnd = column + fileRes.ends[row] - fileRes.starts[row]
+
+        beforeMatch = wholeLine[:column].lstrip()
+        matchText = wholeLine[column:matchEnd]
+        afterMatch = wholeLine[matchEnd:].rstrip()
+
+        if QApplication.instance().palette().base().color().lightnessF() > 0.5:
+            backgroundColor = 'yellow'
+            foregroundColor = 'black'
+        else:
+            backgroundColor = 'maroon'
+            foregroundColor = 'white'
+
+        return '<html>' \
+                    'Line: %d, Column: %d: %s' \
+                    '<font style=\'background-color: %s; color: %s\'>%s</font>' \
+                    '%s' \
+               '</html>' % \
+                ( fileRes.lines[row] + 1,
+                  column,
+                  htmlEscape(beforeMatch),
+                  backgroundColor,
+                  foregroundColor,
+                  htmlEscape(matchText),
+                  htmlEscape(afterMatch))
+
     def setData(self, index, value, role ):
         """See QAbstractItemModel docs
         This method changes checked state of the item.
         If file unchecked - we need uncheck all items,
         if item unchecked...
         """
-        if isinstance(index.internalPointer(), Result):  # it is a Result
-            if role == Qt.CheckStateRole:
-                # update own state
-                index.internalPointer().checkState = value
-                self.dataChanged.emit( index, index )  # own checked state changed
-                # update parent state
-                fileRes = index.parent().internalPointer()
-                assert(isinstance(fileRes, FileResults))
-                fileRes.updateCheckState()
-                self.dataChanged.emit(index.parent(), index.parent())  # parent checked state might be changed
-        elif isinstance(index.internalPointer(), FileResults):  # it is a FileResults
-            if role == Qt.CheckStateRole:
-                fileRes = index.internalPointer()
-                fileRes.checkState = value
-                for res in fileRes.results:
-                    res.checkState = value
-                firstChildIndex = self.index(0, 0, index)
-                lastChildIndex = self.index(len(fileRes.results) - 1, 0, index)
-                self.dataChanged.emit(firstChildIndex, lastChildIndex)
-        else:
-            assert(0)
+        if role != Qt.CheckStateRole:
+            return True
+
+        fileRes, row = self.fileResultsForIndex(index)
+        if row is not None:  # it is a Result
+            # update own state
+            fileRes.setResultCheckState(row, value)
+            self.dataChanged.emit( index, index )  # own checked state changed
+            # parent checked state might be changed
+            self.dataChanged.emit(index.parent(), index.parent())
+        else:  # it is a FileResults
+            fileRes.setCheckState(value)
+            firstChildIndex = self.index(0, 0, index)
+            lastChildIndex = self.index(len(fileRes) - 1, 0, index)
+            self.dataChanged.emit(index, index)
+            self.dataChanged.emit(firstChildIndex, lastChildIndex)
         return True
 
     def setCheckStateForAll(self, state):
         """Check all items
         """
         for fileRes in self.fileResults:
-            fileRes.checkState = state
-            for match in fileRes.results:
-                match.checkState = state
-        self.dataChanged.emit(self.createIndex(0, 0, self.fileResults[0]),
-                              self.createIndex(len(self.fileResults) - 1, 0, self.fileResults[-1]))
+            fileRes.setCheckState(state)
+        self.dataChanged.emit(self.createIndex(0, 0),
+                              self.createIndex(len(self.fileResults) - 1, 0))
 
     def isFirstMatchChecked(self):
         """Check if first file in the search results is expanded
@@ -256,6 +378,8 @@ class SearchResultsModel(QAbstractItemModel):
         """
         self.beginRemoveRows(QModelIndex(), 0, len(self.fileResults) - 1)
         self.fileResults = []
+        self._fileResultsByName = {}
+        self._matchesCount = 0
         self.endRemoveRows()
 
     def appendResults(self, fileResultList ):
@@ -267,39 +391,86 @@ class SearchResultsModel(QAbstractItemModel):
         self.beginInsertRows( QModelIndex(), \
                               len(self.fileResults), \
                               len(self.fileResults) + len(fileResultList) - 1)
-        self.fileResults.extend(fileResultList)
+        for fileRes in fileResultList:
+            fileRes.row = len(self.fileResults)
+            self.fileResults.append(fileRes)
+            self._fileResultsByName[fileRes.fileName] = fileRes
+            self._matchesCount += len(fileRes)
         self.endInsertRows()
 
-    def onResultsHandledByReplaceThread(self, fileName, results):
-        """Replace thread has processed result, need to it from the model
-        """
-        for index, fileRes in enumerate(self.fileResults):  # try to find FileResults
-            if fileRes.fileName == fileName:  # found
-                fileResIndex = self.createIndex(index, 0, fileRes)
-                if len(results) == len(fileRes.results):  # removing all
-                    self.beginRemoveRows(QModelIndex(), index, index)
-                    self.fileResults.pop(index)
-                    self.endRemoveRows()
-                else:
-                    for res in results:
-                        resIndex = fileRes.results.index(res)
-                        self.beginRemoveRows(fileResIndex, resIndex, resIndex)
-                        fileRes.results.pop(resIndex)
-                        self.endRemoveRows()
-                    if not fileRes.results:  # no results left
-                        self.beginRemoveRows(QModelIndex(), index, index)
-                        self.fileResults.pop(index)
-                        self.endRemoveRows()
-                    else:
-                        fileRes.updateCheckState()
-                return
-        else:  # not found
-            assert(0)
+    def _removeFiles(self, first, last):
+        """Remove files in rows from first to last and all their results
+        """
+        self.beginRemoveRows(QModelIndex(), first, last)
+        for fileRes in self.fileResults[first:last + 1]:
+            del self._fileResultsByName[fileRes.fileName]
+            self._matchesCount -= len(fileRes)
+        del self.fileResults[first:last + 1]
+        for nextFileRes in self.fileResults[first:]:
+            nextFileRes.row = first
+            first += 1
+        self.endRemoveRows()
+
+    def _removeResults(self, fileRes, results):
+        """Remove some results of the file.
+        Ranges of neighbour rows are removed starting from the end, one notification of the views per range.
+        Removing a range moves all results after it. If the ranges together would move more results,
+        than the file has, the remaining results are filtered to new columns at once instead
+        """
+        fileResIndex = self.createIndex(fileRes.row, 0)
+        handledStarts = set([result.start for result in results])
+        removedRows = [row for row, start in enumerate(fileRes.starts) if start in handledStarts]
+        ranges = _neighbourRanges(removedRows)
+
+        movedCount = 0
+        removedAfter = 0
+        for first, last in ranges:
+            movedCount += len(fileRes) - 1 - last - removedAfter
+            removedAfter += last - first + 1
+
+        if movedCount <= len(fileRes):
+            for first, last in ranges:
+                self.beginRemoveRows(fileResIndex, first, last)
+                fileRes.removeResults(first, last)
+                self.endRemoveRows()
+        else:
+            removedSet = set(removedRows)
+            keptRows = [row for row in xrange(len(fileRes)) if row not in removedSet]
+            # The kept results move to the first rows, the tail rows disappear
+            self.beginRemoveRows(fileResIndex, len(keptRows), len(fileRes) - 1)
+            fileRes.keepResults(keptRows)
+            self.endRemoveRows()
+            if keptRows:
+                self.dataChanged.emit(self.index(0, 0, fileResIndex),
+                                      self.index(len(keptRows) - 1, 0, fileResIndex))
+
+        self._matchesCount -= len(removedRows)
+        self.dataChanged.emit(fileResIndex, fileResIndex)  # check state might be changed
+
+    def onResultsHandledByReplaceThread(self, handled):
+        """Replace thread has processed results, need to remove them from the model.
+        handled is a dictionary {file path: list of Result}
+        """
+        removedRows = []
+        for fileName, results in handled.iteritems():
+            fileRes = self._fileResultsByName.get(fileName)
+            if fileRes is None:
+                continue
+
+            if len(results) < len(fileRes):
+                self._removeResults(fileRes, results)
+                if len(fileRes):
+                    continue
+
+            removedRows.append(fileRes.row)  # no results left
+
+        for first, last in _neighbourRanges(sorted(removedRows)):
+            self._removeFiles(first, last)
 
     def matchesCount(self):
         """Get count of matches, stored by the model
         """
-        return sum([len (fileRes.results) for fileRes in self.fileResults])
+        return self._matchesCount
 
     def empty(self):
         """Check if have some items
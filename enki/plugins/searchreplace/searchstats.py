@@ -0,0 +1,142 @@
+"""
+searchstats --- Statistics of search in directory
+=================================================
+
+Progress of search is measured in bytes, not in files, because one huge file might take longer than
+thousands of small ones. Time, spent in every stage of search, is accumulated.
+Statistics are shown in the search widget and written to the log, when search has finished.
+
+Module doesn't depend on Qt
+"""
+
+import threading
+import time
+
+ENUMERATE = 'enumerate'  # walking the directory and getting file sizes
+CHECK = 'check'  # waiting for worker processes, which read and search files
+READ = 'read'
+DECODE = 'decode'
+MATCH = 'match'
+EMIT = 'emit'  # passing results to the GUI
+
+STAGES = (ENUMERATE, CHECK, READ, DECODE, MATCH, EMIT)
+
+
+class SearchStats:
+    """Statistics of one search.
+    Stages are executed concurrently, therefore total time of the stages might be bigger than elapsed time.
+    Methods, which update statistics, are thread safe. Pass snapshot() to other threads
+    """
+    def __init__(self):
+        self.startTime = time.time()
+        self.elapsed = 0.
+        self.filesFound = 0  # found so far. Total count, when enumerationFinished is True
+        self.bytesFound = 0
+        self.enumerationFinished = False
+        self.filesDone = 0
+        self.bytesDone = 0
+        self.matchesCount = 0
+        self.finished = False
+        self.stageTimes = dict.fromkeys(STAGES, 0.)
+        self._lock = threading.Lock()
+
+    def addTime(self, stage, seconds):
+        """Add time, spent in the stage
+        """
+        with self._lock:
+            self.stageTimes[stage] += seconds
+
+    def fileFound(self, size):
+        """File, which shall be searched, has been found. size is 0, if not known
+        """
+        with self._lock:
+            self.filesFound += 1
+            self.bytesFound += size
+
+    def setEnumerationFinished(self):
+        """All files have been found
+        """
+        self.enumerationFinished = True
+
+    def fileDone(self, size, matchesCount=0):
+        """File has been searched or skipped
+        """
+        with self._lock:
+            self.filesDone += 1
+            self.bytesDone += size
+            self.matchesCount += matchesCount
+
+    def addMatches(self, count):
+        """Count found matches
+        """
+        with self._lock:
+            self.matchesCount += count
+
+    def finish(self):
+        """Search has finished or has been stopped
+        """
+        self.elapsed = time.time() - self.startTime
+        self.finished = True
+
+    def snapshot(self):
+        """Get a copy of the current statistics
+        """
+        res = SearchStats()
+        with self._lock:
+            res.__dict__.update(self.__dict__)
+            res.stageTimes = dict(self.stageTimes)
+        res._lock = threading.Lock()
+        if not res.finished:
+            res.elapsed = time.time() - res.startTime
+        return res
+
+    def progress(self):
+        """Progress from 0 to 1 or None, if the count of files is not known yet
+        """
+        if not self.enumerationFinished:
+            return None
+        elif self.bytesFound:
+            return min(1., float(self.bytesDone) / self.bytesFound)
+        elif self.filesFound:  # sizes of files are not known, i.e. when searching in opened files
+            return float(self.filesDone) / self.filesFound
+        else:
+            return 1.
+
+    def throughput(self):
+        """Searched bytes per second
+        """
+        if self.elapsed <= 0:
+            return 0.
+        return self.bytesDone / self.elapsed
+
+    def eta(self):
+        """Estimated count of seconds until the search finishes. None if not known
+        """
+        progress = self.progress()
+        if progress is None or progress <= 0 or self.finished:
+            return None
+        return self.elapsed * (1. - progress) / progress
+
+    def asDict(self):
+        """Statistics as a dictionary, i.e. for logging in a structured format
+        """
+        return {'elapsed': self.elapsed,
+                'filesFound': self.filesFound,
+                'bytesFound': self.bytesFound,
+                'filesDone': self.filesDone,
+                'bytesDone': self.bytesDone,
+                'matchesCount': self.matchesCount,
+                'finished': self.finished,
+                'stageTimes': dict(self.stageTimes)}
+
+    def __str__(self):
+        """Convertor to string. Used for logging
+        """
+        stages = ', '.join(['%s %.3fs' % (stage, self.stageTimes[stage]) for stage in STAGES])
+        return '%d files, %.1f MB searched in %.3fs (%.1f MB/s), %d matches. Stages: %s' % \
+            (self.filesDone,
+             self.bytesDone / 1024. / 1024.,
+             self.elapsed,
+             self.throughput() / 1024. / 1024.,
+             self.matchesCount,
+             stages)
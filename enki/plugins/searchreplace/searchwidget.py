@@ -27,6 +27,7 @@ from PyQt4 import uic
 from enki.core.core import core
 
 import searchresultsmodel
+import searchstats
 
 from controller import *
 
@@ -134,11 +135,12 @@ class SearchWidget(QFrame):
         self.cbSearch.setCompleter(None)
         self.pbSearchStop.setVisible( False )
         self.pbReplaceCheckedStop.setVisible( False )
+        self.lMatchesCount.setVisible( False )
 
         self._progress = QProgressBar( self )
         self._progress.setAlignment( Qt.AlignCenter )
         self._progress.setToolTip( self.tr( "Search in progress..." ) )
-        self._progress.setMaximumSize( QSize( 80, 16 ) )
+        self._progress.setMaximumSize( QSize( 160, 16 ) )
         core.mainWindow().statusBar().insertPermanentWidget( 1, self._progress )
         self._progress.setVisible( False )
 
@@ -503,6 +505,15 @@ class SearchWidget(QFrame):
         pal.setColor( widget.backgroundRole(), stateColor )
         widget.setPalette( pal )
 
+    def setMatchesCount(self, count):
+        """Show count of found items in the current file. None hides the counter
+        """
+        if count is None:
+            self.lMatchesCount.setVisible( False )
+        else:
+            self.lMatchesCount.setText( self.tr( "%d match(es)" % count ) )
+            self.lMatchesCount.setVisible( True )
+
     def setSearchInProgress(self, inProgress):
         """Search thread started or stopped
         """
@@ -511,11 +522,30 @@ class SearchWidget(QFrame):
         self._updateWidgets()
         self._progress.setVisible( inProgress )
 
-    def onSearchProgressChanged(self, value, total ):
-        """Signal from the thread, progress changed
+    def onSearchProgressChanged(self, stats):
+        """Signal from the thread, progress changed. stats is searchstats.SearchStats
         """
-        self._progress.setValue( value )
-        self._progress.setMaximum( total )
+        progress = stats.progress()
+        if progress is None:  # count of files is not known yet, show busy indicator
+            self._progress.setMaximum( 0 )
+            self._progress.setFormat( "%p%" )
+        else:
+            self._progress.setMaximum( 1000 )
+            self._progress.setValue( int( progress * 1000 ) )
+            eta = stats.eta()
+            if eta is not None and eta >= 1:
+                self._progress.setFormat( self.tr( "%%p%% %ds left" % eta ) )
+            else:
+                self._progress.setFormat( "%p%" )
+
+        stages = '\n'.join(['%s: %.2f s' % (stage, stats.stageTimes[stage]) \
+                                for stage in searchstats.STAGES])
+        self._progress.setToolTip( self.tr( "Search in progress...\n"
+                                            "%d of %d files, %.1f MB/s\n"
+                                            "%s" % (stats.filesDone,
+                                                    stats.filesFound,
+                                                    stats.throughput() / 1024. / 1024.,
+                                                    stages) ) )
 
     def setReplaceInProgress(self, inProgress):
         """Replace thread started or stopped
@@ -0,0 +1,303 @@
+"""
+searchworker --- Code, executed by search worker processes
+==========================================================
+
+Search in directory distributes files over a pool of processes.
+This module doesn't depend on Qt and Enki core, so a worker process imports it cheaply
+"""
+
+import os
+import re
+import mmap
+import array
+import bisect
+import codecs
+import locale
+import time
+
+import literalsearch
+import searchstats
+import substitutions
+import trigramindex
+
+MMAP_MIN_SIZE = 64 * 1024  # Smaller files are read. Bigger are mapped to memory
+
+BINARY = 'binary'  # file kind. Other kinds are names of text encodings
+
+# Byte order marks and encodings. UTF-32 LE BOM starts with UTF-16 LE BOM, therefore it is checked first
+_BOMS = ((codecs.BOM_UTF32_LE, 'utf-32-le'),
+         (codecs.BOM_UTF32_BE, 'utf-32-be'),
+         (codecs.BOM_UTF8, 'utf-8-sig'),
+         (codecs.BOM_UTF16_LE, 'utf-16-le'),
+         (codecs.BOM_UTF16_BE, 'utf-16-be'))
+
+# Codecs, which don't skip and don't write byte order mark themselves
+_BOM_NOT_HANDLED = dict([(encoding, bom) for bom, encoding in _BOMS if encoding != 'utf-8-sig'])
+
+_regExp = None  # search pattern of the current worker process. Set by initWorker()
+_prefilter = None  # prefilter of the current worker process. Set by initWorker()
+_maxResults = None  # max count of stored matches per file. Set by initWorker()
+
+
+def _fallbackEncodings():
+    """Encodings, which are tried, if file is not valid UTF-8. The last one never fails
+    """
+    encodings = []
+    try:
+        preferred = codecs.lookup(locale.getpreferredencoding()).name
+    except (LookupError, ValueError):
+        preferred = None
+    if preferred not in (None, 'utf-8', 'ascii', 'cp1252', 'latin1', 'iso8859-1'):
+        encodings.append(preferred)
+    encodings.extend(('cp1252', 'latin1'))
+    return encodings
+
+_FALLBACK_ENCODINGS = _fallbackEncodings()
+
+
+def _bomEncoding(data):
+    """Get encoding name by byte order mark or None
+    """
+    head = data[:4]
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+
+def _classify(data):
+    """Detect kind of file data (string or mmap object) without decoding it.
+    Returns BINARY, encoding name, if the data starts with byte order mark, or None if encoding is not known yet
+    """
+    encoding = _bomEncoding(data)
+    if encoding is not None:
+        return encoding
+    if '\0' in data[:4096]:
+        return BINARY
+    return None
+
+
+def _isAsciiCompatible(kind):
+    """Check if ASCII text is encoded with the same bytes in files of this kind.
+    Bytes prefilter can be used only for such files
+    """
+    return kind not in _BOM_NOT_HANDLED
+
+
+def _mapOrRead(openedFile):
+    """Map big file to memory, read small file.
+    Returns mmap object or string
+    """
+    if os.fstat(openedFile.fileno()).st_size >= MMAP_MIN_SIZE:
+        try:
+            return mmap.mmap(openedFile.fileno(), 0, access=mmap.ACCESS_READ)
+        except (mmap.error, ValueError, OverflowError):  # not a regular file or too big for address space
+            pass
+
+    return openedFile.read()
+
+
+def decodeText(data, kind=None):
+    """Decode file data.
+    kind is an encoding name or None, if not known.
+    Returns tuple (text, encoding name)
+    """
+    if kind is None:
+        kind = _bomEncoding(data)
+
+    if kind is not None:
+        if kind in _BOM_NOT_HANDLED:
+            data = data[len(_BOM_NOT_HANDLED[kind]):]
+        return unicode(data, kind, 'replace'), kind
+
+    try:
+        return unicode(data, 'utf8'), 'utf8'
+    except UnicodeDecodeError:
+        pass
+
+    for encoding in _FALLBACK_ENCODINGS:
+        try:
+            return unicode(data, encoding), encoding
+        except UnicodeDecodeError:
+            pass
+
+
+def encodeText(text, encoding):
+    """Encode text to write it to a file, which has been decoded with decodeText().
+    Byte order mark is restored. May raise UnicodeEncodeError
+    """
+    data = text.encode(encoding)
+    if encoding in _BOM_NOT_HANDLED:
+        data = _BOM_NOT_HANDLED[encoding] + data
+    return data
+
+
+def makePrefilter(regExp):
+    """Make bytes regular expression, which finds literal text, required by regExp.
+    Case sensitive literal is searched with str.find(), see literalsearch module.
+    It is used to check raw file data, before decoding it.
+    Only ASCII parts of the literals are used, so the prefilter is valid for any ASCII compatible encoding.
+    Returns None, if the regExp doesn't require any literal text, or if the literal can't be
+    searched in raw data
+    """
+    if regExp.flags & re.IGNORECASE and regExp.flags & re.UNICODE:
+        return None  # some non-ASCII letters ignore case as ASCII
+
+    asciiParts = []
+    for literal in trigramindex.requiredLiterals(regExp):
+        asciiParts.extend(re.split(u'[^\x00-\x7f]+', literal))
+
+    literal = max(asciiParts or [u''], key=len)
+    if not literal:
+        return None
+
+    # bytes regular expression ignores case of ASCII letters only
+    return literalsearch.optimized(re.compile(re.escape(literal.encode('ascii')), regExp.flags & re.IGNORECASE))
+
+
+def readFile(fileName, prefilter=None, kind=None, stats=None):
+    """Read text from file.
+    kind is a file kind, if known from the previous reads, or None.
+    Returns tuple (text, file kind). Text is empty for binary and not readable files.
+    If prefilter is set, and raw file data doesn't match it, file is not decoded
+    and empty text is returned. Kind might be None in this case.
+    If stats (searchstats.SearchStats) is set, time of reading and decoding is added to it
+    """
+    if kind == BINARY:
+        return u'', kind
+
+    stage = searchstats.READ
+    startTime = time.time()
+    try:
+        with open(fileName, 'rb') as openedFile:
+            data = _mapOrRead(openedFile)
+            try:
+                if kind is None:
+                    kind = _classify(data)
+                if kind == BINARY:
+                    return u'', kind
+                if prefilter is not None and \
+                   _isAsciiCompatible(kind) and \
+                   prefilter.search(data) is None:
+                    return u'', kind
+                if stats is not None:
+                    decodeStartTime = time.time()
+                    stats.addTime(stage, decodeStartTime - startTime)
+                    stage, startTime = searchstats.DECODE, decodeStartTime
+                return decodeText(data, kind)
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+    except (IOError, OSError):
+        return u'', None
+    finally:
+        if stats is not None:
+            stats.addTime(stage, time.time() - startTime)
+
+
+def readFileContent(fileName, prefilter=None):
+    """Read text from file. See readFile()
+    """
+    return readFile(fileName, prefilter)[0]
+
+
+class _LineTable:
+    """Table of line start positions in a text.
+    Converts position in the text to line number with binary search
+    """
+    def __init__(self, text):
+        self._starts = array.array('l', [0])
+        pos = text.find('\n')
+        while pos != -1:
+            self._starts.append(pos + 1)
+            pos = text.find('\n', pos + 1)
+
+    def line(self, pos, firstLine=0):
+        """Get line number for the position.
+        firstLine is a hint. Line number is not less than it
+        """
+        return bisect.bisect_right(self._starts, pos, firstLine) - 1
+
+    def lineStart(self, line):
+        """Position of the first character of the line
+        """
+        return self._starts[line]
+
+
+def searchText(pattern, text, maxResults, isStopped=None):
+    """Find all matches of the pattern in the text.
+    Only first maxResults matches are stored, others are only counted.
+    isStopped is a function. If it returns True, search is stopped.
+    Returns tuple (lines, columns, starts, ends, groups, line texts, skipped count) or None, if nothing found.
+    Coordinates are arrays, groups is a list of tuples, created by substitutions.matchGroups().
+    Line texts is a list of texts of the lines, which contain the matches. Matches in the same line share the text
+    """
+    lines = array.array('l')
+    columns = array.array('l')
+    starts = array.array('l')
+    ends = array.array('l')
+    groups = []
+    lineTexts = []
+    skippedCount = 0
+    lineTable = None  # built only for texts with matches
+    line = 0
+    lineText = None
+    lineEnd = -1
+
+    for match in pattern.finditer(text):
+        if len(starts) >= maxResults:
+            skippedCount += 1
+        else:
+            if lineTable is None:
+                lineTable = _LineTable(text)
+
+            start = match.start()
+            end = match.end()
+            newLine = lineTable.line(start, line)
+            if lineText is None or newLine != line or end > lineEnd:
+                lineEnd = text.find('\n', end)
+                if lineEnd == -1:
+                    lineEnd = len(text)
+                lineText = text[lineTable.lineStart(newLine):lineEnd]
+            line = newLine
+
+            lines.append(line)
+            columns.append(start - lineTable.lineStart(line))
+            starts.append(start)
+            ends.append(end)
+            groups.append(substitutions.matchGroups(match))
+            lineTexts.append(lineText)
+
+        if isStopped is not None and isStopped():
+            break
+
+    if not starts:
+        return None
+
+    return lines, columns, starts, ends, groups, lineTexts, skippedCount
+
+
+def initWorker(regExp, maxResults):
+    """Worker process initializer. Stores compiled search pattern and max count of stored matches per file
+    """
+    global _regExp, _prefilter, _maxResults  # pylint: disable=W0603
+    _regExp = literalsearch.optimized(regExp)
+    _prefilter = makePrefilter(regExp)
+    _maxResults = maxResults
+
+
+def searchFile(item):
+    """Read the file and search in it.
+    item is tuple (fileName, file key, file kind or None). Key is not used, but returned back.
+    Returns tuple (fileName, file key, matches, file kind or None). matches are returned by searchText()
+    """
+    fileName, key, kind = item
+    text, kind = readFile(fileName, _prefilter, kind)
+    return fileName, key, searchText(_regExp, text, _maxResults), kind
+
+
+def indexFile(fileName):
+    """Build trigram index entry for a file.
+    See trigramindex.indexFile()
+    """
+    return trigramindex.indexFile(fileName, readFileContent)
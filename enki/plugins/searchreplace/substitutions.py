@@ -14,8 +14,16 @@ _escapeSequences = \
   't': '\t',}
 
 
-def makeSubstitutions(replaceText, matchObject):
+def matchGroups(matchObject):
+    """Get tuple of texts of the whole match and all groups. Not matched groups are None.
+    The tuple is used instead of the match object, which keeps the whole searched text alive
+    """
+    return (matchObject.group(0),) + matchObject.groups()
+
+
+def makeSubstitutions(replaceText, groups):
     """Replace patterns like \n and \1 with symbols and matches
+    groups is a tuple, created by matchGroups()
     """
     def _replaceFunc(escapeMatchObject):
         char = escapeMatchObject.group(0)[1]
@@ -23,9 +31,9 @@ def makeSubstitutions(replaceText, matchObject):
             return _escapeSequences[char]
         elif char.isdigit():
             index = int(char)
-            try:
-                return matchObject.group(index)
-            except IndexError:
+            if index < len(groups):
+                return groups[index] or ''
+            else:
                 return escapeMatchObject.group(0)
 
         return escapeMatchObject.group(0)  # no any replacements, return original value
@@ -5,25 +5,36 @@ threads --- Search and Replace threads
 This threads are used for asynchronous search and replace
 """
 
+import logging
 import os.path
 import re
 import time
 import fnmatch
+import collections
+import itertools
+import multiprocessing
+import threading
+import Queue
 
 from PyQt4.QtCore import pyqtSignal, \
+                         Qt, \
                          QThread
 
 from enki.core.core import core
+import enki.core.defines
+from enki.core import filewalker
+import fileclasses
+import literalsearch
+import replaceworker
+import resultscache
 import searchresultsmodel
-import substitutions
+import searchstats
+import searchworker
+import trigramindex
 
+_resultsCache = resultscache.ResultsCache()  # shared by all search threads
 
-def _isBinary(fileObject):
-    """Expects, that file position is 0, when exits, file position is 0
-    """
-    binary = '\0' in fileObject.read( 4096 )
-    fileObject.seek(0)
-    return binary
+_logger = logging.getLogger('enki.plugins.searchreplace')
 
 
 class StopableThread(QThread):
@@ -50,16 +61,56 @@ class StopableThread(QThread):
         self._exit = False
         QThread.start(self)
 
+    def _configuredWorkerCount(self):
+        """Get count of worker processes from the settings.
+        0 means 'as many as CPU cores'
+        """
+        count = core.config()['SearchReplace']['WorkerCount']
+        if count <= 0:
+            try:
+                count = multiprocessing.cpu_count()
+            except NotImplementedError:
+                count = 1
+        return count
+
 
 class SearchThread(StopableThread):
-    """Thread builds list of files for search and than searches in this files.append
+    """Thread builds list of files for search and than searches in this files.
+    When searching in a directory without the index, walking the directory, reading files and searching
+    are done concurrently
     """
-    RESULTS_EMIT_TIMEOUT = 1.0
+    RESULTS_EMIT_INTERVAL = 0.1  # min wall time between batches of results, seconds
+    RESULTS_INSERT_TIME = 0.02  # desired time, the GUI spends inserting one batch of results, seconds
+    MIN_RESULTS_BATCH_SIZE = 16  # size of results is count of rows: files and matches
+    MAX_RESULTS_BATCH_SIZE = 4096
+    MAX_PENDING_RESULTS_SIZE = 65536  # search is paused, if the GUI is not able to insert results fast enough
+    PROGRESS_EMIT_TIMEOUT = 0.25
+    POOL_CHUNK_SIZE = 64  # max count of files, sent to a worker process at once
+    POOL_STREAM_CHUNK_SIZE = 8  # count of files, sent to a worker, when total count is not known yet
+    POOL_CHUNKS_IN_FLIGHT = 4  # per worker process. Max count of chunks, sent to the workers, but not handled yet
+    PIPELINE_QUEUE_SIZE = 256  # max count of items, passed between search stages, but not processed yet
+    MAX_RESULTS_PER_FILE = 10000  # other matches in the file are counted, but not shown
 
     resultsAvailable = pyqtSignal(list)  # list of searchresultsmodel.FileResults
-    progressChanged = pyqtSignal(int, int)  # int value, int total
+    progressChanged = pyqtSignal(object)  # searchstats.SearchStats snapshot
     error = pyqtSignal(unicode)
 
+    _documentTextRequested = pyqtSignal(object, unicode)  # Queue.Queue for the answer, unicode file path
+    _resultsBatchReady = pyqtSignal(object, list)  # searchstats.SearchStats of the search, list of FileResults
+
+    def __init__(self):
+        StopableThread.__init__(self)
+        self._openedDocuments = {}
+        self._stats = searchstats.SearchStats()
+        self._errors = Queue.Queue()  # errors of all threads of the search. Emitted by the search thread
+        self._pipelineThreads = []  # (thread, consumerStopped event) of the pipeline stages of the current search
+        self._resultsBatchSize = self.MIN_RESULTS_BATCH_SIZE
+        self._resultsBatchHandled = threading.Event()
+        self._resultsBatchHandled.set()
+        # The thread object lives in the GUI thread, therefore the slots are called in the GUI thread
+        self._documentTextRequested.connect(self._onDocumentTextRequested, Qt.QueuedConnection)
+        self._resultsBatchReady.connect(self._onResultsBatchReady, Qt.QueuedConnection)
+
     def search(self, regExp, mask, inOpenedFiles, searchPath):
         """Start search process.
         context stores search text, directory and other parameters
@@ -67,174 +118,655 @@ class SearchThread(StopableThread):
         self.stop()
 
         self._regExp = regExp
+        self._pattern = literalsearch.optimized(regExp)  # used for search in files
+        self._prefilter = searchworker.makePrefilter(regExp)
         self._mask = mask
         self._inOpenedFiles = inOpenedFiles
         self._searchPath = searchPath
+        self._workerCount = self._configuredWorkerCount()
+        self._cacheDir = os.path.join(enki.core.defines.CONFIG_DIR, 'searchindex')
+        if core.config()['SearchReplace']['UseIndex']:
+            self._indexDir = self._cacheDir
+        else:
+            self._indexDir = None
+        self._vcsIgnore = core.config()['SearchReplace']['UseVcsIgnore']
+
+        if inOpenedFiles:
+            self._cachedFiles = None
+        else:
+            self._cachedFiles = core.fileListCache().files(searchPath, mask, self._vcsIgnore)
 
-        self._openedFiles = {}
+        if inOpenedFiles:
+            self._cachedResults = None
+        else:
+            self._cachedResults = _resultsCache.searchResults(self._searchKey())
+        self._cacheHits = collections.deque()  # FileResults or None, taken from self._cachedResults
+
+        # Text of the documents is not copied here, it would freeze the GUI, if big files are opened.
+        # The search thread requests text of every document, when it is going to search in it
+        self._openedDocuments = {}
         for document in core.workspace().documents():
             if document.filePath() is not None:
-                self._openedFiles[document.filePath()] = document.qutepart.text
+                self._openedDocuments[document.filePath()] = document
 
         self.start()
 
-    def _getFiles(self, path, maskRegExp, filterRegExp):
-        """Get recursive list of files from directory.
-        maskRegExp is regExp object for check if file matches mask
+    def _searchKey(self):
+        """Key of the search in the results cache. Contains all parameters, which affect the results
         """
-        retFiles = []
-
         try:
-            absPath = os.path.abspath(path)
+            root = os.path.abspath(self._searchPath)
         except OSError:  # current dir deleted
-            return []
+            root = self._searchPath
+        return (self._regExp.pattern,
+                self._regExp.flags,
+                tuple(self._mask),
+                root,
+                core.fileFilter().regExp().pattern,
+                self._vcsIgnore)
+
+    def _onDocumentTextRequested(self, answerQueue, fileName):
+        """Search thread requested text of an opened document. Executed in the GUI thread
+        """
+        document = self._openedDocuments.get(fileName)
+        if document is not None and \
+           document in core.workspace().documents():
+            text = document.qutepart.text
+        else:  # closed
+            text = None
+        answerQueue.put(text)
+
+    def _openedDocumentText(self, fileName):
+        """Get text of an opened document. Executed in the search thread.
+        The text is copied in the GUI thread, one document at a time, so the GUI is not blocked for long.
+        Returns None, if the document has been closed or search is being stopped
+        """
+        startTime = time.time()
+        answerQueue = Queue.Queue(1)
+        self._documentTextRequested.emit(answerQueue, fileName)
 
         try:
-            for root, dirs, files in os.walk(absPath, followlinks=True):  # pylint: disable=W0612
-                if root.startswith('.') or (os.path.sep + '.') in root:
-                    continue
-                for fileName in files:
-                    if fileName.startswith('.'):
-                        continue
-                    if maskRegExp and not maskRegExp.match(fileName):
-                        continue
-
-                    if filterRegExp.match(fileName):
-                        continue
-
-                    fullPath = os.path.join(root, fileName)
-                    if not os.path.isfile(fullPath):
-                        continue
-                    retFiles.append(root + os.path.sep + fileName)
+            while not self._exit:
+                try:
+                    return answerQueue.get(timeout=0.1)
+                except Queue.Empty:
+                    pass
+            return None
+        finally:
+            self._stats.addTime(searchstats.READ, time.time() - startTime)
 
-                if self._exit :
-                    break
+    def _iterFiles(self):
+        """Generator. Recursively walks the search directory and yields files.
+        If walking has been finished, the list of files is stored in the file list cache
+        """
+        files = []
+        watchedPaths = {}
+        try:
+            for fileName in filewalker.iterFiles(self._searchPath,
+                                                 self._maskRegExp(),
+                                                 core.fileFilter().regExp(),
+                                                 watchedPaths,
+                                                 lambda: self._exit,
+                                                 self._vcsIgnore):
+                files.append(fileName)
+                yield fileName
         except UnicodeDecodeError:  # from os.walk()
-            self.error.emit('Failed to build list of files. Unicode decode error. Is correct locale set?')
-            return []
-
-        return retFiles
+            self._reportError('Failed to build list of files. Unicode decode error. Is correct locale set?')
+            return
 
+        if not self._exit:
+            core.fileListCache().store(self._searchPath, self._mask, files, watchedPaths, self._vcsIgnore)
 
-    def _getFilesToScan(self):
-        """Get list of files for search.
+    def _getFiles(self):
+        """Get recursive list of files from the search directory.
+        Cached list is used, if available
         """
-        files = set()
+        if self._cachedFiles is not None:
+            return self._cachedFiles
+        else:
+            return list(self._iterFiles())
 
+    def _maskRegExp(self):
+        """Compile file name mask to regular expression. None if mask is not set
+        """
         if self._mask:
             regExPatterns = [fnmatch.translate(pat) for pat in self._mask]
             maskRegExpPattern = '(' + ')|('.join(regExPatterns) + ')'
-            maskRegExp = re.compile(maskRegExpPattern)
+            return re.compile(maskRegExpPattern)
         else:
-            maskRegExp = None
+            return None
+
+    def _getFilesToScan(self):
+        """Get list of files for search.
+        """
+        maskRegExp = self._maskRegExp()
 
         if self._inOpenedFiles:
-            files = self._openedFiles.keys()
+            files = self._openedDocuments.keys()
             if maskRegExp:
-                basenames = [os.path.basename(f) for f in files]
-                files = [f for f in basenames if maskRegExp.match(f)]
+                files = [f for f in files if maskRegExp.match(os.path.basename(f))]
             return files
         else:
-            path = self._searchPath
-            return self._getFiles(path, maskRegExp, core.fileFilter().regExp())
+            return self._getFiles()
 
-    def _fileContent(self, fileName):
-        """Read text from file
+    def _pipelineStage(self, function, items):
+        """Generator. Calls function for every item in a new thread and yields results.
+        Count of not consumed results is limited by PIPELINE_QUEUE_SIZE, therefore
+        a fast stage doesn't run far ahead of a slow one, and memory usage is bounded
         """
-        if fileName in self._openedFiles:
-            return self._openedFiles[ fileName ]
+        queue = Queue.Queue(self.PIPELINE_QUEUE_SIZE)
+        finished = object()
+        consumerStopped = threading.Event()
+
+        def put(item):
+            """Put item to the queue, unless search is being stopped
+            """
+            while not (self._exit or consumerStopped.is_set()):
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        def runStage():
+            """Thread function
+            """
+            try:
+                for item in items:
+                    if not put(function(item)):
+                        return
+            finally:
+                put(finished)
+
+        thread = threading.Thread(target=runStage)
+        thread.daemon = True
+        thread.start()
+        self._pipelineThreads.append((thread, consumerStopped))
 
         try:
-            with open(fileName, 'rb') as openedFile:
-                if _isBinary(openedFile):
-                    return ''
-                return unicode(openedFile.read(), 'utf8', errors = 'ignore')
-        except IOError as ex:
-            print ex
-            return ''
+            while not self._exit:
+                try:
+                    item = queue.get(timeout=0.1)
+                except Queue.Empty:
+                    if consumerStopped.is_set():  # stopped by _joinPipeline()
+                        break
+                    continue
+                if item is finished:
+                    break
+                yield item
+        finally:
+            consumerStopped.set()
 
-    def run(self):
-        """Start point of the code, running in thread.
-        Build list of files for search, than do search
+    def _joinPipeline(self):
+        """Stop and wait for the pipeline stage threads of the search.
+        Called before the file classes cache is saved, because the stages use it
+        """
+        for thread, consumerStopped in self._pipelineThreads:
+            consumerStopped.set()
+        for thread, consumerStopped in self._pipelineThreads:
+            thread.join()
+        self._pipelineThreads = []
+
+    def _fileContent(self, fileName, kind):
+        """Read text from file. kind is taken from the file classes cache, see _classifiedFiles().
+        Text of opened documents is taken from the editor.
+        Returns tuple (text or None, detected kind or None).
+        Might be called from the reader thread, therefore the caller stores the kind to the cache
+        """
+        if fileName in self._openedDocuments:
+            text = self._openedDocumentText(fileName)
+            if text is not None:
+                return text, None
+
+        return searchworker.readFile(fileName, self._prefilter, kind, self._stats)
+
+    def _loadFileClasses(self):
+        """Load file classes cache for the search directory. None, if searching in opened files
+        """
+        if self._inOpenedFiles:
+            return None
+
+        try:
+            root = os.path.abspath(self._searchPath)
+        except OSError:  # current dir deleted
+            root = self._searchPath
+        return fileclasses.FileClasses(self._cacheDir, root)
+
+    def _saveFileClasses(self):
+        """Save file classes cache.
+        Forget files, which are not in the directory anymore, if all files have been searched
+        """
+        if self._fileClasses is None:
+            return
+
+        if not (self._mask or self._exit or self._indexDir is not None):
+            self._fileClasses.prune()
+
+        error = self._fileClasses.save()
+        if error is not None:
+            self._reportError('Failed to save search cache: %s' % error)
+
+    def _updateFileClasses(self, fileName, key, kind):
+        """Store detected kind of the file to the cache. Called by the search thread
+        """
+        if self._fileClasses is not None:
+            self._fileClasses.update(fileName, key, kind)
+
+    def _classifiedFiles(self, files):
+        """Generator. Yields tuples (fileName, file key or None, file kind or None) for files, which shall be read.
+        Kinds are taken from the file classes cache.
+        Files, which haven't been changed since the same search, are not yielded,
+        their results are put to self._cacheHits.
+        Found files and their sizes are counted in the statistics
+        """
+        for fileName in files:
+            if self._fileClasses is None or \
+               fileName in self._openedDocuments:  # results depend on the editor text, not on the file
+                self._stats.fileFound(0)
+                yield fileName, None, None
+                continue
+
+            key, kind = self._fileClasses.lookup(fileName)
+            size = _keySize(key)
+            self._stats.fileFound(size)
+            found, fileRes = self._cachedResults.lookup(fileName, key)
+            if found:
+                if fileRes is not None:
+                    self._stats.fileDone(size, len(fileRes) + fileRes.skippedCount)
+                else:
+                    self._stats.fileDone(size)
+                self._cacheHits.append(fileRes)
+            else:
+                yield fileName, key, kind
+
+        if not self._exit:
+            self._stats.setEnumerationFinished()
+
+    def _timed(self, stage, iterable):
+        """Generator. Yields items of the iterable. Time of getting the items is added to the stage statistics
+        """
+        iterator = iter(iterable)
+        while True:
+            startTime = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._stats.addTime(stage, time.time() - startTime)
+            yield item
+
+    def _storeResults(self, fileName, key, fileRes):
+        """Put results of the file to the results cache
+        """
+        if self._cachedResults is not None:
+            self._cachedResults.store(fileName, key, fileRes)
+
+    def _createPool(self):
+        """Create pool of worker processes.
+        Returns None, if only one worker is configured, or if searching in opened files
+        """
+        if self._workerCount < 2 or \
+           self._inOpenedFiles:
+            return None
+
+        return multiprocessing.Pool(self._workerCount,
+                                    searchworker.initWorker,
+                                    (self._regExp, self.MAX_RESULTS_PER_FILE))
+
+    def _poolChunkSize(self, count):
+        """Count of files, sent to a worker process at once.
+        count is 0, if count of files is not known
+        """
+        if not count:
+            return self.POOL_STREAM_CHUNK_SIZE
+        return max(1, min(self.POOL_CHUNK_SIZE, count // (self._workerCount * 4)))
+
+    def _poolMap(self, pool, function, items, chunkSize):
+        """Generator. Calls function for every item in the worker processes and yields results in the order of items.
+        Unlike pool.imap(), items are taken by this thread, and only POOL_CHUNKS_IN_FLIGHT chunks per worker
+        are sent to the pool before their results are consumed, therefore the producer of items doesn't run far ahead
+        """
+        items = iter(items)
+        inFlight = collections.deque()
+        itemsFinished = False
+        while True:
+            while not itemsFinished and \
+                  len(inFlight) < self._workerCount * self.POOL_CHUNKS_IN_FLIGHT:
+                chunk = list(itertools.islice(items, chunkSize))
+                if chunk:
+                    inFlight.append(pool.map_async(function, chunk, len(chunk)))  # the chunk is one task
+                else:
+                    itemsFinished = True
+
+            if not inFlight:
+                return
+
+            asyncResult = inFlight.popleft()
+            while not asyncResult.ready():
+                if  self._exit :
+                    return
+                asyncResult.wait(0.1)
+
+            for res in asyncResult.get():
+                yield res
+
+    def _reportError(self, text):
+        """Remember error. It is emitted by the search thread with _emitErrors().
+        May be called from any thread of the search
+        """
+        self._errors.put(text)
+
+    def _emitErrors(self):
+        """Emit errors, reported by the search threads. Called by the search thread
+        """
+        while True:
+            try:
+                text = self._errors.get_nowait()
+            except Queue.Empty:
+                return
+            self.error.emit(text)
+
+    def _filterWithIndex(self, files, pool):
+        """Update trigram index and remove from the list files, which can't contain matches.
+        Opened files are always searched, because its text might differ from the file on disk
         """
-        startTime = time.clock()
-        self.progressChanged.emit( -1, 0 )
+        trigrams = trigramindex.requiredTrigrams(self._regExp)
+        if not trigrams:  # the pattern doesn't require any literal text, the index is useless
+            return files
+
+        try:
+            root = os.path.abspath(self._searchPath)
+        except OSError:  # current dir deleted
+            return files
+
+        index = trigramindex.TrigramIndex(self._indexDir, root)
+        staleFiles = index.staleFiles(files)
+        if pool is not None and len(staleFiles) > 1:
+            entries = self._poolMap(pool, searchworker.indexFile, staleFiles, self._poolChunkSize(len(staleFiles)))
+        else:
+            entries = itertools.imap(searchworker.indexFile, staleFiles)
 
-        files = sorted(self._getFilesToScan())
+        for fileName, mtime, size, packedTrigrams in entries:
+            if mtime is not None:
+                index.setEntry(fileName, mtime, size, packedTrigrams)
+            if  self._exit :
+                break
+
+        if not self._mask and not self._exit:
+            index.prune(files)
+
+        error = index.save()
+        if error is not None:
+            self._reportError('Failed to save search index: %s' % error)
+
+        candidates = set(index.candidates(files, trigrams))
+        return [fileName for fileName in files \
+                    if fileName in candidates or fileName in self._openedDocuments]
 
-        if  self._exit :
+    def _searchedFiles(self, items, count, pool):
+        """Generator. Searches in files and yields (fileName, file key, FileResults or None).
+        items are produced by _classifiedFiles().
+        If pool is not None, files are read and searched by the worker processes.
+        Opened documents are always searched by this thread, because their text might differ from the file.
+        Otherwise files are read in a separate thread, while the search thread searches in read files
+        """
+        if pool is None:
+            readFiles = self._pipelineStage(lambda item: (item[0], item[1]) + self._fileContent(item[0], item[2]),
+                                            items)
+            for fileName, key, content, kind in readFiles:
+                self._updateFileClasses(fileName, key, kind)
+                self._stats.fileDone(_keySize(key))
+                yield fileName, key, self._searchInFile(fileName, content)
             return
 
-        self.progressChanged.emit( 0, len(files))
+        openedItems = []
+
+        def notOpenedItems():
+            """Generator. Yields items for the worker processes, collects opened documents
+            """
+            for item in items:
+                if item[0] in self._openedDocuments:
+                    openedItems.append(item)
+                else:
+                    yield item
+
+        searchedFiles = self._poolMap(pool,
+                                      searchworker.searchFile,
+                                      notOpenedItems(),
+                                      self._poolChunkSize(count))
+        for fileName, key, matches, kind in self._timed(searchstats.CHECK, searchedFiles):
+            if  self._exit :
+                return
+            self._updateFileClasses(fileName, key, kind)
+            self._stats.fileDone(_keySize(key))
+            yield fileName, key, self._fileResults(fileName, matches)
+
+        for fileName, key, kind in openedItems:
+            if  self._exit :
+                return
+            content, kind = self._fileContent(fileName, kind)
+            self._updateFileClasses(fileName, key, kind)
+            self._stats.fileDone(_keySize(key))
+            yield fileName, key, self._searchInFile(fileName, content)
 
-        # Prepare data for search process
-        lastResultsEmitTime = time.clock()
-        notEmittedFileResults = []
+    def run(self):
+        """Start point of the code, running in thread.
+        Build list of files for search, than do search
+        """
+        self._stats = searchstats.SearchStats()
+        self.progressChanged.emit(self._stats.snapshot())
+
+        self._fileClasses = self._loadFileClasses()
+        pool = self._createPool()
+        try:
+            if self._inOpenedFiles or \
+               self._indexDir is not None:
+                files = sorted(self._getFilesToScan())
+                if not self._inOpenedFiles:
+                    files = self._filterWithIndex(files, pool)
+
+                if  self._exit :
+                    return
+
+                self._searchInFiles(files, len(files), pool)
+            elif self._cachedFiles is not None:
+                self._searchInFiles(self._cachedFiles, len(self._cachedFiles), pool)
+            else:
+                # Walk the directory and search in found files concurrently. Count of files is not known
+                files = self._pipelineStage(lambda fileName: fileName, self._iterFiles())
+                self._searchInFiles(files, 0, pool)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            self._joinPipeline()
+            self._saveFileClasses()
+            self._emitErrors()
+
+            self._stats.finish()
+            self.progressChanged.emit(self._stats.snapshot())
+            _logger.info('Search for "%s" in %s: %s', self._regExp.pattern, self._searchPath, self._stats)
+
+    def stats(self):
+        """Statistics of the current or the last search. searchstats.SearchStats
+        """
+        return self._stats.snapshot()
+
+    def _searchInFiles(self, files, count, pool):
+        """Search in the files and emit results.
+        files is a list or an iterator. count is 0, if it is not known
+        """
+        items = self._timed(searchstats.ENUMERATE, self._classifiedFiles(files))
+        if count:  # get sizes of all files now, to show progress in bytes
+            items = list(items)
+        self.progressChanged.emit(self._stats.snapshot())
+
+        lastResultsEmitTime = None  # first results are emitted immediately
+        lastProgressEmitTime = time.time()
+        self._resultsBatchHandled.set()
+        pendingResults = _PendingResults()
         # Search for all files
-        for fileIndex, fileName in enumerate(files):
-            results = self._searchInFile(fileName)
-            if  results:
-                newFileRes = searchresultsmodel.FileResults(self._searchPath,
-                                                            fileName,
-                                                            results)
-                notEmittedFileResults.append(newFileRes)
-
-            if notEmittedFileResults and \
-               (time.clock() - lastResultsEmitTime) > self.RESULTS_EMIT_TIMEOUT:
-                self.progressChanged.emit( fileIndex, len(files))
-                self.resultsAvailable.emit(notEmittedFileResults)
-                notEmittedFileResults = []
-                lastResultsEmitTime = time.clock()
+        for fileName, key, newFileRes in self._searchedFiles(items, count, pool):
+            if not self._exit:  # otherwise the results might be not complete
+                self._storeResults(fileName, key, newFileRes)
+            if newFileRes is not None:
+                self._stats.addMatches(len(newFileRes) + newFileRes.skippedCount)
+                pendingResults.append(newFileRes)
+            self._takeCacheHits(pendingResults)
+            self._emitErrors()
+
+            # Results are emitted in batches. Next batch is emitted when the GUI has inserted the previous one,
+            # and either enough time has passed, or enough results are collected
+            now = time.time()
+            if pendingResults and \
+               self._resultsBatchHandled.is_set() and \
+               (lastResultsEmitTime is None or \
+                (now - lastResultsEmitTime) > self.RESULTS_EMIT_INTERVAL or \
+                pendingResults.size >= self._resultsBatchSize):
+                self._emitResultsBatch(pendingResults)
+                lastResultsEmitTime = lastProgressEmitTime = now
+            elif (now - lastProgressEmitTime) > self.PROGRESS_EMIT_TIMEOUT:
+                self.progressChanged.emit(self._stats.snapshot())
+                lastProgressEmitTime = now
+
+            # Backpressure. Don't collect more results, than the GUI is able to insert
+            while pendingResults.size >= self.MAX_PENDING_RESULTS_SIZE and \
+                  not self._exit:
+                if self._resultsBatchHandled.wait(0.1):
+                    self._emitResultsBatch(pendingResults)
 
             if  self._exit :
-                self.progressChanged.emit( fileIndex, len(files))
                 break
 
-        if notEmittedFileResults:
-            self.resultsAvailable.emit(notEmittedFileResults)
+        if not self._exit:
+            self._takeCacheHits(pendingResults)
+
+        while pendingResults:
+            if self._exit:  # don't wait for the GUI, emit everything
+                self._resultsBatchReady.emit(self._stats, pendingResults.takeBatch(pendingResults.size))
+            elif self._resultsBatchHandled.wait(0.1):
+                self._emitResultsBatch(pendingResults)
+
+    def _emitResultsBatch(self, pendingResults):
+        """Emit next batch of results and progress. The GUI shall have handled the previous batch
+        """
+        self.progressChanged.emit(self._stats.snapshot())
+        self._resultsBatchHandled.clear()
+        self._resultsBatchReady.emit(self._stats, pendingResults.takeBatch(self._resultsBatchSize))
+
+    def _onResultsBatchReady(self, stats, fileResults):
+        """Batch of results has been emitted by the search thread. Executed in the GUI thread.
+        Results are passed to the model. Size of the next batch is adjusted,
+        so inserting of a batch takes approximately RESULTS_INSERT_TIME.
+        Batches of a previous search, delivered after the next search has been started, are ignored
+        """
+        if stats is not self._stats:
+            return
+
+        startTime = time.time()
+        self.resultsAvailable.emit(fileResults)
+        insertTime = time.time() - startTime
+        self._stats.addTime(searchstats.EMIT, insertTime)
 
-    def _searchInFile(self, fileName):
-        """Search in the file and return searchresultsmodel.Result s
+        batchSize = sum([_resultsSize(fileRes) for fileRes in fileResults])
+        if insertTime > 0:
+            optimalSize = int(batchSize * self.RESULTS_INSERT_TIME / insertTime)
+        else:
+            optimalSize = batchSize * 2
+        self._resultsBatchSize = max(self.MIN_RESULTS_BATCH_SIZE,
+                                     min(self.MAX_RESULTS_BATCH_SIZE,
+                                         optimalSize,
+                                         self._resultsBatchSize * 2))  # grow smoothly
+        self._resultsBatchHandled.set()
+
+    def _takeCacheHits(self, fileResults):
+        """Move results, taken from the results cache by _classifiedFiles(), to the fileResults list
         """
-        lastPos = 0
-        eolCount = 0
-        results = []
-        eol = "\n"
+        while True:
+            try:
+                fileRes = self._cacheHits.popleft()
+            except IndexError:
+                return
+            if fileRes is not None:
+                fileResults.append(fileRes)
+
+    def _searchInFile(self, fileName, content):
+        """Search in the file content.
+        Returns searchresultsmodel.FileResults or None, if nothing found.
+        Only first MAX_RESULTS_PER_FILE matches are stored, others are only counted
+        """
+        startTime = time.time()
+        matches = searchworker.searchText(self._pattern, content, self.MAX_RESULTS_PER_FILE, lambda: self._exit)
+        self._stats.addTime(searchstats.MATCH, time.time() - startTime)
+        return self._fileResults(fileName, matches)
+
+    def _fileResults(self, fileName, matches):
+        """Create searchresultsmodel.FileResults from matches, found by searchworker.searchText().
+        None, if nothing found
+        """
+        if matches is None:
+            return None
+        return searchresultsmodel.FileResults(self._searchPath, fileName, *matches)
 
-        content = self._fileContent( fileName )
 
-        # Process result for all occurrences
-        for match in self._regExp.finditer(content):
-            start = match.start()
+def _resultsSize(fileRes):
+    """Size of results of a file is count of rows in the results view: a row for the file and rows for the matches
+    """
+    return 1 + len(fileRes)
 
-            eolStart = content.rfind( eol, 0, start)
-            eolEnd = content.find( eol, start + len(match.group(0)))
-            eolCount += content[lastPos:start].count( eol )
-            lastPos = start
 
-            wholeLine = content[eolStart+1 : eolEnd]
-            column = start - eolStart
-            if eolStart != 0:
-                column -= 1
+class _PendingResults:
+    """Results, found by the search thread, but not emitted yet
+    """
+    def __init__(self):
+        self._fileResults = collections.deque()
+        self.size = 0  # total size of results, see _resultsSize()
+
+    def __len__(self):
+        return len(self._fileResults)
 
-            result = searchresultsmodel.Result( fileName = fileName, \
-                             wholeLine = wholeLine, \
-                             line = eolCount, \
-                             column = column, \
-                             match=match)
-            results.append(result)
+    def append(self, fileRes):
+        """Add FileResults
+        """
+        self._fileResults.append(fileRes)
+        self.size += _resultsSize(fileRes)
 
-            if self._exit:
+    def takeBatch(self, maxSize):
+        """Take results from the beginning of the queue. Total size of the batch is not bigger than maxSize,
+        but at least one FileResults is taken
+        """
+        batch = []
+        batchSize = 0
+        while self._fileResults:
+            fileResSize = _resultsSize(self._fileResults[0])
+            if batch and batchSize + fileResSize > maxSize:
                 break
-        return results
+            batch.append(self._fileResults.popleft())
+            batchSize += fileResSize
+
+        self.size -= batchSize
+        return batch
+
+
+def _keySize(key):
+    """Get file size from file key of fileclasses.FileClasses. 0 if the key is None
+    """
+    if key is None:
+        return 0
+    return key[2]
 
 
 class ReplaceThread(StopableThread):
     """Thread does replacements in the directory according to checked items
 
-    Replacements in opened documents are done by GUI thread, in other - by new thread
+    Replacements in opened documents are done by GUI thread, in other - by a pool of worker processes
     """
-    resultsHandled = pyqtSignal(unicode, list)
+    RESULTS_HANDLED_EMIT_TIMEOUT = 0.5
+    POOL_CHUNK_SIZE = 16  # max count of files, sent to a worker process at once
+
+    resultsHandled = pyqtSignal(dict)  # {file path: list of searchresultsmodel.Result}
     finalStatus = pyqtSignal(unicode)
     error = pyqtSignal(unicode)
 
@@ -244,98 +776,123 @@ class ReplaceThread(StopableThread):
         self.stop()
 
         self._replaceText = replaceText
-        self._totalCount = sum([len(v) for v in results.itervalues()])
+        self._replacedCount = 0
+        self._replacedFilesCount = 0
+        self._writtenBytes = 0
+        self._workerCount = self._configuredWorkerCount()
+        self._startTime = time.time()
 
         # do replacements in opened files, prepare for replacing in not opened
         self._results = {}
+        handled = {}
         for filePath, matches in results.iteritems():
             foundDocument = core.workspace().findDocumentForPath(filePath)
             if foundDocument is not None:
                 self._replaceInOpenedDocument(foundDocument, matches)
-                self.resultsHandled.emit( filePath, matches)
+                handled[filePath] = matches
             else:
                 self._results[filePath] = matches
 
+        if handled:
+            self.resultsHandled.emit(handled)
+
         self.start()
 
-    def _replaceInOpenedDocument(self, document, matches):
-        """Do replacements in opened document
+    @staticmethod
+    def _matchesForWorker(matches):
+        """Convert list of searchresultsmodel.Result to list of tuples, which are sent to worker processes
         """
-        pos = document.qutepart.cursorPosition
-        oldText = document.qutepart.text
-        document.qutepart.text = self._doReplacements(document.qutepart.text, matches)
-        if oldText != document.qutepart.text:
-            document.qutepart.document().setModified(True)
-        document.qutepart.cursorPosition = pos
+        return [(result.start, result.end, result.groups) for result in matches]
 
-    def _saveContent(self, fileName, content):
-        """Write text to the file
+    def _replaceInOpenedDocument(self, document, matches):
+        """Do replacements in opened document.
+        Only matched text is edited, all replacements are one undoable action
         """
-        try:
-            content = content.encode('utf8')
-        except UnicodeEncodeError as ex:
-            pattern = self.tr("Failed to encode file to utf8: %s")
-            text = unicode(str(ex), 'utf8')
-            self.error.emit(pattern % text)
+        qpart = document.qutepart
+        replacements = list(replaceworker.iterReplacements(qpart.text,
+                                                           self._replaceText,
+                                                           self._matchesForWorker(matches)))
+        self._countReplaced(document.filePath(), len(replacements), len(matches) - len(replacements), 0)
+        if not replacements:
             return
 
-        try:
-            with open(fileName, 'wb') as openFile:
-                openFile.write(content)
-        except IOError as ex:
-            pattern = self.tr("Error while saving replaced content: %s")
-            text = unicode(str(ex), 'utf8')
-            self.error.emit(pattern % text)
+        pos = qpart.cursorPosition
+        with qpart:
+            for start, end, replacement in reversed(replacements):  # from end, edits don't move previous positions
+                qpart.replaceText(start, end - start, replacement)
+        qpart.cursorPosition = pos
 
-    def _fileContent(self, fileName):
-        """Read file
+    def _countReplaced(self, fileName, replacedCount, outdatedCount, writtenBytes):
+        """Update statistics. Report not replaced matches
         """
-        try:
-            with open(fileName, 'rb') as openFile:
-                content = openFile.read()
-        except IOError as ex:
-            self.error.emit( self.tr( "Error opening file: %s" % str(ex) ) )
-            return ''
-
-        try:
-            return unicode(content, 'utf8')
-        except UnicodeDecodeError as ex:
-            self.error.emit(self.tr( "File %s not read: unicode error '%s'. File may be corrupted" % \
-                            (fileName, str(ex) ) ))
+        self._replacedCount += replacedCount
+        self._writtenBytes += writtenBytes
+        if replacedCount:
+            self._replacedFilesCount += 1
+        if outdatedCount:
+            self.error.emit(self.tr("%d match(es) not replaced in %s. File has been modified after search" % \
+                                    (outdatedCount, fileName)))
+
+    def _createPool(self):
+        """Create pool of worker processes.
+        Returns None, if only one worker is configured, or if there are not enough files
+        """
+        if self._workerCount < 2 or \
+           len(self._results) < 2:
             return None
 
+        return multiprocessing.Pool(self._workerCount, replaceworker.initWorker, (self._replaceText,))
+
     def run(self):
-        """Start point of the code, running i thread
+        """Start point of the code, running in thread
         Does thread job
         """
-        startTime = time.clock()
-
-        for fileName in self._results.keys():
-            content = self._fileContent(fileName)
-            if content is None:  # if failed to read file
-                continue
-
-            matches = self._results[ fileName ]
+        items = [(fileName, self._matchesForWorker(matches)) \
+                    for fileName, matches in self._results.iteritems()]
 
-            content = self._doReplacements(content, matches)
-
-            self._saveContent(fileName, content)
+        pool = self._createPool()
+        try:
+            if pool is not None:
+                chunkSize = max(1, min(self.POOL_CHUNK_SIZE, len(items) // (self._workerCount * 4)))
+                replacedFiles = pool.imap_unordered(replaceworker.replaceInFile, items, chunkSize)
+            else:
+                replaceworker.initWorker(self._replaceText)
+                replacedFiles = itertools.imap(replaceworker.replaceInFile, items)
+
+            self._handleReplacedFiles(replacedFiles)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        elapsed = time.time() - self._startTime
+        self.finalStatus.emit("%d replacements in %d file(s) in %.1f second(s), %.1f files/s, %.1f MB/s" % \
+                              (self._replacedCount,
+                               self._replacedFilesCount,
+                               elapsed,
+                               self._replacedFilesCount / max(elapsed, 0.001),
+                               self._writtenBytes / max(elapsed, 0.001) / (1024 * 1024)))
+
+    def _handleReplacedFiles(self, replacedFiles):
+        """Collect results of worker processes, emit handled results in batches
+        """
+        lastEmitTime = time.time()
+        handled = {}
+        for fileName, replacedCount, outdatedCount, writtenBytes, error in replacedFiles:
+            if error is not None:
+                self.error.emit(error)
+            else:
+                self._countReplaced(fileName, replacedCount, outdatedCount, writtenBytes)
+                handled[fileName] = self._results[fileName]
 
-            self.resultsHandled.emit( fileName, matches)
+            if handled and \
+               (time.time() - lastEmitTime) > self.RESULTS_HANDLED_EMIT_TIMEOUT:
+                self.resultsHandled.emit(handled)
+                handled = {}
+                lastEmitTime = time.time()
 
             if  self._exit :
                 break
 
-        self.finalStatus.emit("%d replacements in %d second(s)" % \
-                              (self._totalCount,
-                               time.clock() - startTime))
-
-    def _doReplacements(self, content, matches):
-        """Do replacements for one file
-        """
-        for result in matches[::-1]:  # count from end to begin because we are replacing by offset in content
-            replaceTextWithMatches = substitutions.makeSubstitutions(self._replaceText,
-                                                                     result.match)
-            content = content[:result.match.start()] + replaceTextWithMatches + content[result.match.end():]
-
-        return content
+        if handled:
+            self.resultsHandled.emit(handled)
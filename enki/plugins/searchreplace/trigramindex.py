@@ -0,0 +1,246 @@
+"""
+trigramindex --- Persistent trigram index for search in directory
+=================================================================
+
+Index stores a set of trigrams (3-byte sequences) of every file under the search root.
+A file can contain a match of a pattern only if it contains all trigrams of the literal
+text, which is required by the pattern. Checking the sets is much cheaper than reading files.
+
+The index is updated incrementally. Only files with changed modification time or size are reindexed.
+
+Trigrams are built from lower case UTF-8 text, therefore the same index is used for
+case sensitive and case insensitive search.
+
+Module doesn't depend on Qt, it is used by search worker processes
+"""
+
+import os
+import os.path
+import hashlib
+import cPickle
+import sre_parse
+import sre_constants
+
+_TRIGRAM_LEN = 3
+_SCAN_CHUNK_SIZE = 64 * 1024
+
+
+def _packTrigrams(data):
+    """Build sorted string of unique trigrams of data. Every trigram takes 3 bytes
+
+    Data is scanned by chunks and trigrams are deduplicated after every chunk,
+    so memory usage doesn't depend on the data size
+    """
+    trigrams = set()
+    last = len(data) - _TRIGRAM_LEN + 1
+    for start in xrange(0, last, _SCAN_CHUNK_SIZE):
+        end = min(start + _SCAN_CHUNK_SIZE, last)
+        trigrams.update([data[i:i + _TRIGRAM_LEN] for i in xrange(start, end)])
+    return ''.join(sorted(trigrams))
+
+
+def _containsTrigram(packed, trigram):
+    """Binary search of a trigram in the string, created by _packTrigrams()
+    """
+    low = 0
+    high = len(packed) // _TRIGRAM_LEN
+    while low < high:
+        middle = (low + high) // 2
+        offset = middle * _TRIGRAM_LEN
+        current = packed[offset:offset + _TRIGRAM_LEN]
+        if current < trigram:
+            low = middle + 1
+        elif current > trigram:
+            high = middle
+        else:
+            return True
+    return False
+
+
+def textTrigrams(text):
+    """Get packed trigrams of a unicode text
+    """
+    return _packTrigrams(text.lower().encode('utf8'))
+
+
+def _requiredLiterals(subpattern):
+    """Get list of literal unicode strings, which must be present in any match of parsed regular expression
+    """
+    literals = []
+    current = []
+
+    def isPlainLiteral(items):
+        return all([op in (sre_constants.LITERAL, sre_constants.AT) for op, av in items])
+
+    for op, av in subpattern:
+        if op == sre_constants.LITERAL:
+            current.append(unichr(av))
+        elif op == sre_constants.AT:  # zero-width assertion doesn't break the literal
+            pass
+        elif op == sre_constants.SUBPATTERN and isPlainLiteral(av[-1]):
+            current.extend([unichr(itemAv) for itemOp, itemAv in av[-1] \
+                                if itemOp == sre_constants.LITERAL])
+        else:
+            if current:
+                literals.append(u''.join(current))
+                current = []
+            if op == sre_constants.SUBPATTERN:
+                literals.extend(_requiredLiterals(av[-1]))
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+                literals.extend(_requiredLiterals(av[2]))
+
+    if current:
+        literals.append(u''.join(current))
+
+    return literals
+
+
+def requiredLiterals(regExp):
+    """Get list of unicode strings, which must be present in any match of the regExp.
+    Empty list means, nothing is required
+    """
+    try:
+        parsed = sre_parse.parse(regExp.pattern, regExp.flags)
+    except (sre_constants.error, ValueError, OverflowError):
+        return []
+
+    return _requiredLiterals(parsed)
+
+
+def requiredTrigrams(regExp):
+    """Get list of trigrams, which must be present in a file, if it contains a match of the regExp.
+    Empty list means, the index can't be used for this pattern
+    """
+    trigrams = set()
+    for literal in requiredLiterals(regExp):
+        data = literal.lower().encode('utf8')
+        for i in xrange(len(data) - _TRIGRAM_LEN + 1):
+            trigrams.add(data[i:i + _TRIGRAM_LEN])
+
+    return sorted(trigrams)
+
+
+class TrigramIndex:
+    """Index of files in one search root. Stored in indexDir
+    """
+    MAX_INDEXED_FILE_SIZE = 4 * 1024 * 1024  # Bigger files are not indexed and always searched
+
+    _FORMAT_VERSION = 1
+
+    def __init__(self, indexDir, root):
+        self._indexDir = indexDir
+        self._root = root
+        self._filePath = os.path.join(indexDir,
+                                      hashlib.md5(root.encode('utf8')).hexdigest() + '.trigrams')
+        self._entries = self._load()  # { file path: (mtime, size, packed trigrams or None) }
+        self._modified = False
+
+    def _load(self):
+        """Load index from the disk. Returns empty index if failed
+        """
+        try:
+            with open(self._filePath, 'rb') as indexFile:
+                version, root, entries = cPickle.load(indexFile)
+        except (IOError, OSError, EOFError, ValueError, TypeError, cPickle.UnpicklingError):
+            return {}
+
+        if version != self._FORMAT_VERSION or root != self._root:
+            return {}
+
+        return entries
+
+    def save(self):
+        """Save index to the disk, if it has been modified.
+        Returns error text or None
+        """
+        if not self._modified:
+            return None
+
+        tmpPath = self._filePath + '.tmp'
+        try:
+            if not os.path.isdir(self._indexDir):
+                os.makedirs(self._indexDir)
+            with open(tmpPath, 'wb') as indexFile:
+                cPickle.dump((self._FORMAT_VERSION, self._root, self._entries),
+                             indexFile,
+                             cPickle.HIGHEST_PROTOCOL)
+            if os.name == 'nt' and os.path.exists(self._filePath):
+                os.remove(self._filePath)
+            os.rename(tmpPath, self._filePath)
+        except (IOError, OSError) as ex:
+            return unicode(str(ex), 'utf8')
+
+        self._modified = False
+        return None
+
+    def staleFiles(self, files):
+        """Get list of files, which are not indexed or have been modified since indexing
+        """
+        stale = []
+        for fileName in files:
+            entry = self._entries.get(fileName)
+            if entry is None:
+                stale.append(fileName)
+                continue
+
+            try:
+                stat = os.stat(fileName)
+            except OSError:
+                del self._entries[fileName]
+                self._modified = True
+                continue
+
+            if entry[0] != stat.st_mtime or entry[1] != stat.st_size:
+                stale.append(fileName)
+
+        return stale
+
+    def setEntry(self, fileName, mtime, size, packedTrigrams):
+        """Set index data for a file. packedTrigrams is None for not indexed files
+        """
+        self._entries[fileName] = (mtime, size, packedTrigrams)
+        self._modified = True
+
+    def prune(self, files):
+        """Remove from the index all files, which are not in the list
+        """
+        existing = set(files)
+        for fileName in self._entries.keys():
+            if not fileName in existing:
+                del self._entries[fileName]
+                self._modified = True
+
+    def candidates(self, files, trigrams):
+        """Filter list of files. Return only files, which might contain all trigrams
+        """
+        candidates = []
+        for fileName in files:
+            entry = self._entries.get(fileName)
+            if entry is None or entry[2] is None:
+                candidates.append(fileName)
+                continue
+
+            packed = entry[2]
+            for trigram in trigrams:
+                if not _containsTrigram(packed, trigram):
+                    break
+            else:
+                candidates.append(fileName)
+
+        return candidates
+
+
+def indexFile(fileName, readFileContent):
+    """Build index entry for a file.
+    readFileContent is a function, which returns file text, as it is searched.
+    Returns tuple (fileName, mtime, size, packed trigrams or None)
+    """
+    try:
+        stat = os.stat(fileName)
+    except OSError:
+        return fileName, None, None, None
+
+    if stat.st_size > TrigramIndex.MAX_INDEXED_FILE_SIZE:
+        return fileName, stat.st_mtime, stat.st_size, None
+
+    return fileName, stat.st_mtime, stat.st_size, textTrigrams(readFileContent(fileName))
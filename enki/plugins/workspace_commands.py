@@ -1,13 +1,13 @@
 """
-workspace_commands --- Open, SaveAs, GotoLine commands
-======================================================
+workspace_commands --- Open, FindFile, SaveAs, GotoLine commands
+================================================================
 """
 
 import os.path
 import glob
 
 from enki.core.core import core
-from enki.lib.pathcompleter import makeSuitableCompleter, PathCompleter
+from enki.lib.pathcompleter import makeSuitableCompleter, FuzzyPathCompleter, PathCompleter
 
 from enki.core.locator import AbstractCommand
 
@@ -208,6 +208,80 @@ class CommandOpen(AbstractCommand):
                 core.workspace().createEmptyNotSavedDocument(path)
 
 
+class CommandFindFile(AbstractCommand):
+    """Find file command. Opens a file from the current directory or its subdirectories
+    by a part of its path
+    """
+
+    @staticmethod
+    def signature():
+        """Command signature. For Help
+        """
+        return 'p NAME'
+
+    @staticmethod
+    def description():
+        """Command description. For Help
+        """
+        return 'Find file in the project. Letters may be skipped'
+
+    @staticmethod
+    def pattern():
+        """pyparsing pattern
+        """
+        from pyparsing import CharsNotIn, Literal, Optional, White  # delayed import, performance optimization
+
+        name = CharsNotIn(" \t")("name")
+
+        pat = Literal('p ') + Optional(White()) + Optional(name)
+        pat.leaveWhitespace()
+        pat.setParseAction(CommandFindFile.create)
+        return pat
+
+    @staticmethod
+    def create(str, loc, tocs):
+        """pyparsing callback. Creates an instance of command
+        """
+        return [CommandFindFile(tocs.name or '')]
+
+    def __init__(self, name):
+        self._name = name
+        self._completer = None
+
+    def completer(self, text, pos):
+        """Command completer. Returns FuzzyPathCompleter.
+        It is constructed by the Locator thread and reused by isReadyToExecute() and execute()
+        """
+        self._completer = FuzzyPathCompleter(self._name)
+        return self._completer
+
+    def constructCommand(self, completableText):
+        """Construct Open command by path
+        """
+        return 'f ' + completableText
+
+    def _bestMatch(self):
+        """Best matching file or None.
+        Executed in the GUI thread, therefore the tree is not walked here. If the Locator hasn't constructed
+        the completer for this command, already built index of files is used
+        """
+        if self._completer is None:
+            self._completer = FuzzyPathCompleter(self._name, walk=False)
+        return self._completer.bestMatch()
+
+    def isReadyToExecute(self):
+        """Check if command is complete and ready to execute
+        """
+        return self._bestMatch() is not None
+
+    def execute(self):
+        """Open the best matching file
+        """
+        path = self._bestMatch()
+        if path is not None:
+            core.workspace().goTo(path)
+
+
 class CommandSaveAs(AbstractCommand):
     """Save As Locator command
     """
@@ -299,11 +373,11 @@ class Plugin:
     """Plugin interface
     """
     def __init__(self):
-        for comClass in (CommandGotoLine, CommandOpen, CommandSaveAs):
+        for comClass in (CommandGotoLine, CommandOpen, CommandFindFile, CommandSaveAs):
             core.locator().addCommandClass(comClass)
 
     def del_(self):
         """Explicitly called destructor
         """
-        for comClass in (CommandGotoLine, CommandOpen, CommandSaveAs):
+        for comClass in (CommandGotoLine, CommandOpen, CommandFindFile, CommandSaveAs):
             core.locator().removeCommandClass(comClass)
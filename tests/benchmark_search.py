@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+"""
+Benchmark of search and replace in directory and of found items highlighting.
+
+Synthetic trees are generated in a temporary directory:
+
+* small  - many small text files
+* huge   - few huge text files
+* deep   - deeply nested directories
+* binary - text files mixed with binary files
+* vcs    - a repository, most of files are in directories, ignored by .gitignore
+
+Operations:
+
+* search    - search in directory. Time to the first result is measured too
+* research  - the same search repeated. Shows effect of the results cache
+* replace   - replace all found items
+* highlight - highlight all items in a big document and update matches on edits
+* literal   - find all occurrences of plain text in a big document with re and with the literal search fast path
+* walk      - build list of files with and without .gitignore rules
+
+Every benchmark is executed in a separate process, therefore peak RSS is measured per benchmark.
+The GUI is not created, DISPLAY is not required. The literal and walk operations don't need PyQt4,
+other operations need it. Run from the tests directory:
+
+    ./benchmark_search.py
+    ./benchmark_search.py --tree small --tree huge --operation search --workers 4
+"""
+
+import sys
+import os
+import os.path
+import json
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+from optparse import OptionParser, SUPPRESS_HELP
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+TREES = ('small', 'huge', 'deep', 'binary', 'vcs')
+OPERATIONS = ('search', 'research', 'replace', 'highlight', 'literal', 'walk')
+
+PATTERN = r'needle\w*'
+LITERAL = 'needle'
+REPLACEMENT = 'pin'
+
+_WORDS = ('alpha', 'beta', 'gamma', 'delta', 'def', 'class', 'return', 'import', 'self', 'value',
+          'index', 'result', 'print', 'for', 'in', 'if', 'else', 'while', 'lambda', 'yield')
+
+
+def _makeLines(rand, count):
+    """Generate lines of text. Every 50th line contains the searched pattern
+    """
+    lines = []
+    for index in range(count):
+        words = [rand.choice(_WORDS) for i in range(rand.randint(3, 12))]
+        if index % 50 == 0:
+            words.insert(rand.randint(0, len(words)), 'needle%d' % index)
+        lines.append('    ' * rand.randint(0, 3) + ' '.join(words) + '\n')
+    return lines
+
+
+def _writeTextFile(rand, lines, path, size):
+    """Write text file of approximately size bytes, built from lines
+    """
+    chunk = []
+    chunkSize = 0
+    index = rand.randint(0, len(lines) - 1)
+    with open(path, 'wb') as file_:
+        while size > 0:
+            line = lines[index % len(lines)]
+            chunk.append(line)
+            chunkSize += len(line)
+            size -= len(line)
+            index += 1
+            if chunkSize > 65536 or size <= 0:
+                file_.write(''.join(chunk))
+                chunk = []
+                chunkSize = 0
+
+
+def _writeBinaryFile(rand, path, size):
+    """Write a binary file. It contains the pattern too, but must be skipped
+    """
+    with open(path, 'wb') as file_:
+        file_.write('\x00\x01\x02needle' + os.urandom(size))
+
+
+def generateTree(name, root, scale):
+    """Generate a synthetic tree. Returns root
+    """
+    rand = random.Random(name)  # the same tree on every run
+    lines = _makeLines(rand, 20000)
+
+    if name == 'small':
+        for index in range(int(10000 * scale)):
+            dirPath = os.path.join(root, 'dir%d' % (index % 200))
+            if not os.path.isdir(dirPath):
+                os.makedirs(dirPath)
+            _writeTextFile(rand, lines, os.path.join(dirPath, 'file%d.py' % index), 2048)
+    elif name == 'huge':
+        os.makedirs(root)
+        for index in range(4):
+            _writeTextFile(rand, lines, os.path.join(root, 'huge%d.txt' % index), int(25 * 1024 * 1024 * scale))
+    elif name == 'deep':
+        dirPath = root
+        for depth in range(int(40 * scale) or 1):
+            dirPath = os.path.join(dirPath, 'level%d' % depth)
+            for branch in range(5):
+                branchPath = os.path.join(dirPath, 'branch%d' % branch)
+                os.makedirs(branchPath)
+                for index in range(20):
+                    _writeTextFile(rand, lines, os.path.join(branchPath, 'file%d.c' % index), 4096)
+    elif name == 'binary':
+        for index in range(int(4000 * scale)):
+            dirPath = os.path.join(root, 'dir%d' % (index % 40))
+            if not os.path.isdir(dirPath):
+                os.makedirs(dirPath)
+            if index % 2:
+                _writeBinaryFile(rand, os.path.join(dirPath, 'file%d.bin' % index), 16384)
+            else:
+                _writeTextFile(rand, lines, os.path.join(dirPath, 'file%d.txt' % index), 4096)
+    elif name == 'vcs':
+        os.makedirs(os.path.join(root, '.git'))
+        with open(os.path.join(root, '.gitignore'), 'w') as file_:
+            file_.write('node_modules/\nbuild/\n')
+        for index in range(int(10000 * scale)):
+            dirPath = os.path.join(root, ('node_modules', 'build')[index % 2], 'package%d' % (index % 400))
+            if not os.path.isdir(dirPath):
+                os.makedirs(dirPath)
+            _writeTextFile(rand, lines, os.path.join(dirPath, 'file%d.js' % index), 1024)
+        for index in range(int(400 * scale)):
+            dirPath = os.path.join(root, 'src', 'dir%d' % (index % 20))
+            if not os.path.isdir(dirPath):
+                os.makedirs(dirPath)
+            _writeTextFile(rand, lines, os.path.join(dirPath, 'file%d.py' % index), 2048)
+    else:
+        raise ValueError('Unknown tree ' + name)
+
+    return root
+
+
+def _treeSize(root):
+    """Get tuple (count of files, size in bytes)
+    """
+    count = 0
+    size = 0
+    for dirPath, dirNames, fileNames in os.walk(root):
+        for fileName in fileNames:
+            count += 1
+            size += os.path.getsize(os.path.join(dirPath, fileName))
+    return count, size
+
+
+class _HeadlessWorkspace:
+    """Workspace without opened documents
+    """
+    def documents(self):
+        """No documents
+        """
+        return []
+
+    def findDocumentForPath(self, filePath):
+        """Nothing found
+        """
+        return None
+
+
+def _headlessFileFilter(config):
+    """Create file filter, configured from the default config.
+    The class is defined here, because PyQt4 is imported only by _initHeadlessCore()
+    """
+    import fnmatch
+    import re
+    from PyQt4.QtCore import pyqtSignal, QObject
+
+    class _HeadlessFileFilter(QObject):
+        """File filter without the settings dialog
+        """
+        regExpChanged = pyqtSignal()
+
+        def __init__(self):
+            QObject.__init__(self)
+            patterns = [fnmatch.translate(f) for f in config['NegativeFileFilter']]
+            self._regExp = re.compile('(' + ')|('.join(patterns) + ')')
+
+        def regExp(self):
+            """Negative file filter reg exp
+            """
+            return self._regExp
+
+    return _HeadlessFileFilter()
+
+
+def _initHeadlessCore(configDir, workers, useIndex):
+    """Create core objects, used by search and replace threads. Returns QApplication
+    """
+    import sip
+    sip.setapi('QString', 2)
+    sip.setapi('QVariant', 2)
+
+    from PyQt4.QtGui import QApplication
+    app = QApplication(sys.argv, False)  # no GUI, doesn't connect to the display
+
+    import enki.core.defines
+    enki.core.defines.CONFIG_DIR = configDir  # caches and the index are created here
+
+    from enki.core.core import core, _DEFAULT_CONFIG_PATH
+    import enki.core.config
+
+    config = enki.core.config.Config(False, _DEFAULT_CONFIG_PATH)
+    config['SearchReplace']['WorkerCount'] = workers
+    config['SearchReplace']['UseIndex'] = useIndex
+    core.initHeadless(config, _HeadlessWorkspace(), _headlessFileFilter(config))
+
+    return app
+
+
+def _runThread(app, thread, start):
+    """Call start() and run the event loop until the thread has finished
+    """
+    thread.finished.connect(app.quit)
+    start()
+    app.exec_()
+
+
+def _search(app, root):
+    """Search in the directory. Returns tuple (list of FileResults, elapsed seconds, seconds to the first result)
+    """
+    import re
+    from enki.plugins.searchreplace.threads import SearchThread
+
+    thread = SearchThread()
+    fileResults = []
+    firstResultTime = []
+
+    def onResultsAvailable(results):
+        if not firstResultTime:
+            firstResultTime.append(time.time())
+        fileResults.extend(results)
+
+    thread.resultsAvailable.connect(onResultsAvailable)
+    startTime = time.time()
+    _runThread(app, thread, lambda: thread.search(re.compile(PATTERN), [], False, root))
+    endTime = time.time()
+
+    return fileResults, endTime - startTime, (firstResultTime[0] - startTime) if firstResultTime else None
+
+
+def _replace(app, fileResults):
+    """Replace all found items. Returns tuple (count of replaced files, written bytes, elapsed seconds)
+    """
+    from enki.plugins.searchreplace.threads import ReplaceThread
+
+    items = {}
+    for fileRes in fileResults:
+        items[fileRes.fileName] = [fileRes.result(row) for row in range(len(fileRes))]
+
+    thread = ReplaceThread()
+    startTime = time.time()
+    _runThread(app, thread, lambda: thread.replace(items, REPLACEMENT))
+    elapsed = time.time() - startTime
+
+    return thread._replacedFilesCount, thread._writtenBytes, elapsed
+
+
+class _TextDocumentEditor:
+    """Object with Qutepart interface, used by the matcher, without a widget
+    """
+    def __init__(self, text):
+        from PyQt4.QtGui import QTextDocument
+        self._document = QTextDocument()
+        self._document.setPlainText(text)
+
+    def document(self):
+        """QTextDocument
+        """
+        return self._document
+
+    @property
+    def text(self):
+        """Whole text
+        """
+        return self._document.toPlainText()
+
+
+def _highlight(lineCount=200000, editCount=200):
+    """Find all matches in a big document, then update them on edits.
+    Returns dictionary of measurements
+    """
+    import re
+    from PyQt4.QtGui import QTextCursor
+    from enki.plugins.searchreplace import incrementalmatcher
+
+    rand = random.Random('highlight')
+    text = ''.join(_makeLines(rand, lineCount))
+    editor = _TextDocumentEditor(text)
+    regExp = re.compile(PATTERN)
+
+    matcher = incrementalmatcher.IncrementalMatcher()
+    startTime = time.time()
+    matchesCount = len(matcher.matches(editor, regExp))
+    fullTime = time.time() - startTime
+
+    cursor = QTextCursor(editor.document())
+    startTime = time.time()
+    for index in range(editCount):
+        cursor.setPosition(rand.randint(0, len(text) - 1))
+        cursor.insertText('needle' if index % 2 else 'x')
+        matcher.matches(editor, regExp)
+    editTime = (time.time() - startTime) / editCount
+
+    startTime = time.time()
+    for index in range(10):
+        [match.span() for match in regExp.finditer(editor.text)]
+    rescanTime = (time.time() - startTime) / 10
+
+    return {'bytes': len(text),
+            'matches': matchesCount,
+            'seconds': fullTime,
+            'editSeconds': editTime,
+            'fullRescanSeconds': rescanTime}
+
+
+def _loadModule(relativePath):
+    """Load a Qt independent module by the file path.
+    Importing it from the package would run the package __init__, which imports PyQt4
+    """
+    import imp
+    path = os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', relativePath)
+    return imp.load_source(os.path.splitext(os.path.basename(path))[0], path)
+
+
+def _literal(lineCount=200000, repeatCount=5):
+    """Find all occurrences of LITERAL in a big text with re and with literalsearch, case sensitive and not.
+    Returns dictionary of measurements
+    """
+    import re
+    literalsearch = _loadModule(os.path.join('enki', 'plugins', 'searchreplace', 'literalsearch.py'))
+
+    def measure(regExp):
+        startTime = time.time()
+        for index in range(repeatCount):
+            spans = [match.span() for match in regExp.finditer(text)]
+        return spans, (time.time() - startTime) / repeatCount
+
+    rand = random.Random('literal')
+    text = unicode(''.join(_makeLines(rand, lineCount)))
+
+    res = {'bytes': len(text)}
+    for suffix, flags in (('', 0), ('IgnoreCase', re.IGNORECASE)):
+        regExp = re.compile(re.escape(LITERAL), flags)
+        reSpans, res['reSeconds' + suffix] = measure(regExp)
+        spans, res['seconds' + suffix] = measure(literalsearch.optimized(regExp))
+        assert spans == reSpans
+        res['matches'] = len(spans)
+
+    return res
+
+
+def _walk(root):
+    """Build list of files with the walker of the file list cache, with and without VCS ignore rules.
+    Returns dictionary of measurements
+    """
+    import re
+    from enki.core import filewalker
+
+    filterRegExp = re.compile(r'.*\.pyc$')
+    res = {}
+    for suffix, vcsIgnore in (('', True), ('NoVcsIgnore', False)):
+        watchedPaths = {}
+        startTime = time.time()
+        files = list(filewalker.iterFiles(root, None, filterRegExp, watchedPaths, None, vcsIgnore))
+        res['seconds' + suffix] = time.time() - startTime
+        res['files' + suffix] = len(files)
+        res['watchedPaths' + suffix] = len(watchedPaths)
+    return res
+
+
+def _peakRss():
+    """Get tuple (peak RSS of this process, peak RSS of the biggest worker process) in megabytes
+    """
+    self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return self / 1024., children / 1024.  # ru_maxrss is in kilobytes on Linux
+
+
+def runBenchmark(treeName, operation, workers, useIndex, scale):
+    """Run one benchmark in this process. Returns dictionary of measurements
+    """
+    tmpDir = tempfile.mkdtemp(prefix='enki-benchmark-')
+    try:
+        if operation == 'literal':  # doesn't depend on Qt, PyQt4 is not required
+            res = _literal(int(200000 * scale) or 1000)
+        elif operation == 'highlight':
+            app = _initHeadlessCore(os.path.join(tmpDir, 'config'), workers, useIndex)
+            res = _highlight(int(200000 * scale) or 1000)
+        elif operation == 'walk':  # only the walker is used, core and PyQt4 are not required
+            res = _walk(generateTree(treeName, os.path.join(tmpDir, treeName), scale))
+        else:
+            app = _initHeadlessCore(os.path.join(tmpDir, 'config'), workers, useIndex)
+            root = generateTree(treeName, os.path.join(tmpDir, treeName), scale)
+            filesCount, size = _treeSize(root)
+
+            fileResults, elapsed, firstResult = _search(app, root)
+            if operation == 'research':
+                fileResults, elapsed, firstResult = _search(app, root)
+
+            res = {'files': filesCount,
+                   'bytes': size,
+                   'matches': sum([len(fileRes) for fileRes in fileResults]),
+                   'seconds': elapsed,
+                   'firstResultSeconds': firstResult}
+
+            if operation == 'replace':
+                replacedFiles, writtenBytes, elapsed = _replace(app, fileResults)
+                res.update({'files': replacedFiles,
+                            'bytes': writtenBytes,
+                            'seconds': elapsed,
+                            'firstResultSeconds': None})
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+    res['peakRssMb'], res['peakWorkerRssMb'] = _peakRss()
+    return res
+
+
+def _format(treeName, operation, res):
+    """Format result as a table row
+    """
+    seconds = max(res['seconds'], 1e-6)
+    if operation == 'highlight':
+        return '%-8s %-10s %8.3fs  full rescan %.4fs/edit  incremental %.4fs/edit  %d matches  RSS %.0f MB' % \
+            ('-', operation, res['seconds'], res['fullRescanSeconds'], res['editSeconds'], res['matches'],
+             res['peakRssMb'])
+    elif operation == 'literal':
+        return '%-8s %-10s %8.3fs  re %.3fs (x%.1f)  ignore case %.3fs, re %.3fs (x%.1f)  %d matches' % \
+            ('-', operation, res['seconds'], res['reSeconds'], res['reSeconds'] / seconds,
+             res['secondsIgnoreCase'], res['reSecondsIgnoreCase'],
+             res['reSecondsIgnoreCase'] / max(res['secondsIgnoreCase'], 1e-6),
+             res['matches'])
+    elif operation == 'walk':
+        return '%-8s %-10s %8.3fs  %d files, %d watched paths  without VCS ignore %.3fs, %d files, %d watched paths' % \
+            (treeName, operation, res['seconds'], res['files'], res['watchedPaths'],
+             res['secondsNoVcsIgnore'], res['filesNoVcsIgnore'], res['watchedPathsNoVcsIgnore'])
+
+    if res['firstResultSeconds'] is not None:
+        firstResult = '%.3fs' % res['firstResultSeconds']
+    else:
+        firstResult = '-'
+
+    return '%-8s %-10s %8.3fs %9.0f files/s %8.1f MB/s  first %7s  %d matches  RSS %.0f MB, workers %.0f MB' % \
+        (treeName, operation, res['seconds'], res['files'] / seconds, res['bytes'] / seconds / 1024 / 1024,
+         firstResult, res['matches'], res['peakRssMb'], res['peakWorkerRssMb'])
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--tree', action='append', choices=TREES, help='Tree to benchmark. All by default')
+    parser.add_option('--operation', action='append', choices=OPERATIONS,
+                      help='Operation to benchmark. All by default')
+    parser.add_option('--workers', type='int', default=0, help='Count of worker processes. 0 - count of CPUs')
+    parser.add_option('--index', action='store_true', default=False, help='Use trigram index')
+    parser.add_option('--scale', type='float', default=1., help='Scale size of the trees')
+    parser.add_option('--json', action='store_true', default=False, help='Print results as JSON')
+    parser.add_option('--child', action='store_true', default=False, help=SUPPRESS_HELP)
+    options, args = parser.parse_args()
+
+    trees = options.tree or TREES
+    operations = options.operation or OPERATIONS
+
+    if options.child:  # run one benchmark and print the result for the parent process
+        print json.dumps(runBenchmark(trees[0], operations[0], options.workers, options.index, options.scale))
+        return 0
+
+    results = []
+    for operation in operations:
+        for treeName in (trees if operation not in ('highlight', 'literal') else ('-',)):
+            command = [sys.executable, os.path.abspath(__file__), '--child',
+                       '--operation', operation,
+                       '--workers', str(options.workers),
+                       '--scale', str(options.scale)]
+            if treeName != '-':
+                command += ['--tree', treeName]
+            if options.index:
+                command.append('--index')
+
+            output = subprocess.check_output(command)
+            res = json.loads(output.splitlines()[-1])
+            results.append({'tree': treeName, 'operation': operation, 'result': res})
+            if not options.json:
+                print _format(treeName, operation, res)
+                sys.stdout.flush()
+
+    if options.json:
+        print json.dumps(results, indent=4)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base
+
+from PyQt4.QtGui import QApplication
+
+from enki.core import locator
+
+
+class _Locator:
+    def __init__(self):
+        self.applied = []
+
+    def _applyCompleter(self, command, completer, text=None):
+        self.applied.append(completer)
+
+
+class _Command:
+    """Command, which constructs completer until it is cancelled or released
+    """
+    def __init__(self, name):
+        self.name = name
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.cancelled = False
+
+    def completer(self, text, pos):
+        self.started.set()
+        while not self.release.is_set():
+            if locator.isCompletionCancelled():
+                self.cancelled = True
+                return 'partial'
+            time.sleep(0.001)
+        return self.name
+
+
+class CompleterConstructorThread(unittest.TestCase):
+    def setUp(self):
+        self._locator = _Locator()
+        self._thread = locator._CompleterConstructorThread(self._locator)
+        self._thread.start()
+
+    def tearDown(self):
+        self._thread.terminate()
+        self._thread.join(1)
+        self.assertFalse(self._thread.is_alive())
+
+    def _waitApplied(self):
+        for i in range(1000):
+            QApplication.instance().processEvents()
+            if self._locator.applied:
+                return
+            time.sleep(0.001)
+
+    def test_latest_wins(self):
+        slow = _Command('slow')
+        skipped = _Command('skipped')
+        fast = _Command('fast')
+        fast.release.set()
+
+        self._thread.constructCompleter(slow, 'a', 1)
+        self.assertTrue(slow.started.wait(1))
+        self._thread.constructCompleter(skipped, 'ab', 2)
+        self._thread.constructCompleter(fast, 'abc', 3)
+        self._waitApplied()
+
+        self.assertEqual(self._locator.applied, ['fast'])
+        self.assertTrue(slow.cancelled)
+        self.assertFalse(skipped.started.is_set())
+
+    def test_not_cancelled_outside_thread(self):
+        self.assertFalse(locator.isCompletionCancelled())
+        self.assertFalse(locator.isCompletionRefreshRequested())
+
+    def test_refresh(self):
+        class _RefreshCommand:
+            def completer(self, text, pos):
+                return locator.isCompletionRefreshRequested()
+
+        self._thread.constructCompleter(_RefreshCommand(), 'a', 1, refresh=True)
+        self._waitApplied()
+        self.assertEqual(self._locator.applied, [True])
+
+        self._locator.applied = []
+        self._thread.constructCompleter(_RefreshCommand(), 'a', 1)
+        self._waitApplied()
+        self.assertEqual(self._locator.applied, [False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import unittest
+import os.path
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), "..", ".."))
+
+from enki.core.vcsignore import VcsIgnore
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self._root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self._root, '.git'))
+
+    def tearDown(self):
+        shutil.rmtree(self._root)
+
+    def _write(self, relPath, text):
+        path = os.path.join(self._root, relPath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as file_:
+            file_.write(text)
+
+    def _ignored(self, relPath, isDir=False):
+        return VcsIgnore(self._root).isIgnored(os.path.join(self._root, relPath), isDir)
+
+    def test_gitignore(self):
+        self._write('.gitignore', '# comment\n*.pyc\nbuild/\n/node_modules\ndoc/*.html\n')
+        self.assertTrue(self._ignored('a.pyc'))
+        self.assertTrue(self._ignored('src/b.pyc'))
+        self.assertFalse(self._ignored('a.py'))
+        self.assertTrue(self._ignored('src/build', True))
+        self.assertFalse(self._ignored('src/build'))  # only directories
+        self.assertTrue(self._ignored('node_modules', True))
+        self.assertFalse(self._ignored('src/node_modules', True))  # anchored
+        self.assertTrue(self._ignored('doc/index.html'))
+        self.assertFalse(self._ignored('doc/api/index.html'))
+
+    def test_negation_and_nested(self):
+        self._write('.gitignore', '*.log\n**/tmp/**\n')
+        self._write('src/.gitignore', '!keep.log\n')
+        self.assertTrue(self._ignored('a.log'))
+        self.assertTrue(self._ignored('src/a.log'))
+        self.assertFalse(self._ignored('src/keep.log'))
+        self.assertTrue(self._ignored('src/tmp/x.txt'))
+
+    def test_root_in_subdirectory(self):
+        self._write('.gitignore', 'generated/\n')
+        os.makedirs(os.path.join(self._root, 'src', 'generated'))
+        ignore = VcsIgnore(os.path.join(self._root, 'src'))
+        self.assertTrue(ignore.isIgnored(os.path.join(self._root, 'src', 'generated'), True))
+        self.assertEqual(ignore.ignoreFiles(), [os.path.join(self._root, '.gitignore')])
+
+    def test_hgignore(self):
+        self._write('.hgignore', 'syntax: glob\n*.orig\nrootglob:out\nsyntax: regexp\n^venv/\n')
+        self.assertTrue(self._ignored('src/a.orig'))
+        self.assertTrue(self._ignored('out', True))
+        self.assertFalse(self._ignored('src/out', True))
+        self.assertTrue(self._ignored('venv', True))
+        self.assertTrue(self._ignored('venv/lib.py'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@ import unittest
 import os.path
 import sys
 import platform
+import re
+import time
 
 sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
 
@@ -14,6 +16,7 @@ from PyQt4.QtTest import QTest
 
 from enki.core.core import core
 import enki.plugins.searchreplace
+from enki.plugins.searchreplace import incrementalmatcher
 
 _TEXT = """middle_underscore
 abc ab4d a@cd8 a@
@@ -211,6 +214,53 @@ class InFile(base.TestCase):
         qpart.text = qpart.text + ' '
         self.assertEqual(highlightedWordsCount(), 0)
 
+    @base.inMainLoop
+    def test_highlight_visible_items(self):
+        qpart = core.workspace().currentDocument().qutepart
+        qpart.text = 'one two\n' * 5000
+
+        QTest.keyClick(core.mainWindow(), Qt.Key_F, Qt.ControlModifier)
+        self.keyClicks("two")
+        widget = _findSearchController()._widget
+        self.assertEqual(widget.lMatchesCount.text(), '5000 match(es)')
+
+        highlighted = [selection.cursor.selectionStart() for selection in qpart.extraSelections()[1:]]
+        self.assertTrue(0 < len(highlighted) < 5000)
+
+        qpart.verticalScrollBar().setValue(qpart.verticalScrollBar().maximum())
+        scrolledHighlighted = [selection.cursor.selectionStart() for selection in qpart.extraSelections()[1:]]
+        self.assertTrue(min(scrolledHighlighted) > max(highlighted))
+
+    @base.inMainLoop
+    def test_matcher_reset_on_hide(self):
+        qpart = core.workspace().currentDocument().qutepart
+        QTest.keyClick(core.mainWindow(), Qt.Key_F, Qt.ControlModifier)
+        self.keyClicks("string")
+        controller = _findSearchController()
+        self.assertIs(controller._matcher._qpart, qpart)
+
+        self.keyClick(Qt.Key_Escape)  # the document edits are not tracked anymore
+        self.assertIsNone(controller._matcher._qpart)
+
+    def test_incremental_matches(self):
+        qpart = core.workspace().currentDocument().qutepart
+        matcher = incrementalmatcher.IncrementalMatcher()
+
+        for pattern in (r'\bstring\b', r'(?m)^fac', r'a\sb', 'x*'):
+            regExp = re.compile(pattern)
+            matcher.matches(qpart, regExp)
+            with qpart:
+                qpart.lines[6] = 'string string'
+                qpart.lines.insert(2, 'a')
+                qpart.replaceText(5, 0, 'string\nfac b ')
+                del qpart.lines[0]
+            expected = [match.span() for match in regExp.finditer(qpart.text)]
+            self.assertEqual(list(matcher.matches(qpart, regExp)), expected)
+
+        self.assertTrue(incrementalmatcher.isLineLocal(re.compile(r'(?m)^a\w+$')))
+        self.assertFalse(incrementalmatcher.isLineLocal(re.compile(r'a\sb')))
+        self.assertFalse(incrementalmatcher.isLineLocal(re.compile(r'^a')))
+
 
 class ReplaceInDirectory(base.TestCase):
     @base.inMainLoop
@@ -247,6 +297,81 @@ class ReplaceInDirectory(base.TestCase):
             self.assertEqual(file_.read(), 'the text contains UUHHH bar\nand\nfew\nmore lines\n')
 
 
+class SearchInDirectory(base.TestCase):
+    def _createFiles(self, count):
+        for index in range(count):
+            with open(os.path.join(self.TEST_FILE_DIR, 'file%d.txt' % index), 'w') as file_:
+                if index % 2:
+                    file_.write('line\nthe foo is here\n')
+                else:
+                    file_.write('nothing interesting\n')
+
+    def _searchFoo(self):
+        self.keyClick(Qt.Key_F, Qt.ShiftModifier | Qt.ControlModifier)
+        self.keyClicks('foo')
+        self.keyClick(Qt.Key_Enter)
+        self._waitSearchFinished()
+
+    def _waitSearchFinished(self, timeoutMs=5000):
+        """Wait for the finished signal of the search thread, started by the last key click
+        """
+        thread = _findSearchController()._searchThread
+        finished = []
+        thread.finished.connect(lambda: finished.append(True))
+        end = time.time() + timeoutMs / 1000.
+        while not finished and time.time() < end:
+            if thread.isFinished():  # finished before the slot has been connected
+                self.app.processEvents()  # deliver the results and the finished signal
+                break
+            QTest.qWait(10)
+        self.assertFalse(thread.isRunning())
+
+    @base.inMainLoop
+    def test_worker_pool(self):
+        core.config()['SearchReplace']['WorkerCount'] = 2
+        self._createFiles(10)
+        self._searchFoo()
+
+        dock = _findSearchController()._dock
+        self.assertEqual(dock.matchesCount(), 5)
+
+    @base.inMainLoop
+    def test_single_worker(self):
+        core.config()['SearchReplace']['WorkerCount'] = 1
+        self._createFiles(10)
+        self._searchFoo()
+
+        dock = _findSearchController()._dock
+        self.assertEqual(dock.matchesCount(), 5)
+
+    @base.inMainLoop
+    def test_worker_pool_unsaved_document(self):
+        """Text of opened documents is searched, not the file on the disk"""
+        core.config()['SearchReplace']['WorkerCount'] = 2
+        self._createFiles(10)
+        document = self.createFile('opened.txt', 'nothing interesting\n')
+        document.qutepart.text = 'the foo is not saved\n'
+        self._searchFoo()
+
+        dock = _findSearchController()._dock
+        self.assertEqual(dock.matchesCount(), 6)
+
+    @base.inMainLoop
+    def test_index(self):
+        core.config()['SearchReplace']['UseIndex'] = True
+        self._createFiles(10)
+        self._searchFoo()
+        dock = _findSearchController()._dock
+        self.assertEqual(dock.matchesCount(), 5)
+
+        # index is updated, when file is modified
+        with open(os.path.join(self.TEST_FILE_DIR, 'file0.txt'), 'w') as file_:
+            file_.write('foo is here too, and the file size changed\n')
+        self.keyClick(Qt.Key_Enter)
+        self._waitSearchFinished()
+        self.assertEqual(dock.matchesCount(), 6)
+
+
 class Gui(base.TestCase):
     @base.inMainLoop
     def test_esc_on_widget_closes(self):
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+"""Tests for the literal search, which replaces regular expressions without special characters
+"""
+
+import unittest
+import os.path
+import sys
+import re
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base  # configures sys.path and sip
+
+from enki.plugins.searchreplace import literalsearch
+
+
+class LiteralSearch(unittest.TestCase):
+    def test_literal_text(self):
+        self.assertEqual(literalsearch.literalText(re.compile(re.escape(u'a.b'))), u'a.b')
+        self.assertEqual(literalsearch.literalText(re.compile(u'a.b')), None)
+        self.assertEqual(literalsearch.literalText(re.compile(r'\bab\b')), None)
+        self.assertEqual(literalsearch.literalText(re.compile(u'ab', re.IGNORECASE | re.UNICODE)), None)
+
+    def test_same_matches(self):
+        for text in (u'Abc abc ABC \xc9abc a\u212abc', 'Abc abc ABC'):
+            for pattern, flags in ((u'abc', 0), (u'abc', re.IGNORECASE), (u'\xe9abc', re.IGNORECASE)):
+                regExp = re.compile(pattern, flags)
+                optimized = literalsearch.optimized(regExp)
+                self.assertEqual([match.span() for match in optimized.finditer(text, 1)],
+                                 [match.span() for match in regExp.finditer(text, 1)])
+                self.assertEqual([match.group(0) for match in optimized.finditer(text)],
+                                 [match.group(0) for match in regExp.finditer(text)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""Tests for writing files, replaced by the Replace in directory workers
+"""
+
+import unittest
+import os.path
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import ctypes
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base  # configures sys.path and sip
+
+from enki.plugins.searchreplace import replaceworker
+
+
+class WriteFile(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'file.txt')
+        with open(self._path, 'wb') as file_:
+            file_.write('old')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _read(self, path):
+        with open(path, 'rb') as file_:
+            return file_.read()
+
+    def test_replaced(self):
+        os.chmod(self._path, 0o640)
+        oldStat = os.stat(self._path)
+        self.assertIsNone(replaceworker.writeFile(self._path, 'new'))
+        newStat = os.stat(self._path)
+
+        self.assertEqual(self._read(self._path), 'new')
+        self.assertEqual(stat.S_IMODE(newStat.st_mode), 0o640)
+        self.assertEqual((newStat.st_uid, newStat.st_gid), (oldStat.st_uid, oldStat.st_gid))
+        self.assertEqual(os.listdir(self._dir), ['file.txt'])  # the temporary file is renamed
+
+    @unittest.skipUnless(hasattr(os, 'link'), 'hard links are not supported')
+    def test_hard_link(self):
+        linkPath = os.path.join(self._dir, 'link.txt')
+        os.link(self._path, linkPath)
+        self.assertIsNone(replaceworker.writeFile(self._path, 'new'))
+        self.assertEqual(self._read(linkPath), 'new')  # written in place, the link is not broken
+        self.assertEqual(os.stat(self._path).st_nlink, 2)
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'symbolic links are not supported')
+    def test_symbolic_link(self):
+        linkPath = os.path.join(self._dir, 'link.txt')
+        os.symlink(self._path, linkPath)
+        self.assertIsNone(replaceworker.writeFile(linkPath, 'new'))
+        self.assertTrue(os.path.islink(linkPath))
+        self.assertEqual(self._read(self._path), 'new')
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'setxattr() is called with Linux arguments')
+    def test_extended_attributes(self):
+        inode = os.stat(self._path).st_ino
+        setXattr = ctypes.CDLL(None, use_errno=True).setxattr
+        if setXattr(self._path, 'user.enki', 'value', 5, 0) != 0:
+            self.skipTest('the file system does not support user extended attributes')
+        self.assertTrue(replaceworker._mayHaveExtendedAttributes(self._path))
+        self.assertIsNone(replaceworker.writeFile(self._path, 'new'))
+        self.assertEqual(os.stat(self._path).st_ino, inode)  # written in place, the attribute is kept
+        self.assertEqual(self._read(self._path), 'new')
+
+    def test_error(self):
+        self.assertIsNotNone(replaceworker.writeFile(os.path.join(self._dir, 'missing.txt'), 'new'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""Tests for the results of the Search in directory: the model items, the cache and the batches of the thread
+"""
+
+import unittest
+import os.path
+import sys
+import array
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base  # configures sys.path and sip
+
+from PyQt4.QtCore import Qt
+
+from enki.plugins.searchreplace import resultscache, searchresultsmodel, threads
+
+
+def _fileResults(count):
+    coordinates = [array.array('l', range(count)) for i in range(4)]
+    return searchresultsmodel.FileResults('/', '/file.txt', *(coordinates + [[None] * count, [u''] * count]))
+
+
+class FileResults(unittest.TestCase):
+    def test_check_state(self):
+        fileRes = _fileResults(3)
+        self.assertEqual(fileRes.checkState(), Qt.Checked)
+        fileRes.setResultCheckState(1, Qt.Unchecked)
+        fileRes.setResultCheckState(1, Qt.Unchecked)
+        self.assertEqual(fileRes.checkedCount, 2)
+        self.assertEqual(fileRes.checkState(), Qt.PartiallyChecked)
+        fileRes.setCheckState(Qt.Unchecked)
+        self.assertEqual(fileRes.checkState(), Qt.Unchecked)
+
+    def test_remove(self):
+        fileRes = _fileResults(3)
+        fileRes.setResultCheckState(0, Qt.Unchecked)
+        fileRes.removeResult(1)
+        self.assertEqual(len(fileRes), 2)
+        self.assertEqual(fileRes.result(1).start, 2)
+        self.assertEqual(fileRes.checkState(), Qt.PartiallyChecked)
+        fileRes.removeResult(0)
+        self.assertEqual(fileRes.checkState(), Qt.Checked)
+
+    def test_remove_ranges(self):
+        fileRes = _fileResults(10)
+        copy = fileRes.copy()
+        fileRes.setResultCheckState(3, Qt.Unchecked)
+        fileRes.removeResults(2, 4)
+        self.assertEqual(list(fileRes.starts), [0, 1, 5, 6, 7, 8, 9])
+        self.assertEqual(fileRes.checkedCount, 7)
+        self.assertEqual(len(copy), 10)  # shared columns are copied
+
+        fileRes.setResultCheckState(0, Qt.Unchecked)
+        fileRes.keepResults([0, 3, 6])
+        self.assertEqual(list(fileRes.starts), [0, 6, 9])
+        self.assertEqual(len(fileRes.lineTexts), 3)
+        self.assertEqual(fileRes.checkedCount, 2)
+
+    def test_neighbour_ranges(self):
+        self.assertEqual(searchresultsmodel._neighbourRanges([0, 1, 2, 5, 7, 8]),
+                         [(7, 8), (5, 5), (0, 2)])
+        self.assertEqual(searchresultsmodel._neighbourRanges([]), [])
+
+
+class ResultsCache(unittest.TestCase):
+    def test_lookup(self):
+        cache = resultscache.ResultsCache()
+        searchRes = cache.searchResults(('foo', 0, (), '/', '', False))
+        searchRes.store('/file.txt', (1, 1.0, 10), _fileResults(3))
+        searchRes.store('/empty.txt', (2, 1.0, 10), None)
+
+        found, fileRes = searchRes.lookup('/file.txt', (1, 1.0, 10))
+        self.assertTrue(found)
+        fileRes.removeResult(0)
+        self.assertEqual(len(searchRes.lookup('/file.txt', (1, 1.0, 10))[1]), 3)  # a copy has been modified
+        self.assertEqual(searchRes.lookup('/empty.txt', (2, 1.0, 10)), (True, None))
+        self.assertEqual(searchRes.lookup('/file.txt', (1, 2.0, 10)), (False, None))  # modified
+
+        self.assertIs(cache.searchResults(('foo', 0, (), '/', '', False)), searchRes)
+        for i in range(resultscache.ResultsCache.MAX_SEARCHES):
+            cache.searchResults(('bar%d' % i, 0, (), '/', '', False))
+        self.assertIsNot(cache.searchResults(('foo', 0, (), '/', '', False)), searchRes)
+
+    def test_limit(self):
+        cache = resultscache.ResultsCache()
+        cache.MAX_RESULTS = 10
+        first = cache.searchResults(('foo', 0, (), '/', '', False))
+        first.store('/a.txt', (1, 1.0, 10), _fileResults(6))
+        second = cache.searchResults(('bar', 0, (), '/', '', False))
+        second.store('/a.txt', (1, 1.0, 10), _fileResults(6))  # the least recently used search is dropped
+        self.assertIsNot(cache.searchResults(('foo', 0, (), '/', '', False)), first)
+
+        third = cache.searchResults(('baz', 0, (), '/', '', False))
+        third.store('/b.txt', (2, 1.0, 10), _fileResults(11))  # doesn't fit even alone
+        self.assertEqual(third.lookup('/b.txt', (2, 1.0, 10)), (False, None))
+        self.assertEqual(third.resultsCount, 0)
+
+
+class PendingResults(unittest.TestCase):
+    def test_batches(self):
+        pending = threads._PendingResults()
+        for count in (3, 1, 10, 2):
+            pending.append(_fileResults(count))
+        self.assertEqual(pending.size, 20)  # a row for every file and every match
+
+        self.assertEqual([len(fileRes) for fileRes in pending.takeBatch(7)], [3, 1])
+        self.assertEqual([len(fileRes) for fileRes in pending.takeBatch(7)], [10])  # at least one file is taken
+        self.assertEqual(pending.size, 3)
+        self.assertEqual([len(fileRes) for fileRes in pending.takeBatch(7)], [2])
+        self.assertFalse(pending)
+
+
+if __name__ == '__main__':
+    unittest.main()
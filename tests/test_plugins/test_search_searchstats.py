@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+"""Tests for the statistics of the Search in directory
+"""
+
+import unittest
+import os.path
+import sys
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base  # configures sys.path and sip
+
+from enki.plugins.searchreplace import searchstats
+
+
+class SearchStats(unittest.TestCase):
+    def test_progress(self):
+        stats = searchstats.SearchStats()
+        stats.fileFound(100)
+        stats.fileFound(300)
+        self.assertEqual(stats.progress(), None)  # enumeration is not finished
+        stats.setEnumerationFinished()
+        stats.fileDone(300, 5)
+        stats.addTime(searchstats.MATCH, 0.5)
+
+        snapshot = stats.snapshot()
+        stats.fileDone(100)
+        self.assertEqual(snapshot.progress(), 0.75)
+        self.assertEqual(snapshot.matchesCount, 5)
+        self.assertEqual(snapshot.stageTimes[searchstats.MATCH], 0.5)
+        self.assertEqual(stats.progress(), 1.)
+
+        stats.finish()
+        self.assertEqual(stats.eta(), None)
+        self.assertEqual(stats.asDict()['bytesDone'], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""Tests for reading and searching files by the Search in directory workers
+"""
+
+import unittest
+import os.path
+import sys
+import re
+import codecs
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base  # configures sys.path and sip
+
+from enki.plugins.searchreplace import searchworker
+
+
+class _FileTestCase(unittest.TestCase):
+    """Test case with a temporary directory for the files to read
+    """
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _writeFile(self, name, data):
+        path = os.path.join(self._dir, name)
+        with open(path, 'wb') as file_:
+            file_.write(data)
+        return path
+
+
+class Prefilter(_FileTestCase):
+    def _prefilterPattern(self, pattern, flags=0):
+        prefilter = searchworker.makePrefilter(re.compile(pattern, flags))
+        if prefilter is None:
+            return None
+        return prefilter.pattern
+
+    def test_longest_literal(self):
+        self.assertEqual(self._prefilterPattern(r'ab[cd]+efgh'), 'efgh')
+
+    def test_case_insensitive(self):
+        self.assertEqual(self._prefilterPattern('abc', re.IGNORECASE), 'abc')
+        self.assertEqual(self._prefilterPattern(u'caf\xe9', re.IGNORECASE), 'caf')
+        self.assertEqual(self._prefilterPattern(u'caf\xe9', re.IGNORECASE | re.UNICODE), None)
+
+    def test_big_file(self):
+        path = self._writeFile('big_file.txt', 'x' * searchworker.MMAP_MIN_SIZE + '\nfoo\n')
+
+        prefilter = searchworker.makePrefilter(re.compile('foo'))
+        self.assertTrue(searchworker.readFileContent(path, prefilter).endswith(u'foo\n'))
+        prefilter = searchworker.makePrefilter(re.compile('bar'))
+        self.assertEqual(searchworker.readFileContent(path, prefilter), '')
+
+
+class FileKinds(_FileTestCase):
+    def _readFile(self, data):
+        return searchworker.readFile(self._writeFile('kind.txt', data))
+
+    def test_binary(self):
+        self.assertEqual(self._readFile('abc\0def'), (u'', searchworker.BINARY))
+
+    def test_encodings(self):
+        text = u'caf\xe9 \u0444'
+        self.assertEqual(self._readFile(text.encode('utf8')), (text, 'utf8'))
+        self.assertNotEqual(self._readFile(u'caf\xe9'.encode('cp1252'))[1], 'utf8')
+        data = codecs.BOM_UTF16_LE + text.encode('utf-16-le')
+        self.assertEqual(self._readFile(data), (text, 'utf-16-le'))
+        self.assertEqual(searchworker.encodeText(text, 'utf-16-le'), data)
+
+
+class SearchText(unittest.TestCase):
+    def test_line_texts(self):
+        text = u'foo bar foo\nbaz\nfoo'
+        lines, columns, starts, ends, groups, lineTexts, skippedCount = \
+            searchworker.searchText(re.compile('foo'), text, 10)
+        self.assertEqual(list(lines), [0, 0, 2])
+        self.assertEqual(lineTexts, [u'foo bar foo', u'foo bar foo', u'foo'])
+        self.assertIs(lineTexts[0], lineTexts[1])  # matches in the same line share the text
+        self.assertEqual(searchworker.searchText(re.compile('r f'), text, 10)[5], [u'foo bar foo'])
+        self.assertEqual(searchworker.searchText(re.compile('z\nf'), text, 10)[5], [u'baz\nfoo'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+"""Tests for the substitutions of the matched groups in the replacement text
+"""
+
+import unittest
+import os.path
+import sys
+import re
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base  # configures sys.path and sip
+
+from enki.plugins.searchreplace import substitutions
+
+
+class Substitutions(unittest.TestCase):
+    def test_groups(self):
+        groups = substitutions.matchGroups(re.search('(a)(x)?(c)', 'abc ac'))
+        self.assertEqual(groups, ('ac', 'a', None, 'c'))
+        self.assertEqual(substitutions.makeSubstitutions(r'\3\2\1\t\5', groups), 'ca\t\\5')
+
+
+if __name__ == '__main__':
+    unittest.main()
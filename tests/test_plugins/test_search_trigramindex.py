@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+"""Tests for the trigrams, which are required by a search pattern
+"""
+
+import unittest
+import os.path
+import sys
+import re
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
+
+import base  # configures sys.path and sip
+
+from enki.plugins.searchreplace import trigramindex
+
+
+class RequiredTrigrams(unittest.TestCase):
+    def _trigrams(self, pattern, flags=0):
+        return trigramindex.requiredTrigrams(re.compile(pattern, flags))
+
+    def test_literal(self):
+        self.assertEqual(self._trigrams('Hello'), ['ell', 'hel', 'llo'])
+
+    def test_regexp(self):
+        self.assertEqual(self._trigrams(r'\bfo(o)ba[rz]+'), ['foo', 'oba', 'oob'])
+        self.assertEqual(self._trigrams(r'(abc)+d'), ['abc'])
+
+    def test_not_usable(self):
+        self.assertEqual(self._trigrams('abc|def'), [])
+        self.assertEqual(self._trigrams('a.*b'), [])
+
+
+class PackTrigrams(unittest.TestCase):
+    def test_chunk_boundaries(self):
+        data = 'abcdefghij' * (trigramindex._SCAN_CHUNK_SIZE // 10 + 1)
+        expected = sorted(set([data[i:i + 3] for i in range(len(data) - 2)]))
+        self.assertEqual(trigramindex._packTrigrams(data), ''.join(expected))
+        self.assertEqual(trigramindex._packTrigrams('ab'), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
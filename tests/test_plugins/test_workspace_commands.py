@@ -8,6 +8,9 @@ import os.path
 import os
 import sys
 import stat
+import shutil
+import tempfile
+import glob
 
 sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(__file__)), ".."))
 
@@ -17,6 +20,7 @@ from PyQt4.QtCore import Qt
 from PyQt4.QtTest import QTest
 
 from enki.core.core import core
+from enki.lib import fuzzyfinder, pathcompleter
 
 
 class Test(base.TestCase):
@@ -120,6 +124,131 @@ class Test(base.TestCase):
 
         self.assertEqual(data, text)
 
+    @base.inMainLoop
+    def test_6(self):
+        """Find file, type only some letters of the name"""
+        os.makedirs(os.path.join(self.TEST_FILE_DIR, 'dir1', 'dir2'))
+        fullPath = os.path.join(self.TEST_FILE_DIR, 'dir1', 'dir2', 'the_long_file.txt')
+        with open(fullPath, 'w') as file_:
+            file_.write('thedata')
+        core.fileListCache().clear()
+
+        def openDialogFunc():
+            self.keyClicks('L', Qt.ControlModifier)
+
+        def inDialogFunc(dialog):
+            self.keyClicks('p thlofi')
+            for attempt in range(100):  # the completer is constructed by the Locator thread
+                if dialog._completedCommand is not None and \
+                   dialog._completedCommand[0] == 'p thlofi':
+                    break
+                self.sleepProcessEvents(0.05)
+            self.keyClick(Qt.Key_Enter)
+
+        self.openDialog(openDialogFunc, inDialogFunc)
+
+        self.assertEqual(core.workspace().currentDocument().filePath(), fullPath)
+
+
+class FuzzyFinder(unittest.TestCase):
+    def test_score(self):
+        self.assertEqual(fuzzyfinder.score('wc', 'workspace_commands.py')[1], [0, 10])
+        self.assertEqual(fuzzyfinder.score('mw', 'core/MainWindow.py')[1], [5, 9])
+        self.assertEqual(fuzzyfinder.score('xyz', 'core/MainWindow.py'), None)
+        self.assertTrue(fuzzyfinder.score('mw', 'core/mainwindow.py')[0] >
+                        fuzzyfinder.score('mw', 'mainwindow/core.py')[0])  # the file name is preferred
+
+    def test_find(self):
+        index = fuzzyfinder.FuzzyIndex(['enki/plugins/workspace_commands.py',
+                                        'enki/core/workspace.py',
+                                        'doc/core/workspace.rst',
+                                        'tests/test_plugins/test_workspace_commands.py'])
+        found = [path for path, positions in index.find('ws cm', 10)]
+        self.assertEqual(found, ['enki/plugins/workspace_commands.py',
+                                 'tests/test_plugins/test_workspace_commands.py'])
+        self.assertEqual(index.find('wspy', 1)[0][0], 'enki/core/workspace.py')
+        self.assertEqual(index.find('wsr', 1)[0][0], 'doc/core/workspace.rst')
+        self.assertEqual(index.find('zz', 10), [])
+
+    def test_resume_filtering(self):
+        paths = ['dir%d/file%d.txt' % (i % 7, i) for i in range(100)]
+        index = fuzzyfinder.FuzzyIndex(paths)
+        index.MAX_CANDIDATES = index.MAX_RANKED = 5
+        self.assertEqual(len(index.find('f', 100)), 5)
+        found = [path for path, positions in index.find('f9', 100)]  # filtering of 'f' is resumed
+        self.assertEqual(sorted(found), ['dir0/file49.txt', 'dir1/file29.txt', 'dir2/file9.txt',
+                                         'dir4/file39.txt', 'dir5/file19.txt'])
+
+
+class DirectoryListings(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self._dir, 'bdir'))
+        open(os.path.join(self._dir, 'afile'), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_cache(self):
+        listings = pathcompleter._DirectoryListings()
+        listing = listings.listing(self._dir)
+        self.assertEqual(listing.names, ['afile', 'bdir'])
+        self.assertFalse(listing.isDir('afile'))
+        self.assertTrue(listing.isDir('bdir'))
+        self.assertTrue(listings.listing(self._dir) is listing)
+
+        listing.mtime -= 10  # directory has been modified
+        self.assertFalse(listings.listing(self._dir) is listing)
+
+        self.assertRaises(OSError, listings.listing, os.path.join(self._dir, 'afile'))
+
+
+class LazyGlob(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        for dirName in ('a', 'b', 'c'):
+            os.mkdir(os.path.join(self._dir, dirName))
+            for fileName in ('x1', 'x2', '.hidden'):
+                open(os.path.join(self._dir, dirName, fileName), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_iglob(self):
+        for pattern in ('*', '*/x*', '[ab]/*', 'a/', 'a/x1', '*/.h*', 'd/*'):
+            pattern = os.path.join(self._dir, pattern)
+            found = [item[0] for item in pathcompleter._iglob(pattern) if item is not None]
+            self.assertEqual(sorted(found), sorted(glob.glob(pattern)))
+
+    def test_expansion(self):
+        expansion = pathcompleter._GlobExpansion(os.path.join(self._dir, '*', 'x*'))
+        expansion.expand(4, 10, 100)
+        self.assertEqual(len(expansion.paths), 4)
+        self.assertFalse(expansion.finished)
+        expansion.expand(4, 10, 100)
+        self.assertEqual(len(expansion.paths), 6)
+        self.assertTrue(expansion.finished)
+
+        expansion = pathcompleter._GlobExpansion(os.path.join(self._dir, '*', 'x*'))
+        expansion.expand(100, 10, 2)  # directory budget is over
+        self.assertFalse(expansion.finished)
+        expansion.expand(100, 10, 100)
+        self.assertEqual(len(expansion.paths), 6)
+
+        expansion = pathcompleter._GlobExpansion(os.path.join(self._dir, '*'))
+        expansion.expand(100, 10, 100)
+        self.assertEqual(expansion.paths, [(os.path.join(self._dir, name), True) for name in ('a', 'b', 'c')])
+
+    def test_reuse(self):
+        expansions = pathcompleter._GlobExpansions()
+        pattern = os.path.join(self._dir, '*', 'x*')
+        expansion = expansions.expansion(pattern)
+        expansion.expand(4, 10, 100)
+        self.assertIs(expansions.expansion(pattern), expansion)  # not finished, continued with Tab
+        expansion.expand(4, 10, 100)
+        self.assertTrue(expansion.finished)
+        self.assertIsNot(expansions.expansion(pattern), expansion)  # directories might have been changed
+
 
 if __name__ == '__main__':
     unittest.main()